@@ -25,33 +25,37 @@ from .shared_libraries.callbacks import (
     before_agent,
     before_tool,
     after_tool,
+    on_tool_error,
 )
 from .tools.tools import (
     # send_call_companion_link, # Commented out in tools.py
     # approve_discount, # Commented out in tools.py
     # sync_ask_for_approval, # Commented out in tools.py
     # update_salesforce_crm, # Commented out in tools.py
-    access_cart_information,
-    modify_cart,
-    get_product_recommendations,
-    check_product_availability,
     schedule_planting_service,
     get_available_planting_times,
     send_care_instructions,
     generate_qr_code,
-    search_products, # Added import for the new tool
     set_website_theme, # Added import for the new theme tool
     initiate_checkout_ui, # Added for checkout UI
     initiate_shipping_ui, # Added for shipping UI
     initiate_payment_ui, # Added for payment UI
     agent_processes_shipping_choice, # Added for processing shipping choices
-    submit_order_and_clear_cart, # Added for final order submission
     # display_checkout_item_selection_ui, # REMOVED
     # display_shipping_options_ui, # REMOVED
     # display_pickup_locations_ui, # REMOVED
     # display_payment_methods_ui, # REMOVED
     # display_order_confirmation_ui, # REMOVED
 )
+# Backend-calling tools are async (httpx) so they don't block the live streaming loop
+from .tools.async_tools import (
+    access_cart_information,
+    modify_cart,
+    get_product_recommendations,
+    check_product_availability,
+    search_products,
+    submit_order_and_clear_cart,
+)
 
 warnings.filterwarnings("ignore", category=UserWarning, module=".*pydantic.*")
 
@@ -160,6 +164,7 @@ root_agent = Agent(
     ],
     before_tool_callback=before_tool,
     after_tool_callback=after_tool,
+    on_tool_error_callback=on_tool_error,
     before_agent_callback=before_agent,
     before_model_callback=rate_limit_callback,
 )
@@ -60,3 +60,34 @@ class Config(BaseSettings):
     GEMINI_API_KEY: str | None = Field(default=None)
 
     BACKEND_API_BASE_URL: str = Field(default="http://127.0.0.1:5000/api")
+    # "http", or "inprocess" to call the backend's services directly when co-located
+    # with its database (also selected by an inprocess:// BACKEND_API_BASE_URL)
+    BACKEND_TRANSPORT: str = Field(default="http")
+    BACKEND_DATABASE_PATH: str | None = Field(default=None, description="SQLite database for in-process mode (default: <repo>/ecommerce.db)")
+
+    # Shared HTTP session used by the tools to call the backend (see tools/backend_client.py)
+    BACKEND_HTTP_POOL_CONNECTIONS: int = Field(default=4)
+    BACKEND_HTTP_POOL_MAXSIZE: int = Field(default=16)
+    BACKEND_HTTP_MAX_RETRIES: int = Field(default=3, description="Retries for idempotent GETs only")
+    BACKEND_HTTP_BACKOFF_FACTOR: float = Field(default=0.2)
+    BACKEND_HTTP_COALESCE_GETS: bool = Field(default=True, description="Share one request among identical concurrent catalog GETs")
+
+    # Per-endpoint circuit breakers and hedging for backend calls (see tools/circuit_breaker.py)
+    BACKEND_BREAKER_ENABLED: bool = Field(default=True)
+    BACKEND_BREAKER_WINDOW_SECS: float = Field(default=30.0, description="Rolling window of call outcomes")
+    BACKEND_BREAKER_MIN_CALLS: int = Field(default=5, description="Calls in the window before the breaker may open")
+    BACKEND_BREAKER_FAILURE_RATE: float = Field(default=0.5)
+    BACKEND_BREAKER_SLOW_CALL_SECS: float = Field(default=2.0)
+    BACKEND_BREAKER_SLOW_CALL_RATE: float = Field(default=0.8)
+    BACKEND_BREAKER_OPEN_SECS: float = Field(default=10.0, description="Fail-fast period before a probe call is let through")
+    BACKEND_HEDGE_ENABLED: bool = Field(default=False, description="Start a second attempt for slow idempotent reads")
+    BACKEND_HEDGE_DELAY_SECS: float | None = Field(default=None, description="Hedge delay (default: the endpoint's p95 latency)")
+
+    # Per-session cache of read-only tool results (see shared_libraries/tool_cache.py)
+    TOOL_CACHE_ENABLED: bool = Field(default=True)
+
+    # LLM request quotas per minute (see shared_libraries/rate_limiter.py)
+    LLM_RPM_QUOTA_PER_USER: int | None = Field(default=10, description="Per-user quota; 0 disables it")
+    LLM_RPM_QUOTA_GLOBAL: int | None = Field(default=None, description="Quota shared by the whole process")
+    LLM_RPM_QUOTA_PER_MODEL: dict[str, int] = Field(default={}, description='e.g. {"gemini-2.0-flash": 60}')
+
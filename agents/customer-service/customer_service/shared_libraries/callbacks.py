@@ -15,7 +15,6 @@
 """Callback functions for FOMC Research Agent."""
 
 import logging
-import time
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmRequest
@@ -25,20 +24,31 @@ from google.adk.agents.invocation_context import InvocationContext
 from google.adk.sessions.state import State # Added State
 from google.adk.tools.tool_context import ToolContext # Added ToolContext
 from jsonschema import ValidationError # Added ValidationError
+from customer_service.config import Config
 from customer_service.entities.customer import Customer
+from customer_service.shared_libraries.rate_limiter import llm_rate_limiter
+from customer_service.shared_libraries.tool_cache import tool_result_cache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-RATE_LIMIT_SECS = 60
-RPM_QUOTA = 10
+TOOL_CACHE_ENABLED = Config().TOOL_CACHE_ENABLED
 
 
-def rate_limit_callback(
+def _session_id(tool_context: CallbackContext) -> str:
+    """The ADK session id for a tool call, used to scope the tool result cache."""
+    session = getattr(tool_context, "session", None) or tool_context._invocation_context.session
+    return session.id
+
+
+async def rate_limit_callback(
     callback_context: CallbackContext, llm_request: LlmRequest
 ) -> None:
     """Callback function that implements a query rate limit.
 
+    Waits (without blocking the event loop) until the process-wide rate limiter
+    lets this user's request to the model through.
+
     Args:
       callback_context: A CallbackContext obj representing the active callback
         context.
@@ -84,37 +94,9 @@ def rate_limit_callback(
     
     
 
-    now = time.time()
-    if "timer_start" not in callback_context.state:
-
-        callback_context.state["timer_start"] = now
-        callback_context.state["request_count"] = 1
-        logger.debug(
-            "rate_limit_callback [timestamp: %i, "
-            "req_count: 1, elapsed_secs: 0]",
-            now,
-        )
-        return
-
-    request_count = callback_context.state["request_count"] + 1
-    elapsed_secs = now - callback_context.state["timer_start"]
-    logger.debug(
-        "rate_limit_callback [timestamp: %i, request_count: %i,"
-        " elapsed_secs: %i]",
-        now,
-        request_count,
-        elapsed_secs,
-    )
-
-    if request_count > RPM_QUOTA:
-        delay = RATE_LIMIT_SECS - elapsed_secs + 1
-        if delay > 0:
-            logger.debug("Sleeping for %i seconds", delay)
-            time.sleep(delay)
-        callback_context.state["timer_start"] = now
-        callback_context.state["request_count"] = 1
-    else:
-        callback_context.state["request_count"] = request_count
+    wait_secs = await llm_rate_limiter.acquire(callback_context.user_id, llm_request.model)
+    if wait_secs > 0:
+        logger.info(f"rate_limit_callback: request from user {callback_context.user_id} to {llm_request.model} waited {wait_secs:.2f}s in the rate limit queue")
 
     # Check for a pending UI command and set it in the current turn's state_delta
     if 'current_ui_command_for_frontend' in callback_context.state:
@@ -249,6 +231,12 @@ def before_tool(
             logger.info("Both items_added and items_removed are true for modify_cart.")
             return {"result": "I have added and removed the requested items."}
     
+    # Identical read-only calls within the session are answered from the cache
+    if TOOL_CACHE_ENABLED:
+        cached_response = tool_result_cache.lookup(_session_id(tool_context), tool_context.function_call_id, tool.name, args)
+        if cached_response is not None:
+            return cached_response
+
     logger.debug(f"before_tool for {tool.name} completed, no specific override action taken.")
     return None
 
@@ -261,6 +249,10 @@ def after_tool(
     if len(response_summary) > 300: response_summary = response_summary[:300] + "..."
     logger.info(f"[DIAG_LOG TOOL_OUTPUT] after_tool: Tool: {tool.name}, Response: {response_summary}")
 
+    # Cache read-only results; mutating tools invalidate the session's cached results
+    if TOOL_CACHE_ENABLED:
+        tool_result_cache.record(_session_id(tool_context), tool_context.function_call_id, tool.name, args, tool_response)
+
     # After approvals, we perform operations deterministically in the callback
     # to apply the discount in the cart.
     if tool.name == "sync_ask_for_approval":
@@ -300,6 +292,15 @@ def after_tool(
     # If a non-UI tool also modifies state, that's fine, ADK handles state changes.
     return tool_response
 
+def on_tool_error(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, error: Exception
+) -> Optional[Dict]:
+    """A tool raised: after_tool is not called, so drop the call's tool cache bookkeeping here."""
+    logger.error(f"on_tool_error: Tool: {tool.name} raised {type(error).__name__}: {error}")
+    if TOOL_CACHE_ENABLED:
+        tool_result_cache.forget(_session_id(tool_context), tool_context.function_call_id)
+    return None  # Let ADK handle the error as before
+
 # checking that the customer profile is loaded as state.
 def before_agent(callback_context: InvocationContext):
     logger.debug("before_agent: Callback triggered.")
@@ -0,0 +1,201 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process-wide token-bucket rate limiting of LLM requests.
+
+`rate_limit_callback` awaits `LlmRateLimiter.acquire()` before every model
+request. A request over quota waits with `asyncio.sleep`, so only that
+session's request is delayed and the event loop keeps serving every other
+WebSocket.
+
+Quotas are requests per `period_secs` (60 by default). Each one is a token
+bucket that holds a full period's quota and refills continuously:
+  * per user (optional): checked first. A user over their quota waits on
+    their own bucket without holding back anyone else's requests.
+  * global and per model: shared by all users. A request takes a token from
+    both at once and waits for the later of the two.
+
+A request that cannot be served now reserves its token anyway, so waiting
+requests are served in arrival order. If a waiting request is cancelled
+(e.g. the client disconnected), its tokens are given back.
+
+Queue wait times are reported by `stats()` and logged per request.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from customer_service.config import Config
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_SECS = 60
+RPM_QUOTA = 10  # Per user, as the per-session limit this replaces
+
+MAX_USERS = 1000
+
+
+class TokenBucket:
+    """`capacity` tokens refilled at `rate_per_sec`; reservations may run into debt."""
+
+    def __init__(self, rate_per_sec: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def reserve(self) -> float:
+        """Takes one token and returns the seconds until it is actually available (0 if now)."""
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_sec
+
+    def refund(self) -> None:
+        """Gives back a reserved token that was not used."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_sec)
+        self._updated_at = now
+
+
+class LlmRateLimiter:
+    """Global, per-model and per-user token buckets for LLM requests (see module docstring)."""
+
+    def __init__(
+        self,
+        global_quota: Optional[int] = None,
+        model_quotas: Optional[dict[str, int]] = None,
+        user_quota: Optional[int] = RPM_QUOTA,
+        period_secs: float = RATE_LIMIT_SECS,
+        max_users: int = MAX_USERS,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        """
+        Args:
+            global_quota: Requests per period for the whole process (None: unlimited).
+            model_quotas: Requests per period for each model name; unlisted models are unlimited.
+            user_quota: Requests per period for each user (None or 0: no per-user limit).
+            period_secs: The quota period.
+            max_users: Per-user buckets kept; the least recently used are dropped.
+            clock: Monotonic clock, replaceable in tests.
+            sleep: Coroutine function used to wait.
+        """
+        self.period_secs = period_secs
+        self.user_quota = user_quota or None
+        self.max_users = max_users
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._global = self._bucket(global_quota) if global_quota else None
+        self._models = {model: self._bucket(quota) for model, quota in (model_quotas or {}).items() if quota}
+        self._users: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._waiting = 0
+        self._counters = {"requests": 0, "delayed": 0, "cancelled": 0}
+        self._total_wait_secs = 0.0
+        self._max_wait_secs = 0.0
+
+    @classmethod
+    def from_config(cls, configs: Config) -> "LlmRateLimiter":
+        return cls(
+            global_quota=configs.LLM_RPM_QUOTA_GLOBAL,
+            model_quotas=configs.LLM_RPM_QUOTA_PER_MODEL,
+            user_quota=configs.LLM_RPM_QUOTA_PER_USER,
+        )
+
+    async def acquire(self, user_id: Optional[str], model: Optional[str]) -> float:
+        """Waits until the request may be sent; returns the seconds it waited."""
+        start = self._clock()
+        with self._lock:
+            self._counters["requests"] += 1
+        reserved: list[TokenBucket] = []
+        delayed = False
+        # Per-user bucket first, so a user over quota waits without holding shared tokens
+        for stage in ("user", "shared"):
+            with self._lock:
+                if stage == "user":
+                    buckets = [self._user_bucket(user_id)] if self.user_quota and user_id else []
+                else:
+                    buckets = [bucket for bucket in (self._global, self._models.get(model)) if bucket is not None]
+                wait_secs = max((bucket.reserve() for bucket in buckets), default=0.0)
+            reserved.extend(buckets)
+            if wait_secs > 0:
+                delayed = True
+                await self._wait(wait_secs, reserved)
+
+        waited = self._clock() - start
+        with self._lock:
+            self._counters["delayed"] += delayed
+            self._total_wait_secs += waited
+            self._max_wait_secs = max(self._max_wait_secs, waited)
+        return waited
+
+    def stats(self) -> dict[str, Any]:
+        """Request and queue-wait counters since the process started, and the shared buckets' tokens."""
+        with self._lock:
+            requests = self._counters["requests"]
+            buckets = {f"model:{model}": bucket for model, bucket in self._models.items()}
+            if self._global is not None:
+                buckets["global"] = self._global
+            return {
+                **self._counters,
+                "waiting": self._waiting,
+                "avg_wait_ms": round(self._total_wait_secs / requests * 1000, 1) if requests else 0.0,
+                "max_wait_ms": round(self._max_wait_secs * 1000, 1),
+                "tokens": {name: round(bucket.tokens, 2) for name, bucket in sorted(buckets.items())},
+            }
+
+    async def _wait(self, wait_secs: float, reserved: list[TokenBucket]) -> None:
+        with self._lock:
+            self._waiting += 1
+        try:
+            await self._sleep(wait_secs)
+        except asyncio.CancelledError:
+            with self._lock:
+                self._counters["cancelled"] += 1
+                for bucket in reserved:
+                    bucket.refund()
+            raise
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    # Called with the lock held
+    def _bucket(self, quota: int) -> TokenBucket:
+        return TokenBucket(quota / self.period_secs, quota, clock=self._clock)
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = self._bucket(self.user_quota)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+
+llm_rate_limiter = LlmRateLimiter.from_config(Config())
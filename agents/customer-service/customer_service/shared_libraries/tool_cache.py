@@ -0,0 +1,212 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-session cache of read-only tool results.
+
+Within one conversation the agent often calls the same read-only tool with the
+same arguments again, e.g. `check_product_availability` for a product it
+already discussed. The
+`before_tool` callback looks the call up here and returns the cached result
+instead of running the tool. `after_tool` stores fresh results.
+
+Entries expire after a per-tool TTL. Each session also has a generation
+counter. It is bumped when a mutating tool (`modify_cart`,
+`submit_order_and_clear_cart`) starts and again when it finishes, which drops
+every cached result for that session. A read that was already in flight while
+the generation moved is not stored.
+
+The cart (`access_cart_information`) is never cached: the customer also edits
+it through the storefront, which the agent does not see, and checkout must
+confirm what is really in the cart.
+
+Results are kept in process memory, not in session state, so they are not
+written to the session's events. Hit rates are logged per tool.
+"""
+
+import copy
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Read-only tools and how long (seconds) their results are reused
+CACHEABLE_TOOL_TTL_SECS = {
+    "get_product_recommendations": 300,
+    "search_products": 300,
+    "check_product_availability": 30,
+}
+# Tools whose calls invalidate the session's cached results
+MUTATING_TOOLS = frozenset({"modify_cart", "submit_order_and_clear_cart"})
+
+MAX_SESSIONS = 1000
+MAX_ENTRIES_PER_SESSION = 256
+
+
+def cache_key(tool_name: str, args: dict[str, Any]) -> str:
+    """A stable key for a tool call: tool name plus its arguments in canonical JSON."""
+    return f"{tool_name}:{json.dumps(args, sort_keys=True, separators=(',', ':'), default=str)}"
+
+
+def is_cacheable_response(response: Any) -> bool:
+    """Only successful results are cached; tools report failures with an 'error' key or status."""
+    return isinstance(response, dict) and "error" not in response and response.get("status") != "error"
+
+
+class _SessionCache:
+    def __init__(self):
+        self.generation = 0
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()  # key -> (expires_at, result)
+        # Calls between lookup() and record(); bounded in case a call never reaches record()
+        self.pending: OrderedDict[str, tuple[str, int]] = OrderedDict()  # function_call_id -> (key, generation at lookup)
+        self.served: OrderedDict[str, None] = OrderedDict()  # function_call_ids answered from the cache
+
+
+class ToolResultCache:
+    """Session-scoped memoization of read-only tool results (see module docstring)."""
+
+    def __init__(
+        self,
+        ttl_secs: Optional[dict[str, float]] = None,
+        mutating_tools=MUTATING_TOOLS,
+        max_sessions: int = MAX_SESSIONS,
+        max_entries_per_session: int = MAX_ENTRIES_PER_SESSION,
+        clock=time.monotonic,
+    ):
+        self.ttl_secs = dict(CACHEABLE_TOOL_TTL_SECS if ttl_secs is None else ttl_secs)
+        self.mutating_tools = frozenset(mutating_tools)
+        self.max_sessions = max_sessions
+        self.max_entries_per_session = max_entries_per_session
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, _SessionCache] = OrderedDict()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+
+    def _session(self, session_id: str) -> _SessionCache:
+        """The session's cache (created on first use); least recently used sessions are dropped."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _SessionCache()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def lookup(self, session_id: str, call_id: Optional[str], tool_name: str, args: dict[str, Any]) -> Optional[dict]:
+        """
+        Called before a tool runs. Returns a copy of the cached result, or None if
+        the tool should run. A mutating tool invalidates the session's results.
+        """
+        if tool_name in self.mutating_tools:
+            self.invalidate(session_id, reason=f"{tool_name} started")
+            return None
+        if tool_name not in self.ttl_secs:
+            return None
+
+        key = cache_key(tool_name, args)
+        with self._lock:
+            session = self._session(session_id)
+            cached = session.entries.get(key)
+            if cached is not None and cached[0] <= self._clock():
+                del session.entries[key]
+                cached = None
+            if cached is not None:
+                session.entries.move_to_end(key)
+                if call_id:
+                    self._track(session.served, call_id, None)
+                self._hits[tool_name] = self._hits.get(tool_name, 0) + 1
+            else:
+                if call_id:
+                    self._track(session.pending, call_id, (key, session.generation))
+                self._misses[tool_name] = self._misses.get(tool_name, 0) + 1
+            hits, misses = self._hits.get(tool_name, 0), self._misses.get(tool_name, 0)
+
+        logger.info(
+            f"tool_cache: {tool_name} {'hit' if cached is not None else 'miss'} "
+            f"(hit rate {hits}/{hits + misses} = {hits / (hits + misses):.0%})"
+        )
+        return copy.deepcopy(cached[1]) if cached is not None else None
+
+    def record(self, session_id: str, call_id: Optional[str], tool_name: str, args: dict[str, Any], response: Any) -> None:
+        """
+        Called after a tool ran (or was served from the cache). Stores fresh
+        read-only results, unless the session's generation moved since the lookup,
+        and invalidates the session after a mutating tool.
+        """
+        if tool_name in self.mutating_tools:
+            self.invalidate(session_id, reason=f"{tool_name} finished")
+            return
+        if tool_name not in self.ttl_secs:
+            return
+
+        with self._lock:
+            session = self._session(session_id)
+            if call_id in session.served:
+                del session.served[call_id]
+                return
+            key, generation = session.pending.pop(call_id, (cache_key(tool_name, args), session.generation))
+            if generation != session.generation or not is_cacheable_response(response):
+                return
+            self._store(session, key, tool_name, response)
+
+    def forget(self, session_id: str, call_id: Optional[str]) -> None:
+        """Drops the bookkeeping for a call that raised instead of returning (record() is not called then)."""
+        if not call_id:
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.pending.pop(call_id, None)
+                session.served.pop(call_id, None)
+
+    def _track(self, calls: OrderedDict, call_id: str, value: Any) -> None:
+        calls[call_id] = value
+        while len(calls) > self.max_entries_per_session:
+            calls.popitem(last=False)
+
+    def _store(self, session: _SessionCache, key: str, tool_name: str, response: dict) -> None:
+        session.entries[key] = (self._clock() + self.ttl_secs[tool_name], copy.deepcopy(response))
+        session.entries.move_to_end(key)
+        while len(session.entries) > self.max_entries_per_session:
+            session.entries.popitem(last=False)
+
+    def invalidate(self, session_id: str, reason: str = "") -> None:
+        """Drops the session's cached results and bumps its generation."""
+        with self._lock:
+            session = self._session(session_id)
+            dropped = len(session.entries)
+            session.entries.clear()
+            session.generation += 1
+        if dropped:
+            logger.info(f"tool_cache: dropped {dropped} cached results for session {session_id} ({reason}).")
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Per-tool {'hits', 'misses', 'hit_rate'} since the process started."""
+        with self._lock:
+            tools = sorted(self._hits.keys() | self._misses.keys())
+            return {
+                tool: {
+                    "hits": self._hits.get(tool, 0),
+                    "misses": self._misses.get(tool, 0),
+                    "hit_rate": round(self._hits.get(tool, 0) / (self._hits.get(tool, 0) + self._misses.get(tool, 0)), 3),
+                }
+                for tool in tools
+            }
+
+
+tool_result_cache = ToolResultCache()
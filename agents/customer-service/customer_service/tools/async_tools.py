@@ -0,0 +1,503 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Async versions of the tools that call the backend API.
+
+The live runner executes tools on the same event loop that streams audio for
+every WebSocket session. The synchronous tools in tools.py block that loop for
+the whole HTTP round trip, so they are replaced here by coroutines built on one
+shared `httpx.AsyncClient`. Each coroutine has the same name, arguments and
+return shapes as its sync counterpart, so the prompts and the frontend see no
+difference. Identical concurrent catalog GETs from different sessions share one
+request, unless a write completed in between (see singleflight.py and
+backend_client.py). Requests go through the same per-endpoint circuit
+breakers as the sync session, with optional hedging for GETs (see
+circuit_breaker.py).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+import httpx
+from google.adk.tools import ToolContext
+
+from customer_service.tools.backend_client import HEDGE_PERCENTILE, READ_METHODS, get_backend_breakers, is_coalesced_read
+from customer_service.tools.backend_transport import INPROCESS_SCHEME, InProcessAsyncTransport, endpoint_name
+from customer_service.tools.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, async_hedged_call
+from customer_service.tools.singleflight import AsyncSingleFlight
+from customer_service.tools.tools import (
+    BACKEND_API_BASE_URL,
+    _added_item_for_animation,
+    _format_recommendation_card,
+    _order_idempotency_key,
+    _products_batch_get_url,
+    _settle_order_attempt,
+)
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class BackendUnavailableError(httpx.ConnectError):
+    """The endpoint's circuit breaker is open; the request was not sent."""
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport with per-endpoint circuit breakers and, for GET/HEAD, optional hedging."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        breakers: CircuitBreakerRegistry,
+        hedge: bool = False,
+        hedge_delay_secs: Optional[float] = None,
+    ):
+        self.transport = transport
+        self.breakers = breakers
+        self.hedge = hedge
+        self.hedge_delay_secs = hedge_delay_secs
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = self.breakers.get(endpoint_name(request.method, str(request.url)))
+
+        async def attempt():
+            breaker.before_call()
+            start = time.perf_counter()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                breaker.record(time.perf_counter() - start, failed=True)
+                raise
+            except asyncio.CancelledError:  # e.g. the losing hedged attempt
+                breaker.release()
+                raise
+            breaker.record(time.perf_counter() - start, failed=response.status_code >= 500)
+            return response
+
+        try:
+            hedge_delay = self._hedge_delay(breaker) if request.method in ("GET", "HEAD") else None
+            if hedge_delay is None:
+                return await attempt()
+            return await async_hedged_call(
+                attempt, hedge_delay, discard=lambda response: response.aclose(), on_hedge=breaker.record_hedge,
+            )
+        except CircuitOpenError as e:
+            raise BackendUnavailableError(str(e), request=request) from e
+
+    def _hedge_delay(self, breaker) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_delay_secs is not None:
+            return self.hedge_delay_secs
+        return breaker.latency_percentile(HEDGE_PERCENTILE)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class CoalescingAsyncClient(httpx.AsyncClient):
+    """AsyncClient whose concurrent identical catalog GETs share one request and response."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.singleflight = AsyncSingleFlight()
+        self._writes = 0  # Completed writes; part of the coalescing key
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        if request.method not in READ_METHODS:
+            try:
+                return await super().send(request, **kwargs)
+            finally:
+                self._writes += 1
+        if not is_coalesced_read(request.method, str(request.url)) or kwargs.get("stream"):
+            return await super().send(request, **kwargs)
+        # Responses are fully read (not streamed), so waiters can share the object
+        send = super().send
+        return await self.singleflight.do((self._writes, str(request.url)), lambda: send(request, **kwargs))
+
+
+def create_async_backend_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Builds an AsyncClient with a keep-alive pool sized from Config.
+
+    Args:
+        transport: Optional transport (e.g. httpx.MockTransport in tests). By
+            default connection failures are retried BACKEND_HTTP_MAX_RETRIES times
+            and the shared circuit breakers apply.
+
+    Returns:
+        The configured client.
+    """
+    pool_maxsize, max_retries, coalesce_gets = 16, 3, True
+    breakers, hedge, hedge_delay_secs = None, False, None
+    try:
+        from customer_service.config import Config
+
+        configs = Config()
+        pool_maxsize, max_retries = configs.BACKEND_HTTP_POOL_MAXSIZE, configs.BACKEND_HTTP_MAX_RETRIES
+        coalesce_gets = configs.BACKEND_HTTP_COALESCE_GETS
+        if configs.BACKEND_BREAKER_ENABLED:
+            breakers = get_backend_breakers()
+        hedge, hedge_delay_secs = configs.BACKEND_HEDGE_ENABLED, configs.BACKEND_HEDGE_DELAY_SECS
+    except ImportError:
+        logger.error("Could not import Config from customer_service.config. Using default HTTP pool settings.")
+    limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+    if transport is None:
+        # Only connection errors are retried (the request never reached the server).
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=max_retries)
+        if breakers is not None:
+            transport = CircuitBreakerTransport(transport, breakers, hedge=hedge, hedge_delay_secs=hedge_delay_secs)
+    client_class = CoalescingAsyncClient if coalesce_gets else httpx.AsyncClient
+    return client_class(
+        transport=transport,
+        mounts={f"{INPROCESS_SCHEME}://": InProcessAsyncTransport()},  # In-process mode, see backend_transport.py
+        limits=limits,
+    )
+
+
+def get_async_backend_client() -> httpx.AsyncClient:
+    """Returns the shared AsyncClient for the running event loop, creating it on first use."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:  # An AsyncClient is tied to the loop it was used on
+        _client = create_async_backend_client()
+        _client_loop = loop
+    return _client
+
+
+async def close_async_backend_client() -> None:
+    """Closes the shared client (e.g. on server shutdown)."""
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+async def access_cart_information(customer_id: str) -> dict:
+    """
+    Args:
+        customer_id (str): The ID of the customer.
+
+    Returns:
+        dict: A dictionary representing the cart contents.
+
+    Example:
+        >>> access_cart_information(customer_id='123')
+        {'items': [{'product_id': 'soil-123', 'name': 'Standard Potting Soil', 'quantity': 1}, {'product_id': 'fert-456', 'name': 'General Purpose Fertilizer', 'quantity': 1}], 'subtotal': 25.98}
+    """
+    logger.info("Accessing cart information for customer ID: %s", customer_id)
+
+    api_url = f"{BACKEND_API_BASE_URL}/cart/{customer_id}"
+    try:
+        response = await get_async_backend_client().get(api_url, timeout=5)
+        response.raise_for_status()
+        cart_data = response.json()
+        logger.info("Successfully retrieved cart data for customer %s: %s", customer_id, cart_data)
+        return cart_data
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error occurred while accessing cart for {customer_id}: {http_err} - Response: {response.text}")
+        return {"items": [], "subtotal": 0.0, "error": f"Failed to retrieve cart: {response.status_code}"}
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception occurred while accessing cart for {customer_id}: {req_err}")
+        return {"items": [], "subtotal": 0.0, "error": "Failed to connect to cart service."}
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON response from cart API for {customer_id}: {json_err} - Response: {response.text}")
+        return {"items": [], "subtotal": 0.0, "error": "Invalid response from cart service."}
+
+
+async def modify_cart(
+    customer_id: str, items_to_add: list[dict], items_to_remove: list[dict]
+) -> dict:
+    """Modifies the user's shopping cart by adding and/or removing items.
+
+    Args:
+        customer_id (str): The ID of the customer.
+        items_to_add (list): A list of dictionaries, each with 'product_id' and 'quantity'.
+        items_to_remove (list): A list of product_ids to remove.
+
+    Returns:
+        dict: A dictionary indicating the status of the cart modification, with the updated
+        cart ('cart': {'items', 'subtotal', 'version'}) and the lines that changed.
+    Example:
+        >>> modify_cart(customer_id='123', items_to_add=[{'product_id': 'soil-456', 'quantity': 1}, {'product_id': 'fert-789', 'quantity': 1}], items_to_remove=[{'product_id': 'fert-112', 'quantity': 1}])
+        {'status': 'success', 'message': 'Cart updated successfully.', 'items_added': True, 'items_removed': True, 'cart': {...}, 'added_items': [...], 'removed_items': [...]}
+    """
+    logger.info("Modifying cart for customer ID: %s", customer_id)
+    logger.info("Adding items: %s", items_to_add)
+    logger.info("Removing items: %s", items_to_remove)
+
+    api_url = f"{BACKEND_API_BASE_URL}/cart/modify/{customer_id}"
+    payload = {
+        "items_to_add": items_to_add if items_to_add is not None else [],
+        "items_to_remove": items_to_remove if items_to_remove is not None else []
+    }
+
+    client = get_async_backend_client()
+    try:
+        response = await client.post(api_url, json=payload, timeout=5)
+        response.raise_for_status()
+        modification_status = response.json()
+        logger.info("Successfully modified cart for customer %s: %s", customer_id, modification_status)
+        # The response already carries the updated cart and the added lines' display details
+        added_item_details_for_payload = _added_item_for_animation(items_to_add, modification_status)
+        return_value = {"action": "refresh_cart", **modification_status}
+        if added_item_details_for_payload:
+            return_value["added_item"] = added_item_details_for_payload
+
+        logger.info(f"modify_cart returning: {return_value}")
+        return return_value
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error occurred while modifying cart for {customer_id}: {http_err} - Response: {response.text}")
+        return {"status": "error", "message": f"Failed to modify cart: {response.status_code}", "items_added": False, "items_removed": False}
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception occurred while modifying cart for {customer_id}: {req_err}")
+        return {"status": "error", "message": "Failed to connect to cart modification service.", "items_added": False, "items_removed": False}
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON response from cart modification API for {customer_id}: {json_err} - Response: {response.text}")
+        return {"status": "error", "message": "Invalid response from cart modification service.", "items_added": False, "items_removed": False}
+
+
+async def get_product_recommendations(product_ids: list[str], customer_id: str) -> dict:
+    """Retrieves and formats specific product details for a list of product IDs for recommendation cards.
+
+    Args:
+        product_ids: A list of product IDs.
+        customer_id: The ID of the customer (currently unused by this tool but kept for consistency).
+
+    Returns:
+        A dictionary containing a list of product dictionaries, each with
+        id, name, formatted_price, image_url, and product_url.
+        {'recommendations': [
+            {'id': 'SKU_123', 'name': 'Product Name', 'formatted_price': '$19.99', 'image_url': '...', 'product_url': '...'},
+            ...
+        ]}
+    """
+    logger.info(
+        "Getting and formatting product details for recommendation cards for IDs: %s for customer %s",
+        product_ids,
+        customer_id,
+    )
+
+    if not product_ids:
+        logger.info("No product IDs provided for recommendations.")
+        return {"recommendations": []}
+
+    formatted_products_details = []
+    errors = []
+
+    api_url = f"{BACKEND_API_BASE_URL}/products/batch"
+    response = None
+    try:
+        batch_get_url = _products_batch_get_url(api_url, product_ids)  # GET when possible, so identical calls are coalesced
+        if batch_get_url is not None:
+            response = await get_async_backend_client().get(batch_get_url, timeout=5)
+        else:
+            response = await get_async_backend_client().post(api_url, json={"ids": list(product_ids)}, timeout=5)
+        response.raise_for_status()
+        batch_data = response.json()
+
+        for product_data in batch_data.get("products", []):
+            formatted_products_details.append(_format_recommendation_card(product_data))
+        for batch_error in batch_data.get("errors", []):
+            errors.append({
+                "product_id": batch_error.get("product_id"),
+                "error": batch_error.get("error"),
+                "status_code": batch_error.get("status_code", "N/A"),
+            })
+        logger.info(f"Successfully retrieved and formatted details for product IDs {[p['id'] for p in formatted_products_details]}")
+
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error for product IDs {product_ids}: {http_err} - Response: {response.text}")
+        errors = [{"product_id": pid, "error": str(http_err), "status_code": response.status_code} for pid in product_ids]
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception for product IDs {product_ids}: {req_err}")
+        errors = [{"product_id": pid, "error": str(req_err)} for pid in product_ids]
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON for product IDs {product_ids}: {json_err} - Response: {response.text if response is not None else 'No response'}")
+        errors = [{"product_id": pid, "error": "Invalid JSON response from product details API."} for pid in product_ids]
+
+    if errors:
+        logger.warning(f"Encountered errors while fetching details for some products: {errors}")
+
+    logger.info("Returning formatted details for %d products.", len(formatted_products_details))
+    return {"recommendations": formatted_products_details, "errors_fetching_recommendations": errors if errors else None}
+
+
+async def check_product_availability(product_id: str, store_id: str) -> dict:
+    """Checks the availability of a product at a specified store (or for pickup).
+
+    Args:
+        product_id: The ID of the product to check.
+        store_id: The ID of the store (or 'pickup' for pickup availability).
+
+    Returns:
+        A dictionary indicating availability.  Example:
+        {'available': True, 'quantity': 10, 'store': 'Main Store'}
+
+    Example:
+        >>> check_product_availability(product_id='soil-456', store_id='pickup')
+        {'available': True, 'quantity': 10, 'store': 'pickup'}
+    """
+    logger.info(
+        "Checking availability of product ID: %s at store: %s",
+        product_id,
+        store_id,
+    )
+    api_url = f"{BACKEND_API_BASE_URL}/products/availability/{product_id}/{store_id}"
+    try:
+        response = await get_async_backend_client().get(api_url, timeout=5)
+        response.raise_for_status()
+        availability_data = response.json()
+        logger.info("Successfully retrieved availability for product %s at store %s: %s", product_id, store_id, availability_data)
+        return availability_data
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error occurred while checking availability for product {product_id} at store {store_id}: {http_err} - Response: {response.text}")
+        if response.status_code == 404:
+            try:
+                return response.json() # Return the API's 404 error structure
+            except json.JSONDecodeError:
+                return {"available": False, "quantity": 0, "store": store_id, "error": "Product not found and error response unparseable."}
+        return {"available": False, "quantity": 0, "store": store_id, "error": f"Failed to check availability: {response.status_code}"}
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception occurred while checking availability for product {product_id} at store {store_id}: {req_err}")
+        return {"available": False, "quantity": 0, "store": store_id, "error": "Failed to connect to availability service."}
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON response from availability API for {product_id} at store {store_id}: {json_err} - Response: {response.text}")
+        return {"available": False, "quantity": 0, "store": store_id, "error": "Invalid response from availability service."}
+
+
+async def search_products(query: str, customer_id: str) -> dict:
+    """Searches for products based on a query string using the retail search backend.
+
+    Args:
+        query: The search term (e.g., "rosemary", "red pots").
+        customer_id: The ID of the customer (used as visitor_id for the search API).
+
+    Returns:
+        A dictionary containing a list of search results (products). Example:
+        {'results': [
+            {'product_id': 'SKU_PLANT_ROSEMARY_001', 'name': 'Rosemary \'Arp\'', 'description': '...'},
+            {'product_id': 'SKU_SOIL_HERB_MIX_001', 'name': 'Rosemary Herb Mix Soil', 'description': '...'}
+        ]}
+
+    Example:
+        >>> search_products(query='rosemary', customer_id='123')
+        {'results': [{'product_id': 'SKU_PLANT_ROSEMARY_001', 'name': 'Rosemary \'Arp\'', 'description': 'Upright, aromatic herb...'}]}
+    """
+    logger.info(f"Searching products with query: '{query}' for customer_id (visitor_id): {customer_id}")
+    api_url = f"{BACKEND_API_BASE_URL}/retail/search-products"
+    payload = {"query": query, "visitor_id": customer_id}
+
+    try:
+        response = await get_async_backend_client().post(api_url, json=payload, timeout=10)
+        response.raise_for_status()
+        search_results = response.json()
+        # The backend endpoint returns {'recommendations': [...]}; the tool reports them as 'results'
+        if "recommendations" in search_results:
+            search_results["results"] = search_results.pop("recommendations")
+
+        logger.info(f"Successfully retrieved search results for query '{query}': {search_results}")
+        return search_results
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error occurred during product search for query '{query}': {http_err} - Response: {response.text}")
+        try:
+            error_details = response.json()
+        except json.JSONDecodeError:
+            error_details = {"error": f"Failed to search products: {response.status_code}"}
+        return {"results": [], **error_details}
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception occurred during product search for query '{query}': {req_err}")
+        return {"results": [], "error": "Failed to connect to product search service."}
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON response from product search API for query '{query}': {json_err} - Response: {response.text}")
+        return {"results": [], "error": "Invalid response from product search service."}
+
+
+async def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shipping_details: dict, total_amount: float, tool_context: Optional[ToolContext] = None) -> dict:
+    """
+    Submits the order to the backend, which includes clearing the cart.
+
+    Args:
+        customer_id (str): The ID of the customer.
+        cart_items (list[dict]): List of items in the cart (e.g., from access_cart_information).
+        shipping_details (dict): Shipping information collected.
+        total_amount (float): The final total amount for the order.
+        tool_context (ToolContext, optional): Provided by ADK; holds the checkout attempt's idempotency key.
+
+    Returns:
+        dict: A dictionary with the status of the order submission.
+              Example: {'status': 'success', 'message': 'Order submitted...', 'order_id': 'SIM_123', 'action': 'refresh_cart_and_show_confirmation'}
+    """
+    logger.info(f"Submitting order for customer ID: {customer_id}")
+    api_url = f"{BACKEND_API_BASE_URL}/checkout/place_order"
+
+    payload = {
+        "customer_id": customer_id,
+        "items": cart_items,
+        "shipping_details": shipping_details,
+        "total_amount": total_amount
+    }
+
+    logger.info(f"Order submission payload: {json.dumps(payload, indent=2)}")
+    idempotency_key = _order_idempotency_key(payload, tool_context)
+
+    response = None
+    try:
+        response = await get_async_backend_client().post(
+            api_url, json=payload, headers={"Idempotency-Key": idempotency_key}, timeout=10
+        )
+        response.raise_for_status()
+        order_status = response.json()
+
+        _settle_order_attempt(tool_context)
+        if order_status.get("status") == "success":
+            logger.info(f"Order successfully submitted for customer {customer_id}: {order_status}")
+            return {
+                "status": "success",
+                "message": order_status.get("message", "Order submitted and cart cleared."),
+                "order_id": order_status.get("order_id"),
+                "action": "refresh_cart_and_show_confirmation" # Action for UI
+            }
+        else:
+            logger.error(f"Order submission reported failure by API for customer {customer_id}: {order_status}")
+            return {
+                "status": "error",
+                "message": order_status.get("message", "Order submission failed at API level."),
+                "details": order_status
+            }
+
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP error occurred while submitting order for {customer_id}: {http_err} - Response: {response.text}")
+        if response.status_code < 500: # The backend rejected the order; a new submission is a new attempt
+            _settle_order_attempt(tool_context)
+        if response.status_code == 409: # Stock could not be reserved; nothing was ordered
+            try:
+                conflict = response.json()
+            except ValueError:
+                conflict = {}
+            return {
+                "status": "error",
+                "message": conflict.get("message", "Some items are no longer in stock."),
+                "unavailable_items": conflict.get("unavailable_items", []),
+            }
+        return {"status": "error", "message": f"Failed to submit order due to HTTP error: {response.status_code}"}
+    except httpx.RequestError as req_err:
+        logger.error(f"Request exception occurred while submitting order for {customer_id}: {req_err}")
+        return {"status": "error", "message": "Failed to connect to order submission service."}
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON response from order submission API for {customer_id}: {json_err} - Response: {response.text if response is not None else 'N/A'}")
+        return {"status": "error", "message": "Invalid response from order submission service."}
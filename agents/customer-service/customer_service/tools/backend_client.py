@@ -0,0 +1,274 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared HTTP session used by the agent tools to call the backend API.
+
+All tools share one `requests.Session`, so connections are kept alive and
+reused instead of opening a new TCP connection for every call. The connection
+pool is thread-safe. Failed GET/HEAD requests are retried with exponential
+backoff on connection errors and on 502/503/504 responses. POSTs are never
+retried here: they are not idempotent, and checkout does its own retries
+through an Idempotency-Key.
+
+Identical catalog GETs (product detail, product batch, availability) issued
+concurrently from several threads, e.g. many sessions asking about the same
+SKU at once, are coalesced: one request goes to the backend and every caller
+receives its response (see singleflight.py). Per-customer reads such as the
+cart are never coalesced, so a session always reads its own latest writes.
+A GET only joins requests started after the last write (POST) sent through the
+session completed, so e.g. availability read after a checkout reflects it.
+Writes made outside the agent (e.g. the storefront) are not seen; a joined
+response is at most one in-flight request older than the caller's own.
+
+Every request also goes through its endpoint's circuit breaker (see
+circuit_breaker.py). While the backend is failing or too slow, calls fail
+immediately with `BackendUnavailableError`, a requests ConnectionError, so the
+tools return their usual "failed to connect" results right away instead of
+waiting for timeouts. GETs can optionally be hedged.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from customer_service.tools.backend_transport import INPROCESS_SCHEME, InProcessAdapter, endpoint_name, match_endpoint
+from customer_service.tools.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, hedged_call
+from customer_service.tools.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (502, 503, 504)
+RETRY_METHODS = frozenset({"GET", "HEAD"})
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+HEDGE_PERCENTILE = 0.95
+# Shared catalog reads whose concurrent identical GETs may share one response
+COALESCED_ENDPOINTS = frozenset({"product_detail", "products_batch", "product_availability"})
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = None
+_breakers_lock = threading.Lock()
+
+
+class BackendUnavailableError(requests.exceptions.ConnectionError):
+    """The endpoint's circuit breaker is open; the request was not sent."""
+
+
+def is_coalesced_read(method: str, url: str) -> bool:
+    """Whether a request is a catalog GET that may share an identical in-flight request's response."""
+    if method != "GET":
+        return False
+    name, _ = match_endpoint(method, url)
+    return name in COALESCED_ENDPOINTS
+
+
+class CoalescingSession(requests.Session):
+    """Session whose concurrent identical catalog GETs share one request and response."""
+
+    def __init__(self):
+        super().__init__()
+        self.singleflight = SingleFlight()
+        self._writes = 0  # Completed writes; part of the coalescing key
+        self._writes_lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        if request.method not in READ_METHODS:
+            try:
+                return super().send(request, **kwargs)
+            finally:
+                with self._writes_lock:
+                    self._writes += 1
+        if not is_coalesced_read(request.method, request.url) or request.body or kwargs.get("stream"):
+            return super().send(request, **kwargs)
+        # Responses are fully read (not streamed), so waiters can share the object
+        key = (self._writes, request.url)
+        return self.singleflight.do(key, lambda: super(CoalescingSession, self).send(request, **kwargs))
+
+
+class CircuitBreakerAdapter(HTTPAdapter):
+    """HTTPAdapter that applies per-endpoint circuit breakers and, for GET/HEAD, optional hedging."""
+
+    def __init__(
+        self,
+        breakers: CircuitBreakerRegistry,
+        hedge: bool = False,
+        hedge_delay_secs: Optional[float] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            breakers: Registry providing one breaker per endpoint.
+            hedge: Start a second attempt for slow GET/HEAD requests.
+            hedge_delay_secs: When to start it; by default the endpoint's p95
+                latency (no hedging until enough calls were seen).
+            **kwargs: HTTPAdapter arguments (pool sizes, max_retries).
+        """
+        self.breakers = breakers
+        self.hedge = hedge
+        self.hedge_delay_secs = hedge_delay_secs
+        super().__init__(**kwargs)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self._pool_maxsize, thread_name_prefix="backend-hedge") if hedge else None
+
+    def send(self, request, **kwargs):
+        breaker = self.breakers.get(endpoint_name(request.method, request.url))
+
+        def attempt(prepared=request):
+            breaker.before_call()
+            start = time.perf_counter()
+            try:
+                response = HTTPAdapter.send(self, prepared, **kwargs)
+            except requests.exceptions.RequestException:
+                breaker.record(time.perf_counter() - start, failed=True)
+                raise
+            breaker.record(time.perf_counter() - start, failed=response.status_code >= 500)
+            return response
+
+        try:
+            hedge_delay = self._hedge_delay(breaker) if request.method in RETRY_METHODS else None
+            if hedge_delay is None:
+                return attempt()
+            return hedged_call(
+                lambda: attempt(request.copy()), hedge_delay, self._hedge_executor,
+                discard=lambda response: response.close(), on_hedge=breaker.record_hedge,
+            )
+        except CircuitOpenError as e:
+            raise BackendUnavailableError(str(e), request=request) from e
+
+    def _hedge_delay(self, breaker) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_delay_secs is not None:
+            return self.hedge_delay_secs
+        return breaker.latency_percentile(HEDGE_PERCENTILE)
+
+    def close(self):
+        super().close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+
+def create_backend_session(
+    pool_connections: int = 4,
+    pool_maxsize: int = 16,
+    max_retries: int = 3,
+    backoff_factor: float = 0.2,
+    coalesce_gets: bool = True,
+    breakers: Optional[CircuitBreakerRegistry] = None,
+    hedge: bool = False,
+    hedge_delay_secs: Optional[float] = None,
+) -> requests.Session:
+    """Builds a Session with a sized keep-alive pool and retry-with-backoff for idempotent requests.
+
+    Args:
+        pool_connections: Number of host pools to keep (one per backend host).
+        pool_maxsize: Maximum connections kept open per host; size it to the
+            number of tool calls that may run concurrently.
+        max_retries: Retries for GET/HEAD on connection errors and 502/503/504.
+        backoff_factor: Sleep between retries is backoff_factor * 2 ** (retry - 1) seconds.
+        coalesce_gets: Share one request among identical concurrent GETs.
+        breakers: Per-endpoint circuit breakers to apply (None: no breakers).
+        hedge: Hedge slow GET/HEAD requests (requires `breakers`).
+        hedge_delay_secs: Fixed hedge delay instead of the endpoint's p95 latency.
+
+    Returns:
+        The configured session.
+    """
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=False,  # A read timeout is raised as is: the backend already took the request's full timeout
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,  # Hand the last response to the caller's raise_for_status()
+    )
+    pool_settings = {"pool_connections": pool_connections, "pool_maxsize": pool_maxsize, "max_retries": retry}
+    if breakers is not None:
+        adapter = CircuitBreakerAdapter(breakers, hedge=hedge, hedge_delay_secs=hedge_delay_secs, **pool_settings)
+    else:
+        adapter = HTTPAdapter(**pool_settings)
+    session = CoalescingSession() if coalesce_gets else requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.mount(f"{INPROCESS_SCHEME}://", InProcessAdapter())  # In-process mode, see backend_transport.py
+    return session
+
+
+def get_backend_breakers() -> CircuitBreakerRegistry:
+    """Returns the process-wide per-endpoint breakers (shared by the sync and async tools), configured from Config."""
+    global _breakers
+    if _breakers is None:
+        with _breakers_lock:
+            if _breakers is None:
+                settings = {}
+                try:
+                    from customer_service.config import Config
+
+                    configs = Config()
+                    settings = {
+                        "window_secs": configs.BACKEND_BREAKER_WINDOW_SECS,
+                        "min_calls": configs.BACKEND_BREAKER_MIN_CALLS,
+                        "failure_rate_threshold": configs.BACKEND_BREAKER_FAILURE_RATE,
+                        "slow_call_secs": configs.BACKEND_BREAKER_SLOW_CALL_SECS,
+                        "slow_call_rate_threshold": configs.BACKEND_BREAKER_SLOW_CALL_RATE,
+                        "open_secs": configs.BACKEND_BREAKER_OPEN_SECS,
+                    }
+                except ImportError:
+                    logger.error("Could not import Config from customer_service.config. Using default circuit breaker settings.")
+                _breakers = CircuitBreakerRegistry(**settings)
+    return _breakers
+
+
+def get_backend_session() -> requests.Session:
+    """Returns the process-wide backend session, creating it from Config on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                settings = {}
+                try:
+                    from customer_service.config import Config
+
+                    configs = Config()
+                    settings = {
+                        "pool_connections": configs.BACKEND_HTTP_POOL_CONNECTIONS,
+                        "pool_maxsize": configs.BACKEND_HTTP_POOL_MAXSIZE,
+                        "max_retries": configs.BACKEND_HTTP_MAX_RETRIES,
+                        "backoff_factor": configs.BACKEND_HTTP_BACKOFF_FACTOR,
+                        "coalesce_gets": configs.BACKEND_HTTP_COALESCE_GETS,
+                        "hedge": configs.BACKEND_HEDGE_ENABLED,
+                        "hedge_delay_secs": configs.BACKEND_HEDGE_DELAY_SECS,
+                    }
+                    if configs.BACKEND_BREAKER_ENABLED:
+                        settings["breakers"] = get_backend_breakers()
+                except ImportError:
+                    logger.error("Could not import Config from customer_service.config. Using default HTTP pool settings.")
+                _session = create_backend_session(**settings)
+                logger.info(f"Created shared backend HTTP session ({settings or 'defaults'}).")
+    return _session
+
+
+def close_backend_session() -> None:
+    """Closes the shared session and its pooled connections (e.g. at shutdown)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,237 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Transport used by the tools to reach the backend API: HTTP or in-process.
+
+In HTTP mode (the default) the tools call the Flask API over the network.
+
+In in-process mode the agent runs on the same machine as the database. The
+tools' requests are then dispatched straight to the backend's data-access
+services (backend_services.py at the repository root). There is no socket,
+no HTTP parsing and no Flask routing, and catalog responses reuse the
+catalog cache's pre-serialized bytes. The tools keep building URLs and
+reading responses exactly as before. The transport plugs in underneath
+them:
+  * a requests adapter mounted on the shared session (sync tools),
+  * an httpx transport for the shared AsyncClient (async tools).
+Both produce exactly the status codes and JSON bodies of the HTTP API.
+
+In-process mode is chosen by an `inprocess://` BACKEND_API_BASE_URL (e.g.
+`inprocess://local/api`) or by BACKEND_TRANSPORT=inprocess. The database is
+BACKEND_DATABASE_PATH.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+INPROCESS_SCHEME = "inprocess"
+INPROCESS_BASE_URL = "inprocess://local/api"
+
+# Repository root, where app.py and backend_services.py live
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
+DEFAULT_DATABASE_PATH = os.path.join(PROJECT_ROOT, "ecommerce.db")
+
+
+def resolve_backend_base_url(base_url: str, transport: str = "http") -> str:
+    """Returns the base URL the tools should use for the configured transport."""
+    if transport.lower() == INPROCESS_SCHEME and not is_inprocess_url(base_url):
+        return INPROCESS_BASE_URL
+    return base_url
+
+
+def is_inprocess_url(url: str) -> bool:
+    return url.startswith(f"{INPROCESS_SCHEME}://")
+
+
+# The backend endpoints the tools call: (method, path pattern relative to /api, endpoint name)
+API_ENDPOINTS = [
+    ("GET", re.compile(r"/cart/(?P<customer_id>[^/]+)"), "cart"),
+    ("POST", re.compile(r"/cart/modify/(?P<customer_id>[^/]+)"), "cart_modify"),
+    ("GET", re.compile(r"/products"), "products"),
+    ("GET", re.compile(r"/products/availability/(?P<product_id>[^/]+)/(?P<store_id>[^/]+)"), "product_availability"),
+    ("GET", re.compile(r"/products/batch"), "products_batch"),
+    ("POST", re.compile(r"/products/batch"), "products_batch"),
+    ("GET", re.compile(r"/products/(?P<product_id>[^/]+)"), "product_detail"),
+    ("POST", re.compile(r"/retail/search-products"), "search_products"),
+    ("POST", re.compile(r"/checkout/place_order"), "place_order"),
+]
+
+
+def _api_path(url: str) -> str:
+    path = urlsplit(url).path
+    return path[len("/api"):] if path.startswith("/api/") else path
+
+
+def match_endpoint(method: str, url: str):
+    """(endpoint name, path match) for a backend URL, or (None, None) if it is not a known endpoint."""
+    path = _api_path(url)
+    for endpoint_method, pattern, name in API_ENDPOINTS:
+        if endpoint_method == method.upper():
+            match = pattern.fullmatch(path)
+            if match:
+                return name, match
+    return None, None
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """A per-endpoint key for a request, e.g. 'GET product_availability' (path parameters dropped)."""
+    name, _ = match_endpoint(method, url)
+    return f"{method.upper()} {name or _api_path(url)}"
+
+
+class InProcessBackend:
+    """Routes API paths to backend_services calls and encodes the results."""
+
+    def __init__(self, services):
+        self.services = services
+        # (method, endpoint name) -> handler
+        self._handlers = {
+            ("GET", "cart"): self._get_cart,
+            ("POST", "cart_modify"): self._modify_cart,
+            ("GET", "products"): self._list_products,
+            ("GET", "product_availability"): self._availability,
+            ("GET", "products_batch"): self._products_batch_get,
+            ("POST", "products_batch"): self._products_batch_post,
+            ("GET", "product_detail"): self._product_detail,
+            ("POST", "search_products"): self._search_products,
+            ("POST", "place_order"): self._place_order,
+        }
+
+    def handle(self, method: str, url: str, body: Optional[bytes], headers) -> tuple[int, bytes]:
+        """Serves one request and returns (status_code, JSON body bytes)."""
+        from backend_services import encode_payload
+
+        name, match = match_endpoint(method, url)
+        if name is None:
+            return 404, encode_payload({"error": "Not Found", "message": f"No in-process route for {method} {_api_path(url)}"})
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            return 400, encode_payload({"error": "Bad Request", "message": "Invalid JSON payload provided."})
+        path_params = {key: unquote(value) for key, value in match.groupdict().items()}
+        handler = self._handlers[(method.upper(), name)]
+        payload, status_code = handler(data=data, query=parse_qs(urlsplit(url).query), headers=headers, **path_params)
+        return status_code, encode_payload(payload)
+
+    def _get_cart(self, customer_id, **_):
+        with self.services.connection() as conn:
+            return self.services.cart_contents(conn, customer_id)
+
+    def _modify_cart(self, customer_id, data, **_):
+        with self.services.connection() as conn:
+            return self.services.modify_cart(conn, customer_id, data)
+
+    def _availability(self, product_id, store_id, **_):
+        with self.services.connection() as conn:
+            return self.services.product_availability(conn, product_id, store_id)
+
+    def _list_products(self, query, **_):
+        # Plain listing with optional category filter and field projection (no search or paging)
+        products = self.services.catalog_cache.list_products(query.get("category", [None])[0])
+        fields = [f for f in query.get("fields", [""])[0].split(",") if f]
+        if fields:
+            products = [{field: product.get(field) for field in fields} for product in products]
+        return products, 200
+
+    def _products_batch_get(self, query, **_):
+        ids = query.get("ids", [""])[0]
+        return self.services.products_batch([i for i in ids.split(",") if i])
+
+    def _products_batch_post(self, data, **_):
+        if not data or not isinstance(data.get("ids"), list):
+            return {"error": "Invalid JSON payload. 'ids' must be a list of product IDs."}, 400
+        return self.services.products_batch(data["ids"])
+
+    def _product_detail(self, product_id, **_):
+        return self.services.product_detail(product_id)
+
+    def _search_products(self, data, **_):
+        return self.services.search_products(data)
+
+    def _place_order(self, data, headers, **_):
+        if data is None:
+            return {"error": "Bad Request", "message": "Invalid JSON payload provided."}, 400
+        with self.services.connection() as conn:
+            return self.services.place_order(conn, data, idempotency_key=headers.get("Idempotency-Key"))
+
+
+_backend: Optional[InProcessBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_inprocess_backend() -> InProcessBackend:
+    """Creates the in-process services (pool, catalog cache, search) on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                database = DEFAULT_DATABASE_PATH
+                try:
+                    from customer_service.config import Config
+
+                    database = Config().BACKEND_DATABASE_PATH or database
+                except ImportError:
+                    logger.error("Could not import Config from customer_service.config. Using the default database path.")
+                if PROJECT_ROOT not in sys.path:
+                    sys.path.insert(0, PROJECT_ROOT)  # backend_services and its modules live at the repository root
+                from backend_services import create_backend_services
+
+                _backend = InProcessBackend(create_backend_services(database))
+                logger.info(f"Tools are using the in-process backend over {database}.")
+    return _backend
+
+
+class InProcessAdapter(BaseAdapter):
+    """requests adapter for inprocess:// URLs."""
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        status_code, content = get_inprocess_backend().handle(request.method, request.url, body, request.headers)
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = HTTPStatus(status_code).phrase
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json", "Content-Length": str(len(content))})
+        response._content = content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class InProcessAsyncTransport(httpx.AsyncBaseTransport):
+    """httpx transport for inprocess:// URLs; the blocking SQLite work runs in a worker thread."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        status_code, content = await asyncio.to_thread(
+            get_inprocess_backend().handle, request.method, str(request.url), body, request.headers
+        )
+        return httpx.Response(status_code, headers={"Content-Type": "application/json"}, content=content, request=request)
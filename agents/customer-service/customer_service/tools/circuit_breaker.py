@@ -0,0 +1,286 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-endpoint circuit breakers and hedged requests for the tools' backend calls.
+
+A `CircuitBreaker` tracks the calls to one backend endpoint over a rolling
+time window:
+  * closed: calls go through. When at least `min_calls` calls are in the
+    window and either the failure rate or the slow-call rate crosses its
+    threshold, the breaker opens.
+  * open: calls fail immediately with `CircuitOpenError` instead of waiting
+    for the backend to time out. After `open_secs` the breaker goes half-open.
+  * half-open: up to `half_open_max_calls` probe calls go through. A
+    successful probe closes the breaker and clears the window. A failed one
+    opens it again.
+
+Hedging (`hedged_call` / `async_hedged_call`) is for idempotent reads. If the
+first attempt has not finished after a delay (normally the endpoint's p95
+latency from its breaker window), a second attempt is started. The first one
+to succeed wins.
+
+The transports in backend_client.py (sync) and async_tools.py (async) apply
+both to every backend request. Breaker state is exported by
+`CircuitBreakerRegistry.snapshot()`.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Awaitable, Callable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Successful calls needed in the window before a latency percentile is reported
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+    def __init__(self, name: str, retry_after_secs: float):
+        super().__init__(f"Circuit breaker for {name} is open; retry in {retry_after_secs:.1f}s")
+        self.name = name
+        self.retry_after_secs = retry_after_secs
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling window of call outcomes and latencies."""
+
+    def __init__(
+        self,
+        name: str,
+        window_secs: float = 30.0,
+        min_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        slow_call_secs: float = 2.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_secs: float = 10.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.window_secs = window_secs
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_secs = slow_call_secs
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_secs = open_secs
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window: deque[tuple[float, bool, float]] = deque()  # (finished_at, failed, latency_secs)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._counters = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0, "hedged": 0, "hedge_wins": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance(self._clock())
+            return self._state
+
+    def before_call(self) -> None:
+        """Reserves a call, or raises CircuitOpenError if the endpoint must not be called now."""
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return
+            self._counters["rejected"] += 1
+            retry_after = max(0.0, self._opened_at + self.open_secs - now)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, latency_secs: float, failed: bool) -> None:
+        """Records the outcome of a call allowed by before_call()."""
+        with self._lock:
+            now = self._clock()
+            self._counters["calls"] += 1
+            self._counters["failures"] += failed
+            self._counters["slow_calls"] += latency_secs >= self.slow_call_secs
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self._state = CLOSED
+                    self._window.clear()
+                return
+            if self._state == OPEN:
+                return  # A call that started before the breaker opened
+            self._window.append((now, failed, latency_secs))
+            self._prune(now)
+            if len(self._window) >= self.min_calls:
+                failure_rate = sum(1 for _, f, _ in self._window if f) / len(self._window)
+                slow_rate = sum(1 for _, _, latency in self._window if latency >= self.slow_call_secs) / len(self._window)
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._open(now)
+
+    def release(self) -> None:
+        """Gives back a call reserved by before_call() that never ran (e.g. it was cancelled)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_hedge(self, won: bool) -> None:
+        with self._lock:
+            self._counters["hedged"] += 1
+            self._counters["hedge_wins"] += won
+
+    def latency_percentile(self, fraction: float) -> Optional[float]:
+        """The given latency percentile (e.g. 0.95) of the window's successful calls, if there are enough."""
+        with self._lock:
+            self._prune(self._clock())
+            latencies = sorted(latency for _, failed, latency in self._window if not failed)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+    def snapshot(self) -> dict[str, Any]:
+        """State, rolling-window rates and lifetime counters."""
+        p95 = self.latency_percentile(0.95)
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            self._prune(now)
+            calls = len(self._window)
+            return {
+                "state": self._state,
+                "window_calls": calls,
+                "window_failure_rate": round(sum(1 for _, f, _ in self._window if f) / calls, 3) if calls else 0.0,
+                "window_slow_call_rate": round(sum(1 for _, _, latency in self._window if latency >= self.slow_call_secs) / calls, 3) if calls else 0.0,
+                "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "retry_after_secs": round(max(0.0, self._opened_at + self.open_secs - now), 1) if self._state == OPEN else 0.0,
+                **self._counters,
+            }
+
+    # Called with the lock held
+    def _advance(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_secs:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._window.clear()
+        self._counters["opened"] += 1
+
+    def _prune(self, now: float) -> None:
+        while self._window and now - self._window[0][0] > self.window_secs:
+            self._window.popleft()
+
+
+class CircuitBreakerRegistry:
+    """One breaker per endpoint name, created on first use with shared settings."""
+
+    def __init__(self, **breaker_settings):
+        self._settings = breaker_settings
+        self._lock = threading.Lock()
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, **self._settings)
+            return breaker
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
+
+
+def hedged_call(
+    attempt: Callable[[], Any],
+    delay_secs: float,
+    executor: Executor,
+    discard: Callable[[Any], None] = lambda result: None,
+    on_hedge: Callable[[bool], None] = lambda won: None,
+) -> Any:
+    """
+    Runs attempt() in `executor`; if it has not finished after `delay_secs`,
+    runs a second attempt and returns the first successful result. The other
+    attempt's result, if it also succeeds, is passed to `discard` (e.g. to close
+    a response). If both fail, the first attempt's exception is raised.
+    `on_hedge(won)` is called when a second attempt was started.
+    """
+    first = executor.submit(attempt)
+    done, _ = wait([first], timeout=delay_secs)
+    if done:
+        return first.result()
+
+    second = executor.submit(attempt)
+    pending = {first, second}
+    errors = {}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [future for future in (first, second) if future in done and future.exception() is None]
+        if succeeded:
+            winner = succeeded[0]
+            on_hedge(winner is second)
+            for other in succeeded[1:]:
+                discard(other.result())
+            for other in pending:
+                other.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            return winner.result()
+        errors.update((future, future.exception()) for future in done)
+    on_hedge(False)
+    raise errors[first]
+
+
+async def async_hedged_call(
+    attempt: Callable[[], Awaitable[Any]],
+    delay_secs: float,
+    discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+    on_hedge: Callable[[bool], None] = lambda won: None,
+) -> Any:
+    """
+    Async hedged_call: the losing attempt is cancelled, or passed to the
+    `discard` coroutine function if it had already succeeded too. If both fail,
+    the first attempt's exception is raised.
+    """
+    first = asyncio.ensure_future(attempt())
+    done, _ = await asyncio.wait({first}, timeout=delay_secs)
+    if done:
+        return first.result()
+
+    second = asyncio.ensure_future(attempt())
+    pending = {first, second}
+    errors = {}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in (first, second) if task in done and task.exception() is None]
+            if succeeded:
+                winner = succeeded[0]
+                on_hedge(winner is second)
+                for other in succeeded[1:]:
+                    if discard is not None:
+                        await discard(other.result())
+                return winner.result()
+            errors.update((task, task.exception()) for task in done)
+        on_hedge(False)
+        raise errors[first]
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,12 +1,207 @@
 import os
+import time
+import sqlite3
+import hashlib
+import logging
 import mimetypes
+import threading
+from collections import OrderedDict
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part
 
+try:
+    from . import image_preprocessing
+except ImportError:  # Loaded by file path (see app.py), which registers it as a top-level module
+    import image_preprocessing
+
+logger = logging.getLogger(__name__)
+
 # Configuration
 MODEL_NAME = "gemini-2.0-flash-001" # Reverted to previously used model name
 IDENTIFICATION_PROMPT = "Identify the primary plant, vegetable, or gardening tool in this image. Return only the common name of the item. If multiple items are present, identify the most prominent one. If unsure, say 'Unknown'."
 
+# Result cache (see ImageResultCache). Set IMAGE_CACHE_DB_PATH to an empty string to disable the disk tier.
+# The default file sits next to this module, so the Flask app and the streaming server share it
+# whatever directory they are started from.
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_CACHE_MAX_ENTRIES", "256"))
+IMAGE_CACHE_TTL_SECS = float(os.environ.get("IMAGE_CACHE_TTL_SECS", str(7 * 24 * 3600)))
+IMAGE_CACHE_DB_PATH = os.environ.get(
+    "IMAGE_CACHE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_identification_cache.db")
+)
+
+
+class ImageResultCache:
+    """
+    Two-tier cache of identification results, keyed on the SHA-256 of the image
+    bytes together with the model name and prompt, so a model or prompt change
+    never serves old answers.
+
+    Tier 1 is an in-process LRU (dict lookup, no I/O). Tier 2 is a small SQLite
+    table that survives restarts and is shared by processes on the same host.
+    Both tiers expire entries after `ttl` seconds. Error results are never stored.
+    """
+
+    def __init__(self, max_entries=IMAGE_CACHE_MAX_ENTRIES, ttl=IMAGE_CACHE_TTL_SECS, db_path=IMAGE_CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path or None
+        self._lock = threading.Lock()
+        self._memory = OrderedDict() # key -> (stored_at, result), least recently used first
+        self._db = None
+        self._db_failed = False
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stores = 0
+
+    @staticmethod
+    def make_key(image_bytes, model_name=MODEL_NAME, prompt=IDENTIFICATION_PROMPT):
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+        prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        return f"{model_name}:{prompt_digest}:{image_digest}"
+
+    def _connection(self):
+        """Opens the disk tier on first use; called with the lock held."""
+        if self._db is None and self.db_path and not self._db_failed:
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=2.0, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS image_identifications (
+                        cache_key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        stored_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("DELETE FROM image_identifications WHERE stored_at < ?", (time.time() - self.ttl,))
+                conn.commit()
+                self._db = conn
+            except sqlite3.Error as e:
+                self._db_failed = True # Keep serving from memory only
+                logger.error(f"Image result cache: disk tier disabled, could not open {self.db_path}: {e}")
+        return self._db
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                if now - cached[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    return cached[1]
+                del self._memory[key]
+
+            conn = self._connection()
+            if conn is not None:
+                try:
+                    row = conn.execute(
+                        "SELECT result, stored_at FROM image_identifications WHERE cache_key = ? AND stored_at >= ?",
+                        (key, now - self.ttl),
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Image result cache: disk lookup failed: {e}")
+                    row = None
+                if row is not None:
+                    self._remember(key, row[1], row[0])
+                    self._disk_hits += 1
+                    return row[0]
+
+            self._misses += 1
+            return None
+
+    def _remember(self, key, stored_at, result):
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, result)
+            self._stores += 1
+            conn = self._connection()
+            if conn is not None:
+                try:
+                    conn.execute(
+                        "INSERT INTO image_identifications (cache_key, result, stored_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(cache_key) DO UPDATE SET result = excluded.result, stored_at = excluded.stored_at",
+                        (key, result, now),
+                    )
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Image result cache: disk write failed: {e}")
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_entries,
+                "disk_enabled": self._db is not None or (bool(self.db_path) and not self._db_failed),
+                "ttl_secs": self.ttl,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "stores": self._stores,
+                "hit_ratio": round((self._memory_hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+image_result_cache = ImageResultCache()
+
+
+# --- Shared model client ---
+# vertexai.init() and GenerativeModel() run once per process (per project/location)
+# instead of on every request; GenerativeModel is safe to share between threads.
+_model = None
+_model_settings = None
+_model_lock = threading.Lock()
+
+
+def _get_model(project_id: str, location: str):
+    """Returns the process-wide GenerativeModel, initializing Vertex AI on first use."""
+    global _model, _model_settings
+    settings = (project_id, location, MODEL_NAME)
+    if _model is None or _model_settings != settings:
+        with _model_lock:
+            if _model is None or _model_settings != settings:
+                # Initialize Vertex AI client. This uses Application Default Credentials.
+                vertexai.init(project=project_id, location=location)
+                _model = GenerativeModel(MODEL_NAME)
+                _model_settings = settings
+                logger.info(f"Image identifier: initialized {MODEL_NAME} for project {project_id} ({location}).")
+    return _model
+
+
+def warm_up(ping: bool = True) -> bool:
+    """
+    Creates the shared model client ahead of the first request. With `ping`, also
+    sends a count_tokens call so the channel is open and the auth token fetched.
+    Returns True if the client is ready. Never raises.
+    """
+    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
+    location = os.environ.get("GOOGLE_CLOUD_LOCATION")
+    if not project_id or not location:
+        logger.info("Image identifier warm-up skipped: GOOGLE_CLOUD_PROJECT/GOOGLE_CLOUD_LOCATION not set.")
+        return False
+    start = time.perf_counter()
+    try:
+        model = _get_model(project_id, location)
+        if ping:
+            model.count_tokens(IDENTIFICATION_PROMPT)
+    except Exception as e:
+        logger.warning(f"Image identifier warm-up failed (will retry on first request): {e}")
+        return False
+    logger.info(f"Image identifier warmed up in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return True
+
+
+def get_image_cache_metrics() -> dict:
+    """Hit/miss counters of the identification result cache."""
+    return image_result_cache.metrics()
+
 def get_mime_type_for_bytes(file_extension_from_filename: str):
     """
     Determines the MIME type from a file extension.
@@ -30,6 +225,29 @@ def identify_item_in_image(image_bytes: bytes, original_filename: str) -> str:
     Returns:
         A string containing the identified item name, or "Unknown" / error message.
     """
+    file_extension = original_filename.split('.')[-1]
+    mime_type = get_mime_type_for_bytes(file_extension)
+
+    if not mime_type or not mime_type.startswith("image/"):
+        return f"Error: Invalid or unknown MIME type for file extension '{file_extension}'."
+
+    # Identical photos (re-uploads, demo images) are answered without a model call.
+    cache_key = image_result_cache.make_key(image_bytes)
+    cached_result = image_result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info(f"Image identification served from cache: {cached_result}")
+        return cached_result
+
+    # Downscale/re-encode large photos; the cache key above stays on the original bytes.
+    model_bytes, model_mime_type = image_preprocessing.prepare_image_for_model(image_bytes, mime_type)
+    result = _identify_with_model(model_bytes, model_mime_type)
+    if not result.startswith("Error"): # Failures are retried on the next upload, never cached
+        image_result_cache.put(cache_key, result)
+    return result
+
+
+def _identify_with_model(image_bytes: bytes, mime_type: str) -> str:
+    """Calls Gemini on Vertex AI to identify the item in the image."""
     project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
     location = os.environ.get("GOOGLE_CLOUD_LOCATION")
 
@@ -38,27 +256,27 @@ def identify_item_in_image(image_bytes: bytes, original_filename: str) -> str:
         print(error_msg)
         return error_msg
 
-    file_extension = original_filename.split('.')[-1]
-    mime_type = get_mime_type_for_bytes(file_extension)
-
-    if not mime_type or not mime_type.startswith("image/"):
-        return f"Error: Invalid or unknown MIME type for file extension '{file_extension}'."
-
     try:
-        # Initialize Vertex AI client. This uses Application Default Credentials.
-        vertexai.init(project=project_id, location=location)
-        
-        # Load the model
-        model = GenerativeModel(MODEL_NAME)
+        call_start = time.perf_counter()
+        model = _get_model(project_id, location)
+        init_done = time.perf_counter()
 
-        # Prepare the content parts
+        # Prepare the content parts (the image is sent inline with the request)
         image_part = Part.from_data(data=image_bytes, mime_type=mime_type)
         prompt_part = Part.from_text(IDENTIFICATION_PROMPT)
         
         contents = [prompt_part, image_part]
+        prepare_done = time.perf_counter()
 
-        # Generate content
+        # Generate content (upload of the request + model inference)
         response = model.generate_content(contents)
+        generate_done = time.perf_counter()
+        logger.info(
+            f"Image identification timings: init={(init_done - call_start) * 1000:.1f}ms "
+            f"prepare={(prepare_done - init_done) * 1000:.1f}ms "
+            f"generate={(generate_done - prepare_done) * 1000:.1f}ms "
+            f"total={(generate_done - call_start) * 1000:.1f}ms ({len(image_bytes)} bytes)"
+        )
 
         if response.candidates and response.candidates[0].content.parts:
             identified_item = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, 'text') and part.text)
@@ -0,0 +1,119 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Downscales and re-encodes uploaded photos before they are sent to a model.
+
+Phone photos are often several megabytes and far larger than the resolution
+the model actually looks at. Each image is decoded, rotated according to its
+EXIF orientation, shrunk so its longest side is at most
+IMAGE_PREPROCESS_MAX_DIM pixels, and re-encoded as JPEG or WebP.
+
+Pillow is optional. Without it, or for any image it cannot decode, the
+original bytes are passed through unchanged.
+
+This module must not use package-relative imports: the Flask backend loads it
+by file path.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = ImageOps = None
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREPROCESS_ENABLED = os.environ.get("IMAGE_PREPROCESS_ENABLED", "1").lower() not in ("0", "false", "no")
+IMAGE_PREPROCESS_MAX_DIM = int(os.environ.get("IMAGE_PREPROCESS_MAX_DIM", "1024"))
+IMAGE_PREPROCESS_FORMAT = os.environ.get("IMAGE_PREPROCESS_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_PREPROCESS_QUALITY = int(os.environ.get("IMAGE_PREPROCESS_QUALITY", "85"))
+IMAGE_PREPROCESS_WORKERS = int(os.environ.get("IMAGE_PREPROCESS_WORKERS", "2"))
+
+_OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+if not PIL_AVAILABLE:
+    logger.warning("Pillow is not installed; images are sent to the model without downscaling.")
+
+# Decoding and resizing release the GIL, so a small thread pool runs them in parallel
+# without blocking the asyncio event loop.
+_executor = ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS, thread_name_prefix="image-preprocess")
+
+
+def _flatten_to_rgb(image):
+    """Converts to RGB, compositing any transparency onto white."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def prepare_image_for_model(image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    """Returns (bytes, mime_type) ready for the model.
+
+    Args:
+        image_bytes: The uploaded image.
+        mime_type: Its declared MIME type.
+
+    Returns:
+        The downscaled, re-encoded image and its new MIME type. The original
+        image is returned if preprocessing is disabled, Pillow is missing, the
+        image cannot be decoded, or re-encoding would not make it smaller.
+    """
+    if not IMAGE_PREPROCESS_ENABLED or not PIL_AVAILABLE or not image_bytes:
+        return image_bytes, mime_type
+
+    start = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as original:
+            original_size = original.size
+            # For JPEGs, let the decoder scale down by a power of two (much faster)
+            original.draft("RGB", (IMAGE_PREPROCESS_MAX_DIM, IMAGE_PREPROCESS_MAX_DIM))
+            rotated = original.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+            image = ImageOps.exif_transpose(original)
+            needs_resize = max(image.size) > IMAGE_PREPROCESS_MAX_DIM
+            if needs_resize:
+                image.thumbnail((IMAGE_PREPROCESS_MAX_DIM, IMAGE_PREPROCESS_MAX_DIM), Image.Resampling.LANCZOS)
+            image = _flatten_to_rgb(image)
+
+            output = io.BytesIO()
+            image.save(output, format=IMAGE_PREPROCESS_FORMAT, quality=IMAGE_PREPROCESS_QUALITY, optimize=True)
+            processed = output.getvalue()
+    except Exception as e:  # Unknown format, truncated upload, decompression bomb, ...
+        logger.warning(f"Image preprocessing skipped ({type(e).__name__}: {e}); sending original bytes.")
+        return image_bytes, mime_type
+
+    if len(processed) >= len(image_bytes) and not needs_resize and not rotated:
+        return image_bytes, mime_type
+
+    logger.info(
+        f"Image preprocessed: {original_size[0]}x{original_size[1]} {len(image_bytes)} bytes -> "
+        f"{image.size[0]}x{image.size[1]} {len(processed)} bytes {IMAGE_PREPROCESS_FORMAT} "
+        f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return processed, _OUTPUT_MIME_TYPES.get(IMAGE_PREPROCESS_FORMAT, "image/jpeg")
+
+
+async def prepare_image_for_model_async(image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    """prepare_image_for_model() on the worker pool, for use from async code."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, prepare_image_for_model, image_bytes, mime_type)
@@ -0,0 +1,132 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Request coalescing ("single-flight") for identical concurrent reads.
+
+When several callers ask for the same key while a fetch for it is already in
+flight, they wait for that fetch and all receive its result (or its
+exception) instead of starting their own. Nothing is cached: once the fetch
+completes, the next call for the key starts a new one.
+
+`SingleFlight` is for threads (the sync tools' HTTP session, Flask request
+threads). `AsyncSingleFlight` is for coroutines on one event loop (the async
+tools' client).
+
+This module only uses the standard library, because app.py loads it by file
+path (see `load_agent_tool_module`).
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Counters:
+    def __init__(self):
+        self.executions = 0  # fetches actually run
+        self.coalesced = 0  # calls that joined an in-flight fetch instead
+
+    def stats(self, in_flight: int) -> dict[str, Any]:
+        calls = self.executions + self.coalesced
+        return {
+            "calls": calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / calls, 3) if calls else 0.0,
+            "in_flight": in_flight,
+        }
+
+
+class SingleFlight:
+    """Thread-safe single-flight: concurrent `do(key, fn)` calls share one `fn()` run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._counters = _Counters()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Returns fn()'s result, joining an in-flight call for `key` if there is one."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters.executions += 1
+            else:
+                self._counters.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict[str, Any]:
+        """{'calls', 'executions', 'coalesced', 'coalesced_ratio', 'in_flight'}"""
+        with self._lock:
+            return self._counters.stats(len(self._calls))
+
+
+class AsyncSingleFlight:
+    """Single-flight for coroutines on one event loop.
+
+    The shared fetch runs as its own task, so a caller that is cancelled (e.g.
+    its session ended) does not cancel the fetch for the other waiters.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._counters = _Counters()
+
+    async def do(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns `await coro_fn()`, joining an in-flight call for `key` if there is one."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self._counters.executions += 1
+        else:
+            self._counters.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every waiter was cancelled
+
+    def stats(self) -> dict[str, Any]:
+        """{'calls', 'executions', 'coalesced', 'coalesced_ratio', 'in_flight'}"""
+        return self._counters.stats(len(self._tasks))
@@ -14,12 +14,18 @@
 # add docstring to this module
 """Tools module for the customer service agent."""
 
+import hashlib
 import logging
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional # Added import for Optional
+from urllib.parse import urlencode
 import requests # Added for making HTTP requests
 import json # Added for parsing JSON responses
+from google.adk.tools import ToolContext
+
+from customer_service.tools.backend_client import get_backend_session
+from customer_service.tools.backend_transport import resolve_backend_base_url
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +33,7 @@ logger = logging.getLogger(__name__)
 try:
     from customer_service.config import Config
     configs = Config()
-    BACKEND_API_BASE_URL = configs.BACKEND_API_BASE_URL
+    BACKEND_API_BASE_URL = resolve_backend_base_url(configs.BACKEND_API_BASE_URL, configs.BACKEND_TRANSPORT)
 except ImportError:
     logger.error("Could not import Config from customer_service.config. Using default URL.")
     # Fallback in case of import issues, though ideally this shouldn't happen
@@ -147,7 +153,7 @@ def access_cart_information(customer_id: str) -> dict:
     
     api_url = f"{BACKEND_API_BASE_URL}/cart/{customer_id}"
     try:
-        response = requests.get(api_url, timeout=5) # Added timeout
+        response = get_backend_session().get(api_url, timeout=5) # Added timeout
         response.raise_for_status() # Raises an HTTPError for bad responses (4XX or 5XX)
         cart_data = response.json()
         logger.info("Successfully retrieved cart data for customer %s: %s", customer_id, cart_data)
@@ -175,10 +181,11 @@ def modify_cart(
         items_to_remove (list): A list of product_ids to remove.
 
     Returns:
-        dict: A dictionary indicating the status of the cart modification.
+        dict: A dictionary indicating the status of the cart modification, with the updated
+        cart ('cart': {'items', 'subtotal', 'version'}) and the lines that changed.
     Example:
         >>> modify_cart(customer_id='123', items_to_add=[{'product_id': 'soil-456', 'quantity': 1}, {'product_id': 'fert-789', 'quantity': 1}], items_to_remove=[{'product_id': 'fert-112', 'quantity': 1}])
-        {'status': 'success', 'message': 'Cart updated successfully.', 'items_added': True, 'items_removed': True}
+        {'status': 'success', 'message': 'Cart updated successfully.', 'items_added': True, 'items_removed': True, 'cart': {...}, 'added_items': [...], 'removed_items': [...]}
     """
 
     logger.info("Modifying cart for customer ID: %s", customer_id)
@@ -192,45 +199,13 @@ def modify_cart(
     }
     
     try:
-        response = requests.post(api_url, json=payload, timeout=5)
+        response = get_backend_session().post(api_url, json=payload, timeout=5)
         response.raise_for_status()
         modification_status = response.json()
         logger.info("Successfully modified cart for customer %s: %s", customer_id, modification_status)
-        # Add action to signal frontend refresh and include added item details if applicable
-        added_item_details_for_payload = None
-        # Check if items were intended to be added and the API reported success for additions
-        if items_to_add and modification_status.get("items_added") is True:
-            # Assuming the animation is for the first item added.
-            # The `items_to_add` list contains dicts like {'product_id': '...', 'quantity': ...}
-            first_added_item_info = items_to_add[0]
-            product_id_to_fetch = first_added_item_info.get("product_id")
-
-            if product_id_to_fetch:
-                logger.info(f"Attempting to fetch details for added product ID: {product_id_to_fetch} for refresh_cart payload.")
-                product_api_url = f"{BACKEND_API_BASE_URL}/products/{product_id_to_fetch}"
-                try:
-                    product_response = requests.get(product_api_url, timeout=5)
-                    product_response.raise_for_status()
-                    product_data = product_response.json()
-                    
-                    # Ensure the image_url is correctly formed if needed.
-                    # For now, assuming product_data.get("image_url") is sufficient as per get_product_recommendations
-                    # and the task scope (not fixing 404s here).
-                    image_url = product_data.get("image_url")
-                    
-                    added_item_details_for_payload = {
-                        "product_id": product_data.get("id"), # or product_id_to_fetch
-                        "name": product_data.get("name"),
-                        "image_url": image_url
-                    }
-                    logger.info(f"Successfully fetched details for added item for refresh_cart: {added_item_details_for_payload}")
-                except requests.exceptions.HTTPError as http_err_prod:
-                    logger.error(f"HTTP error fetching product details for {product_id_to_fetch} (for refresh_cart): {http_err_prod} - Response: {product_response.text if 'product_response' in locals() and hasattr(product_response, 'text') else 'N/A'}")
-                except requests.exceptions.RequestException as req_err_prod:
-                    logger.error(f"Request exception fetching product details for {product_id_to_fetch} (for refresh_cart): {req_err_prod}")
-                except json.JSONDecodeError as json_err_prod:
-                    logger.error(f"Failed to decode JSON for product details {product_id_to_fetch} (for refresh_cart): {json_err_prod} - Response: {product_response.text if 'product_response' in locals() and hasattr(product_response, 'text') else 'N/A'}")
-        
+        # Signal a frontend refresh; the response already carries the updated cart and
+        # the added lines' display details, so no further request is needed.
+        added_item_details_for_payload = _added_item_for_animation(items_to_add, modification_status)
         return_value = {"action": "refresh_cart", **modification_status}
         if added_item_details_for_payload:
             return_value["added_item"] = added_item_details_for_payload
@@ -249,6 +224,57 @@ def modify_cart(
         return {"status": "error", "message": "Invalid response from cart modification service.", "items_added": False, "items_removed": False}
 
 
+def _added_item_for_animation(items_to_add: list[dict], modification_status: dict) -> dict | None:
+    """The add-to-cart animation details ({'product_id', 'name', 'image_url'}) from a cart modification response.
+
+    Uses the first requested item if it was added, otherwise the first line that was.
+    """
+    added_items = modification_status.get("added_items") or []
+    if not items_to_add or modification_status.get("items_added") is not True or not added_items:
+        return None
+    first_requested_id = items_to_add[0].get("product_id")
+    item = next((i for i in added_items if i.get("product_id") == first_requested_id), added_items[0])
+    return {"product_id": item.get("product_id"), "name": item.get("name"), "image_url": item.get("image_url")}
+
+
+def _products_batch_get_url(api_url: str, product_ids: list[str]) -> str | None:
+    """The GET <api_url>?ids=... URL for /api/products/batch, or None if the IDs must be POSTed (non-strings, commas)."""
+    if all(isinstance(product_id, str) and product_id and "," not in product_id for product_id in product_ids):
+        # Query built here rather than with params=: requests leaves inprocess:// URLs unprepared
+        return f"{api_url}?{urlencode({'ids': ','.join(product_ids)})}"
+    return None
+
+
+def _format_recommendation_card(product_data: dict) -> dict:
+    """Formats a product detail dict (as returned by /api/products/<id>) for a recommendation card."""
+    product_id = product_data.get("id")
+
+    # Ensure price is a float or int for formatting
+    price_value = product_data.get("price")
+    formatted_price_str = "N/A" # Default if price is missing or not a number
+    if isinstance(price_value, (int, float)):
+        formatted_price_str = f"${price_value:.2f}"
+    elif isinstance(price_value, str):
+        try:
+            price_value_float = float(price_value)
+            formatted_price_str = f"${price_value_float:.2f}"
+        except ValueError:
+            logger.warning(f"Could not convert price string '{price_value}' to float for product ID {product_id}")
+    else:
+         logger.warning(f"Price for product ID {product_id} is missing or not a number: {price_value}")
+
+    formatted_product = {
+        "id": product_id,
+        "name": product_data.get("name"),
+        "formatted_price": formatted_price_str,
+        "image_url": product_data.get("image_url"),
+        "attributes": product_data.get("attributes"),
+        # Construct the new product_url
+        "product_url": f"/products/{product_id}" if product_id else "#", # Fallback if ID is missing
+    }
+    return formatted_product
+
+
 def get_product_recommendations(product_ids: list[str], customer_id: str) -> dict:
     """Retrieves and formats specific product details for a list of product IDs for recommendation cards.
 
@@ -277,59 +303,39 @@ def get_product_recommendations(product_ids: list[str], customer_id: str) -> dic
     formatted_products_details = []
     errors = []
 
-    for product_id in product_ids:
-        api_url = f"{BACKEND_API_BASE_URL}/products/{product_id}"
-        try:
-            response = requests.get(api_url, timeout=5)
-            response.raise_for_status()
-            product_data = response.json()
-            
-            # Ensure price is a float or int for formatting
-            price_value = product_data.get("price")
-            formatted_price_str = "N/A" # Default if price is missing or not a number
-            if isinstance(price_value, (int, float)):
-                formatted_price_str = f"${price_value:.2f}"
-            elif isinstance(price_value, str):
-                try:
-                    price_value_float = float(price_value)
-                    formatted_price_str = f"${price_value_float:.2f}"
-                except ValueError:
-                    logger.warning(f"Could not convert price string '{price_value}' to float for product ID {product_id}")
-            else:
-                 logger.warning(f"Price for product ID {product_id} is missing or not a number: {price_value}")
-
-
-            formatted_product = {
-                "id": product_data.get("id"),
-                "name": product_data.get("name"),
-                "formatted_price": formatted_price_str,
-                "image_url": product_data.get("image_url"),
-                "attributes": product_data.get("attributes"),
-                # Construct the new product_url
-            }
-            product_id_for_url = product_data.get("id")
-            if product_id_for_url:
-                formatted_product["product_url"] = f"/products/{product_id_for_url}"
-            else:
-                formatted_product["product_url"] = "#" # Fallback if ID is missing
-            
-            logger.info(f"Product ID {product_id} generated product_url: {formatted_product.get('product_url')}")
-            formatted_products_details.append(formatted_product)
-            logger.info(f"Successfully retrieved and formatted details for product ID {product_id}")
-
-        except requests.exceptions.HTTPError as http_err:
-            error_msg = f"HTTP error for product ID {product_id}: {http_err} - Response: {response.text}"
-            logger.error(error_msg)
-            errors.append({"product_id": product_id, "error": str(http_err), "status_code": response.status_code if response else "N/A"})
-        except requests.exceptions.RequestException as req_err:
-            error_msg = f"Request exception for product ID {product_id}: {req_err}"
-            logger.error(error_msg)
-            errors.append({"product_id": product_id, "error": str(req_err)})
-        except json.JSONDecodeError as json_err:
-            error_msg = f"Failed to decode JSON for product ID {product_id}: {json_err} - Response: {response.text if response else 'No response'}"
-            logger.error(error_msg)
-            errors.append({"product_id": product_id, "error": "Invalid JSON response from product details API."})
-            
+    # One batch request for all IDs instead of one GET per product. Sent as a GET
+    # when possible, so identical concurrent requests are coalesced.
+    api_url = f"{BACKEND_API_BASE_URL}/products/batch"
+    response = None
+    try:
+        batch_get_url = _products_batch_get_url(api_url, product_ids)
+        if batch_get_url is not None:
+            response = get_backend_session().get(batch_get_url, timeout=5)
+        else:
+            response = get_backend_session().post(api_url, json={"ids": list(product_ids)}, timeout=5)
+        response.raise_for_status()
+        batch_data = response.json()
+
+        for product_data in batch_data.get("products", []):
+            formatted_products_details.append(_format_recommendation_card(product_data))
+        for batch_error in batch_data.get("errors", []):
+            errors.append({
+                "product_id": batch_error.get("product_id"),
+                "error": batch_error.get("error"),
+                "status_code": batch_error.get("status_code", "N/A"),
+            })
+        logger.info(f"Successfully retrieved and formatted details for product IDs {[p['id'] for p in formatted_products_details]}")
+
+    except requests.exceptions.HTTPError as http_err:
+        logger.error(f"HTTP error for product IDs {product_ids}: {http_err} - Response: {response.text}")
+        errors = [{"product_id": pid, "error": str(http_err), "status_code": response.status_code} for pid in product_ids]
+    except requests.exceptions.RequestException as req_err:
+        logger.error(f"Request exception for product IDs {product_ids}: {req_err}")
+        errors = [{"product_id": pid, "error": str(req_err)} for pid in product_ids]
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode JSON for product IDs {product_ids}: {json_err} - Response: {response.text if response is not None else 'No response'}")
+        errors = [{"product_id": pid, "error": "Invalid JSON response from product details API."} for pid in product_ids]
+
     if errors:
         logger.warning(f"Encountered errors while fetching details for some products: {errors}")
         
@@ -359,7 +365,7 @@ def check_product_availability(product_id: str, store_id: str) -> dict:
     )
     api_url = f"{BACKEND_API_BASE_URL}/products/availability/{product_id}/{store_id}"
     try:
-        response = requests.get(api_url, timeout=5)
+        response = get_backend_session().get(api_url, timeout=5)
         response.raise_for_status()
         availability_data = response.json()
         logger.info("Successfully retrieved availability for product %s at store %s: %s", product_id, store_id, availability_data)
@@ -403,7 +409,7 @@ def search_products(query: str, customer_id: str) -> dict:
     payload = {"query": query, "visitor_id": customer_id}
 
     try:
-        response = requests.post(api_url, json=payload, timeout=10) # Increased timeout for search
+        response = get_backend_session().post(api_url, json=payload, timeout=10) # Increased timeout for search
         response.raise_for_status()
         search_results = response.json()
         # The backend endpoint returns {'recommendations': [...]}, let's rename to 'results' for clarity
@@ -690,7 +696,40 @@ def set_website_theme(theme: str) -> dict:
     return action_result
 
 
-def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shipping_details: dict, total_amount: float) -> dict:
+# Session state entry holding the idempotency key of a checkout attempt whose outcome is not known yet
+ORDER_ATTEMPT_STATE_KEY = "pending_order_attempt"
+
+
+def _order_idempotency_key(payload: dict, tool_context: Optional[ToolContext]) -> str:
+    """
+    Returns the idempotency key for submitting `payload`.
+
+    Each checkout attempt gets a random key, kept in session state until the
+    backend's answer is known. Submitting the same order again before that
+    (a retry after a timeout or connection error) reuses the key, so the
+    backend replays the original order instead of placing it twice. Once the
+    attempt is settled the key is dropped, so a later, deliberate re-order of
+    the same items is a new order.
+    """
+    fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    if tool_context is not None:
+        pending = tool_context.state.get(ORDER_ATTEMPT_STATE_KEY)
+        if pending and pending.get("fingerprint") == fingerprint:
+            logger.info("Retrying an unsettled checkout attempt with its original idempotency key.")
+            return pending["key"]
+    key = uuid.uuid4().hex
+    if tool_context is not None:
+        tool_context.state[ORDER_ATTEMPT_STATE_KEY] = {"key": key, "fingerprint": fingerprint}
+    return key
+
+
+def _settle_order_attempt(tool_context: Optional[ToolContext]) -> None:
+    """Forgets the pending attempt's key once the backend has accepted or rejected the order."""
+    if tool_context is not None and tool_context.state.get(ORDER_ATTEMPT_STATE_KEY):
+        tool_context.state[ORDER_ATTEMPT_STATE_KEY] = None
+
+
+def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shipping_details: dict, total_amount: float, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Submits the order to the backend, which includes clearing the cart.
 
@@ -699,6 +738,7 @@ def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shippi
         cart_items (list[dict]): List of items in the cart (e.g., from access_cart_information).
         shipping_details (dict): Shipping information collected.
         total_amount (float): The final total amount for the order.
+        tool_context (ToolContext, optional): Provided by ADK; holds the checkout attempt's idempotency key.
 
     Returns:
         dict: A dictionary with the status of the order submission.
@@ -716,11 +756,16 @@ def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shippi
     
     logger.info(f"Order submission payload: {json.dumps(payload, indent=2)}")
 
+    # A retry of an attempt whose outcome is unknown reuses its key, so the backend
+    # returns the original order instead of placing (and charging) it twice.
+    idempotency_key = _order_idempotency_key(payload, tool_context)
+
     try:
-        response = requests.post(api_url, json=payload, timeout=10)
+        response = get_backend_session().post(api_url, json=payload, headers={"Idempotency-Key": idempotency_key}, timeout=10)
         response.raise_for_status()
         order_status = response.json() # Expected: {"status": "success", "message": "...", "order_id": "..."}
         
+        _settle_order_attempt(tool_context)
         if order_status.get("status") == "success":
             logger.info(f"Order successfully submitted for customer {customer_id}: {order_status}")
             return {
@@ -739,6 +784,18 @@ def submit_order_and_clear_cart(customer_id: str, cart_items: list[dict], shippi
 
     except requests.exceptions.HTTPError as http_err:
         logger.error(f"HTTP error occurred while submitting order for {customer_id}: {http_err} - Response: {response.text if 'response' in locals() else 'N/A'}")
+        if response.status_code < 500: # The backend rejected the order; a new submission is a new attempt
+            _settle_order_attempt(tool_context)
+        if response.status_code == 409: # Stock could not be reserved; nothing was ordered
+            try:
+                conflict = response.json()
+            except ValueError:
+                conflict = {}
+            return {
+                "status": "error",
+                "message": conflict.get("message", "Some items are no longer in stock."),
+                "unavailable_items": conflict.get("unavailable_items", []),
+            }
         return {"status": "error", "message": f"Failed to submit order due to HTTP error: {response.status_code if 'response' in locals() else 'Unknown'}"}
     except requests.exceptions.RequestException as req_err:
         logger.error(f"Request exception occurred while submitting order for {customer_id}: {req_err}")
@@ -0,0 +1,363 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local visual pre-matcher: finds the catalog product shown in a photo.
+
+Every catalog product has a reference image. The matcher builds an index over
+these images with three features per image:
+  * a 64-bit DCT perceptual hash (pHash),
+  * a 64-bit gradient hash (dHash),
+  * a 128-bin HSV colour histogram.
+Uploaded photos are compared with every indexed image in one vectorised NumPy
+pass. A match is returned only if the best product is close in absolute terms
+and clearly closer than the runner-up. Callers can then answer with that SKU
+without asking Gemini or running a product search.
+
+The index can be saved to an .npz file and is reused while the reference
+images are unchanged. NumPy and Pillow are optional; without them the matcher
+never matches.
+
+This module must not use package-relative imports: the Flask backend loads it
+by file path.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlencode
+
+import requests
+
+try:
+    import numpy as np
+    from PIL import Image, ImageOps
+    VISUAL_MATCHING_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    np = Image = ImageOps = None
+    VISUAL_MATCHING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+VISUAL_MATCH_ENABLED = os.environ.get("VISUAL_MATCH_ENABLED", "1").lower() not in ("0", "false", "no")
+# Combined distance (0 = identical, 1 = unrelated) below which a match is trusted
+VISUAL_MATCH_MAX_DISTANCE = float(os.environ.get("VISUAL_MATCH_MAX_DISTANCE", "0.25"))
+# Required gap between the best and the second-best product
+VISUAL_MATCH_MIN_MARGIN = float(os.environ.get("VISUAL_MATCH_MIN_MARGIN", "0.08"))
+VISUAL_INDEX_RECHECK_SECS = float(os.environ.get("VISUAL_INDEX_RECHECK_SECS", "60"))
+
+# Weights of the individual distances in the combined distance
+PHASH_WEIGHT = 0.45
+DHASH_WEIGHT = 0.25
+HISTOGRAM_WEIGHT = 0.30
+HISTOGRAM_BINS = (8, 4, 4)  # hue, saturation, value
+
+_HASH_SIZE = 8
+_PHASH_INPUT_SIZE = 32
+_FEATURE_IMAGE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class CatalogImage:
+    """A product's reference image."""
+
+    product_id: str
+    name: str
+    path: str
+
+
+@dataclass(frozen=True)
+class VisualMatch:
+    """The closest catalog product for a photo."""
+
+    product_id: str
+    name: str
+    distance: float
+    margin: float
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis, so that dct2(A) = D @ A @ D.T."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0, :] = np.sqrt(1.0 / size)
+    return matrix
+
+
+_DCT = _dct_matrix(_PHASH_INPUT_SIZE) if VISUAL_MATCHING_AVAILABLE else None
+
+
+def _open_normalized(image_source):
+    """Opens an image (bytes or path), applies EXIF orientation and flattens it to RGB."""
+    image = Image.open(io.BytesIO(image_source) if isinstance(image_source, bytes) else image_source)
+    image.draft("RGB", (_FEATURE_IMAGE_SIZE * 4, _FEATURE_IMAGE_SIZE * 4))  # Fast JPEG decode at reduced size
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def compute_features(image_source):
+    """Returns (phash_bits, dhash_bits, histogram) for an image given as bytes or a path."""
+    image = _open_normalized(image_source)
+    small = image.resize((_FEATURE_IMAGE_SIZE, _FEATURE_IMAGE_SIZE), Image.Resampling.BILINEAR)
+    gray = small.convert("L")
+
+    dhash_pixels = np.asarray(gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.BILINEAR), dtype=np.int16)
+    dhash_bits = (dhash_pixels[:, 1:] > dhash_pixels[:, :-1]).ravel()
+
+    phash_pixels = np.asarray(gray.resize((_PHASH_INPUT_SIZE, _PHASH_INPUT_SIZE), Image.Resampling.BILINEAR), dtype=np.float64)
+    low_frequencies = (_DCT @ phash_pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    phash_bits = low_frequencies > np.median(low_frequencies[1:])  # DC term excluded from the median
+
+    hsv = np.asarray(small.convert("HSV")).reshape(-1, 3)
+    histogram, _ = np.histogramdd(hsv, bins=HISTOGRAM_BINS, range=((0, 256), (0, 256), (0, 256)))
+    histogram = histogram.ravel().astype(np.float32)
+    histogram /= max(histogram.sum(), 1.0)
+    return phash_bits, dhash_bits, histogram
+
+
+def _fingerprint(images):
+    """Changes whenever the set of reference images or any of their files changes."""
+    digest = hashlib.sha1()
+    for item in images:
+        try:
+            stat = os.stat(item.path)
+            file_state = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            file_state = "missing"
+        digest.update(f"{item.product_id}|{item.name}|{item.path}|{file_state}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class VisualIndex:
+    """Feature matrices for a set of catalog images."""
+
+    def __init__(self, images, phash, dhash, histograms, fingerprint):
+        self.images = list(images)
+        self.phash = phash
+        self.dhash = dhash
+        self.histograms = histograms
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, images):
+        images = list(images)
+        indexed, phashes, dhashes, histograms = [], [], [], []
+        for item in images:
+            try:
+                phash, dhash, histogram = compute_features(item.path)
+            except Exception as e:  # Missing or unreadable reference image
+                logger.warning(f"Visual index: skipping {item.product_id} ({item.path}): {e}")
+                continue
+            indexed.append(item)
+            phashes.append(phash)
+            dhashes.append(dhash)
+            histograms.append(histogram)
+        bits = _HASH_SIZE * _HASH_SIZE
+        return cls(
+            indexed,
+            np.array(phashes, dtype=bool).reshape(-1, bits),
+            np.array(dhashes, dtype=bool).reshape(-1, bits),
+            np.array(histograms, dtype=np.float32).reshape(len(indexed), -1),
+            _fingerprint(images),
+        )
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            product_ids=np.array([i.product_id for i in self.images]),
+            names=np.array([i.name for i in self.images]),
+            paths=np.array([i.path for i in self.images]),
+            phash=self.phash, dhash=self.dhash, histograms=self.histograms,
+            fingerprint=np.array(self.fingerprint),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            images = [CatalogImage(str(p), str(n), str(f)) for p, n, f in zip(data["product_ids"], data["names"], data["paths"])]
+            return cls(images, data["phash"], data["dhash"], data["histograms"], str(data["fingerprint"]))
+
+    def distances(self, features):
+        """Combined distance from the given features to every indexed image."""
+        phash, dhash, histogram = features
+        bits = float(_HASH_SIZE * _HASH_SIZE)
+        phash_distance = np.count_nonzero(self.phash != phash, axis=1) / bits
+        dhash_distance = np.count_nonzero(self.dhash != dhash, axis=1) / bits
+        histogram_distance = 1.0 - np.minimum(self.histograms, histogram).sum(axis=1)  # 1 - intersection
+        return PHASH_WEIGHT * phash_distance + DHASH_WEIGHT * dhash_distance + HISTOGRAM_WEIGHT * histogram_distance
+
+    def nearest(self, image_bytes):
+        """Returns (best VisualMatch, all distances), or (None, None) for an empty index."""
+        if not self.images:
+            return None, None
+        distances = self.distances(compute_features(image_bytes))
+        order = np.argsort(distances)
+        best = int(order[0])
+        # The margin is measured against the closest *other* product, so a product
+        # with several near-identical reference images is not penalised.
+        runner_up = next((float(distances[i]) for i in order[1:] if self.images[i].product_id != self.images[best].product_id), 1.0)
+        item = self.images[best]
+        return VisualMatch(item.product_id, item.name, float(distances[best]), runner_up - float(distances[best])), distances
+
+
+class CatalogVisualMatcher:
+    """Lazily built, self-refreshing VisualIndex with confidence thresholds and counters."""
+
+    def __init__(self, images_provider: Callable[[], Iterable[CatalogImage]], index_path: Optional[str] = None,
+                 max_distance: float = VISUAL_MATCH_MAX_DISTANCE, min_margin: float = VISUAL_MATCH_MIN_MARGIN,
+                 recheck_interval: float = VISUAL_INDEX_RECHECK_SECS):
+        """
+        Args:
+            images_provider: Returns the current catalog reference images.
+            index_path: Optional .npz file used to persist the index between runs.
+            max_distance: Highest combined distance accepted as a match.
+            min_margin: Required distance gap to the second-closest product.
+            recheck_interval: Seconds between checks for changed reference images.
+        """
+        self._images_provider = images_provider
+        self.index_path = index_path
+        self.max_distance = max_distance
+        self.min_margin = min_margin
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._last_check = 0.0
+        self._lookups = 0
+        self._matches = 0
+        self._errors = 0
+
+    @property
+    def enabled(self):
+        return VISUAL_MATCH_ENABLED and VISUAL_MATCHING_AVAILABLE
+
+    def _load_or_build(self, images, fingerprint):
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                index = VisualIndex.load(self.index_path)
+                if index.fingerprint == fingerprint:
+                    logger.info(f"Visual index loaded from {self.index_path} ({len(index.images)} images).")
+                    return index
+            except Exception as e:
+                logger.warning(f"Visual index at {self.index_path} unreadable, rebuilding: {e}")
+        start = time.perf_counter()
+        index = VisualIndex.build(images)
+        logger.info(f"Visual index built over {len(index.images)} catalog images in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        if self.index_path:
+            try:
+                index.save(self.index_path)
+            except OSError as e:
+                logger.warning(f"Could not save visual index to {self.index_path}: {e}")
+        return index
+
+    def index(self):
+        """Returns the current VisualIndex, (re)building it if the catalog images changed."""
+        now = time.monotonic()
+        with self._lock:
+            if self._index is None or now - self._last_check >= self.recheck_interval:
+                images = list(self._images_provider())
+                fingerprint = _fingerprint(images)
+                if self._index is None or self._index.fingerprint != fingerprint:
+                    self._index = self._load_or_build(images, fingerprint)
+                self._last_check = now
+            return self._index
+
+    def match(self, image_bytes: bytes) -> Optional[VisualMatch]:
+        """Returns the matching catalog product if the match is confident, else None. Never raises."""
+        if not self.enabled or not image_bytes:
+            return None
+        start = time.perf_counter()
+        try:
+            best, _ = self.index().nearest(image_bytes)
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            logger.warning(f"Visual pre-match failed: {type(e).__name__}: {e}")
+            return None
+        confident = best is not None and best.distance <= self.max_distance and best.margin >= self.min_margin
+        with self._lock:
+            self._lookups += 1
+            if confident:
+                self._matches += 1
+        if best is not None:
+            logger.info(
+                f"Visual pre-match: nearest {best.product_id} distance={best.distance:.3f} margin={best.margin:.3f} "
+                f"{'ACCEPTED' if confident else 'rejected'} in {(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+        return best if confident else None
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "indexed_images": len(self._index.images) if self._index else 0,
+                "lookups": self._lookups,
+                "confident_matches": self._matches,
+                "match_ratio": round(self._matches / self._lookups, 4) if self._lookups else 0.0,
+                "errors": self._errors,
+                "max_distance": self.max_distance,
+                "min_margin": self.min_margin,
+            }
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="visual-match")
+
+
+async def match_async(matcher: CatalogVisualMatcher, image_bytes: bytes) -> Optional[VisualMatch]:
+    """matcher.match() off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, matcher.match, image_bytes)
+
+
+def catalog_images_from_products(products: Iterable[dict], static_root: str) -> list[CatalogImage]:
+    """Maps product dicts with a relative 'static/...' image_url to CatalogImage entries."""
+    images = []
+    for product in products:
+        image_url = product.get("image_url")
+        if not product.get("id") or not image_url or "://" in image_url:
+            continue
+        path = os.path.join(static_root, image_url.lstrip("/"))
+        if os.path.isfile(path):
+            images.append(CatalogImage(product["id"], product.get("name") or product["id"], path))
+    return images
+
+
+def catalog_images_from_backend(
+    backend_api_base_url: str,
+    static_root: str,
+    session: Optional[requests.Session] = None,
+    timeout: float = 10,
+) -> list[CatalogImage]:
+    """
+    Fetches id/name/image_url for every product from the backend API and maps
+    them to CatalogImage entries. Pass the tools' shared backend session so the
+    request gets its pooling, circuit breakers and in-process transport.
+    """
+    # Query string built by hand: requests ignores params= for inprocess:// URLs
+    url = f"{backend_api_base_url}/products?{urlencode({'fields': 'id,name,image_url'})}"
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    payload = response.json()
+    products = payload.get("items", []) if isinstance(payload, dict) else payload
+    return catalog_images_from_products(products, static_root)
@@ -28,6 +28,13 @@ from google.adk.runners import Runner
 from google.adk.agents.run_config import RunConfig
 from google.adk.agents import LiveRequestQueue
 
+# Downscales/re-encodes uploaded photos on a worker pool before they reach the model
+from customer_service.tools.image_preprocessing import prepare_image_for_model_async
+# Matches photos against the catalog's own product images before the model sees them
+from customer_service.tools import visual_matcher
+from customer_service.tools import tools as agent_tools
+from customer_service.tools.backend_client import get_backend_session
+
 if TYPE_CHECKING:
     # Import for type-hinting only to satisfy Pylance
     from google.genai.types import Part as _PartType
@@ -46,6 +53,36 @@ if os.path.exists(dotenv_path):
 else:
     logger.warning(f".env file not found at: {dotenv_path}. Relying on pre-set environment variables.")
 
+# Catalog reference images are read from the backend's static folder; the product
+# list (id, name, image_url) comes from the backend API.
+VISUAL_MATCH_STATIC_ROOT = os.environ.get(
+    "VISUAL_MATCH_STATIC_ROOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cymbal_home_garden_backend"),
+)
+catalog_visual_matcher = visual_matcher.CatalogVisualMatcher(
+    lambda: visual_matcher.catalog_images_from_backend(
+        agent_tools.BACKEND_API_BASE_URL, VISUAL_MATCH_STATIC_ROOT, session=get_backend_session()
+    ),
+    index_path=None,
+)
+
+
+async def catalog_match_part(image_bytes: bytes, session_id: str) -> Optional["_PartType"]:
+    """
+    Returns a text Part naming the catalog product shown in the photo when the
+    local visual matcher is confident, so the agent can use the SKU directly
+    instead of describing the photo and calling search_products.
+    """
+    match = await visual_matcher.match_async(catalog_visual_matcher, image_bytes)
+    if match is None:
+        return None
+    logger.info(f"[DIAG_LOG C2S {session_id}] Photo matched catalog product {match.product_id} (distance {match.distance:.3f}).")
+    return Part(text=(
+        f"[Catalog image match] The attached photo shows our product '{match.name}' (product ID: {match.product_id}). "
+        "Use this product directly; no product search is needed to identify it."
+    ))
+
+
 CUSTOMER_SERVICE_AGENT_LOADED = False
 customer_service_agent = None
 ADK_MODEL_ID = None
@@ -97,6 +134,33 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+
+@app.get("/metrics/tools")
+async def tool_metrics():
+    """Backend call health for the tools (circuit breaker state per endpoint, request coalescing, the tool result cache) and LLM rate limiting."""
+    from customer_service.shared_libraries.rate_limiter import llm_rate_limiter
+    from customer_service.shared_libraries.tool_cache import tool_result_cache
+    from customer_service.tools.async_tools import get_async_backend_client
+    from customer_service.tools.backend_client import get_backend_breakers, get_backend_session
+
+    coalescing = {}
+    for kind, client in (("sync", get_backend_session()), ("async", get_async_backend_client())):
+        if hasattr(client, "singleflight"):
+            coalescing[kind] = client.singleflight.stats()
+    return {
+        "circuit_breakers": get_backend_breakers().snapshot(),
+        "coalescing": coalescing,
+        "tool_cache": tool_result_cache.stats(),
+        "llm_rate_limit": llm_rate_limiter.stats(),
+    }
+
+
+@app.on_event("shutdown")
+async def close_backend_clients():
+    """Closes the async tools' pooled backend connections."""
+    from customer_service.tools.async_tools import close_async_backend_client
+    await close_async_backend_client()
+
 async def start_agent_session(session_id: str, is_audio: bool):
     _sas_start_time = time.perf_counter()
     logger.info(f"[DIAG_TIME] Enter start_agent_session for session_id: {session_id}, is_audio: {is_audio}")
@@ -209,19 +273,21 @@ async def agent_to_client_messaging(ws: WebSocket, events_iter: any, session_id:
                     continue
             
             # Check for cart refresh instruction
-            cart_refresh_action = None
+            cart_refresh_response = None
             if isinstance(server_content, dict) and server_content.get("action") == "refresh_cart":
-                cart_refresh_action = True
+                cart_refresh_response = server_content
             elif hasattr(server_content, 'parts') and server_content.parts and \
                  hasattr(server_content.parts[0], 'function_response') and \
                  hasattr(server_content.parts[0].function_response, 'response') and \
                  isinstance(server_content.parts[0].function_response.response, dict) and \
                  server_content.parts[0].function_response.response.get("action") == "refresh_cart":
-                cart_refresh_action = True
+                cart_refresh_response = server_content.parts[0].function_response.response
 
-            if cart_refresh_action:
+            if cart_refresh_response is not None:
                 logger.info(f"[DIAG_LOG S2C {session_id}] Handling 'refresh_cart'")
-                await ws.send_json({"type": "command", "command_name": "refresh_cart"})
+                # modify_cart returns the updated cart, so the client can redraw it without fetching it again
+                refresh_payload = {key: cart_refresh_response[key] for key in ("cart", "added_item") if cart_refresh_response.get(key)}
+                await ws.send_json({"type": "command", "command_name": "refresh_cart", "payload": refresh_payload})
                 continue
 
             # Product recommendations
@@ -465,7 +531,11 @@ async def client_to_agent_messaging(ws: WebSocket, queue_to_agent: LiveRequestQu
                     if part_mime_type.startswith("image/"):
                         try:
                             decoded_bytes = base64.b64decode(part_content_data)
-                            parts_for_adk.append(Part(inline_data=Blob(mime_type=part_mime_type, data=decoded_bytes)))
+                            model_bytes, model_mime_type = await prepare_image_for_model_async(decoded_bytes, part_mime_type)
+                            parts_for_adk.append(Part(inline_data=Blob(mime_type=model_mime_type, data=model_bytes)))
+                            match_part = await catalog_match_part(model_bytes, session_id)
+                            if match_part:
+                                parts_for_adk.append(match_part)
                         except Exception as e:
                             logger.error(f"[DIAG_LOG C2S {session_id}] Error decoding image part {i}: {e}", exc_info=True)
                             valid_parts_assembly = False; break
@@ -525,8 +595,13 @@ async def client_to_agent_messaging(ws: WebSocket, queue_to_agent: LiveRequestQu
                 elif mime_type.startswith("image/"):
                     try:
                         decoded_image_bytes = base64.b64decode(str(data))
+                        decoded_image_bytes, mime_type = await prepare_image_for_model_async(decoded_image_bytes, mime_type)
                         image_blob = Blob(data=decoded_image_bytes, mime_type=mime_type)
-                        content = Content(role="user", parts=[Part(inline_data=image_blob)])
+                        image_parts = [Part(inline_data=image_blob)]
+                        match_part = await catalog_match_part(decoded_image_bytes, session_id)
+                        if match_part:
+                            image_parts.append(match_part)
+                        content = Content(role="user", parts=image_parts)
                         if _first_client_message_sent_to_agent_time is None:
                             _first_client_message_sent_to_agent_time = time.perf_counter()
                             logger.info(f"[DIAG_TIME C2S {session_id}] Sending first image (fallback) message to agent queue. Timestamp: {_first_client_message_sent_to_agent_time:.4f}")
@@ -0,0 +1,117 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the async backend tools."""
+
+import asyncio
+import time
+import types
+
+import httpx
+import pytest
+
+from customer_service.tools import async_tools
+
+CART = {"items": [{"product_id": "SKU_1", "name": "Lavender", "quantity": 2}], "subtotal": 25.98}
+BACKEND_DELAY_SECONDS = 0.5
+AUDIO_CHUNK_SECONDS = 0.02  # One 20 ms audio frame
+
+
+async def slow_backend(request: httpx.Request) -> httpx.Response:
+    """A backend that takes BACKEND_DELAY_SECONDS to answer."""
+    await asyncio.sleep(BACKEND_DELAY_SECONDS)
+    if request.url.path.endswith("/cart/customer_1"):
+        return httpx.Response(200, json=CART)
+    return httpx.Response(404, json={"error": "Not found"})
+
+
+@pytest.fixture
+def mock_backend(monkeypatch):
+    create_client = async_tools.create_async_backend_client
+
+    def client_factory():
+        return create_client(transport=httpx.MockTransport(slow_backend))
+
+    monkeypatch.setattr(async_tools, "create_async_backend_client", client_factory)
+    monkeypatch.setattr(async_tools, "_client", None)
+
+
+def test_audio_keeps_flowing_while_a_tool_waits(mock_backend):
+    """Another session's audio pump keeps its cadence during a slow tool call."""
+
+    async def audio_session(stop: asyncio.Event) -> list[float]:
+        frame_times = []
+        while not stop.is_set():
+            frame_times.append(time.perf_counter())
+            await asyncio.sleep(AUDIO_CHUNK_SECONDS)
+        return frame_times
+
+    async def scenario():
+        stop = asyncio.Event()
+        audio_task = asyncio.create_task(audio_session(stop))
+        started = time.perf_counter()
+        cart = await async_tools.access_cart_information("customer_1")
+        tool_seconds = time.perf_counter() - started
+        stop.set()
+        return cart, tool_seconds, await audio_task
+
+    cart, tool_seconds, frame_times = asyncio.run(scenario())
+
+    assert cart == CART
+    assert tool_seconds >= BACKEND_DELAY_SECONDS
+    gaps = [b - a for a, b in zip(frame_times, frame_times[1:])]
+    # ~25 frames went out while the tool was waiting, none of them late.
+    assert len(frame_times) >= 0.8 * BACKEND_DELAY_SECONDS / AUDIO_CHUNK_SECONDS
+    assert max(gaps) < 0.1
+
+
+def test_return_shapes_match_sync_tools(mock_backend):
+    """Error responses keep the same shapes as the sync tools in tools.py."""
+
+    async def scenario():
+        return (
+            await async_tools.access_cart_information("unknown"),
+            await async_tools.get_product_recommendations([], "customer_1"),
+        )
+
+    cart, recommendations = asyncio.run(scenario())
+
+    assert cart == {"items": [], "subtotal": 0.0, "error": "Failed to retrieve cart: 404"}
+    assert recommendations == {"recommendations": []}
+
+
+def test_order_retry_reuses_its_key_and_a_new_order_gets_a_new_one(monkeypatch):
+    """Only a retry of an unsettled checkout attempt sends the same Idempotency-Key."""
+    keys = []
+
+    async def flaky_backend(request: httpx.Request) -> httpx.Response:
+        keys.append(request.headers["Idempotency-Key"])
+        if len(keys) == 1:
+            raise httpx.ConnectError("connection reset", request=request)
+        return httpx.Response(200, json={"status": "success", "message": "Order placed.", "order_id": f"ORD_{len(keys)}"})
+
+    monkeypatch.setattr(async_tools, "create_async_backend_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(flaky_backend)))
+    monkeypatch.setattr(async_tools, "_client", None)
+    tool_context = types.SimpleNamespace(state={})
+    order = ("customer_1", CART["items"], {"method": "pickup"}, 25.98)
+
+    async def scenario():
+        results = []
+        for _ in range(3):  # Lost attempt, its retry, then a deliberate second order
+            results.append(await async_tools.submit_order_and_clear_cart(*order, tool_context=tool_context))
+        return results
+
+    lost, retried, reordered = asyncio.run(scenario())
+    assert lost["message"] == "Failed to connect to order submission service."
+    assert (retried["order_id"], reordered["order_id"]) == ("ORD_2", "ORD_3")
+    assert keys[0] == keys[1] != keys[2]
@@ -0,0 +1,50 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The shared backend session retries connection errors and 5xx, but not read timeouts."""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from customer_service.tools.backend_client import create_backend_session
+
+
+def test_read_timeout_is_raised_without_retrying():
+    attempts = []
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            attempts.append(self.path)
+            time.sleep(0.5)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        session = create_backend_session(max_retries=3, backoff_factor=0)
+        started = time.perf_counter()
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            session.get(f"http://127.0.0.1:{server.server_port}/api/cart/123", timeout=0.2)
+        assert time.perf_counter() - started < 0.5
+        assert len(attempts) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,102 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The in-process transport returns exactly what the HTTP API returns."""
+
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+from customer_service.tools.backend_transport import PROJECT_ROOT, InProcessBackend
+
+LAVENDER = "SKU_PLANT_LAVENDER_001"
+MONSTERA = "SKU_PLANT_MONSTERA_D_001"
+CUSTOMER = "transport_test_customer"
+SHIPPING = {"type": "pickup_address", "address": "Cymbal Store Downtown"}
+
+# (method, path under /api, JSON body, headers), run in order against each mode
+REQUESTS = [
+    ("GET", f"/cart/{CUSTOMER}", None, {}),
+    ("POST", f"/cart/modify/{CUSTOMER}", {"items_to_add": [{"product_id": LAVENDER, "quantity": 2}, {"product_id": MONSTERA, "quantity": 1}], "items_to_remove": []}, {}),
+    ("POST", f"/cart/modify/{CUSTOMER}", {"items_to_add": [{"product_id": "NOPE", "quantity": 1}], "items_to_remove": [{"product_id": MONSTERA, "quantity": 1}]}, {}),
+    ("GET", f"/cart/{CUSTOMER}", None, {}),
+    ("GET", f"/products/{LAVENDER}", None, {}),
+    ("GET", "/products/NOPE", None, {}),
+    ("GET", f"/products/availability/{LAVENDER}/pickup", None, {}),
+    ("GET", "/products/availability/NOPE/pickup", None, {}),
+    ("POST", "/products/batch", {"ids": [LAVENDER, "NOPE", MONSTERA, LAVENDER]}, {}),
+    ("GET", f"/products/batch?ids={MONSTERA},{LAVENDER}", None, {}),
+    ("POST", "/retail/search-products", {"query": "lavender", "visitor_id": CUSTOMER}, {}),
+    ("POST", "/checkout/place_order", {"customer_id": CUSTOMER, "items": [{"product_id": LAVENDER, "quantity": 2}], "shipping_details": SHIPPING, "total_amount": 11.98}, {"Idempotency-Key": "order-1"}),
+    ("POST", "/checkout/place_order", {"customer_id": CUSTOMER, "items": [{"product_id": LAVENDER, "quantity": 2}], "shipping_details": SHIPPING, "total_amount": 11.98}, {"Idempotency-Key": "order-1"}),
+    ("POST", "/checkout/place_order", {"customer_id": CUSTOMER, "items": [{"product_id": LAVENDER, "quantity": 100000}], "shipping_details": SHIPPING, "total_amount": 1}, {}),
+    ("GET", f"/cart/{CUSTOMER}", None, {}),
+    ("GET", f"/products/availability/{LAVENDER}/pickup", None, {}),
+]
+
+
+def normalized(status_code, body):
+    """Parsed result with the per-run random order id masked."""
+    payload = json.loads(body)
+    if isinstance(payload, dict) and "order_id" in payload:
+        payload["order_id"] = "<order_id>"
+    return status_code, payload
+
+
+@pytest.fixture
+def backends(tmp_path, monkeypatch):
+    """(Flask test client over ./ecommerce.db, InProcessBackend over a copy of it)."""
+    if PROJECT_ROOT not in sys.path:
+        monkeypatch.syspath_prepend(PROJECT_ROOT)
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "benchmarks"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("IMAGE_MODEL_WARMUP", "0")
+    monkeypatch.setenv("PRODUCT_SEARCH_BACKEND", "local")
+    from bench_utils import create_benchmark_database
+
+    create_benchmark_database("ecommerce.db")
+    shutil.copy("ecommerce.db", "inprocess.db")
+
+    import app as backend_app
+    from backend_services import create_backend_services
+
+    return backend_app.app.test_client(), InProcessBackend(create_backend_services(os.path.join(tmp_path, "inprocess.db")))
+
+
+def test_inprocess_matches_http(backends):
+    client, inprocess = backends
+    for method, path, body, headers in REQUESTS:
+        http_response = client.open(f"/api{path}", method=method, json=body, headers=headers)
+        expected = normalized(http_response.status_code, http_response.data)
+        encoded_body = json.dumps(body).encode("utf-8") if body is not None else None
+        actual = normalized(*inprocess.handle(method, f"inprocess://local/api{path}", encoded_body, headers))
+        assert actual == expected, f"{method} {path}"
+
+
+def test_modify_cart_returns_updated_cart(backends):
+    client, _ = backends
+    client.post(f"/api/cart/modify/{CUSTOMER}", json={"items_to_add": [{"product_id": MONSTERA, "quantity": 2}], "items_to_remove": []})
+    modified = client.post(
+        f"/api/cart/modify/{CUSTOMER}",
+        json={"items_to_add": [{"product_id": LAVENDER, "quantity": 3}], "items_to_remove": [{"product_id": MONSTERA, "quantity": 1}]},
+    ).get_json()
+    cart = client.get(f"/api/cart/{CUSTOMER}").get_json()
+
+    assert {"items": modified["cart"]["items"], "subtotal": modified["cart"]["subtotal"]} == cart
+    assert modified["cart"]["version"] > 0
+    assert [(i["product_id"], i["quantity"]) for i in modified["added_items"]] == [(LAVENDER, 3)]
+    assert [(i["product_id"], i["quantity"]) for i in modified["removed_items"]] == [(MONSTERA, 1)]
+    assert all(i["name"] and i["image_url"] for i in modified["added_items"] + modified["removed_items"])
@@ -0,0 +1,87 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Orders and stock writes refresh only the affected products in the catalog cache."""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from customer_service.tools.backend_transport import PROJECT_ROOT
+
+LAVENDER = "SKU_PLANT_LAVENDER_001"
+TOMATO = "SKU_PLANT_TOMATO_CELEBRITY_001"
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    if PROJECT_ROOT not in sys.path:
+        monkeypatch.syspath_prepend(PROJECT_ROOT)
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "benchmarks"))
+    from backend_services import BackendServices
+    from bench_utils import create_benchmark_database
+    from catalog_cache import CatalogCache
+    from db_pool import SQLiteConnectionPool
+    from db_schema import apply_migrations
+    from product_search import LocalSearchBackend
+
+    path = str(tmp_path / "ecommerce.db")
+    create_benchmark_database(path)
+    pool = SQLiteConnectionPool(path, initializer=apply_migrations)
+    cache = CatalogCache(pool.connection, recheck_interval=0)
+    services = BackendServices(pool.connection, cache, LocalSearchBackend(cache))
+    yield path, pool, cache, services
+    pool.close()
+
+
+def test_order_updates_stock_without_reloading_the_catalog(backend):
+    _, pool, cache, services = backend
+    before = cache.snapshot()
+    tomato_entry = before.entries[TOMATO]
+    lavender_stock = before.entries[LAVENDER].detail["stock"]
+
+    with pool.connection() as conn:
+        response, status = services.place_order(conn, {
+            "customer_id": "customer_1",
+            "items": [{"product_id": LAVENDER, "quantity": 2}],
+            "shipping_details": {"address": "1 Main St"},
+            "total_amount": 11.98,
+        })
+    assert status == 201, response
+
+    after = cache.snapshot()
+    assert after.version != before.version
+    assert after.content_version == before.content_version
+    assert after.entries[LAVENDER].detail["stock"] == lavender_stock - 2
+    assert after.entries[LAVENDER].product_blob.raw != before.entries[LAVENDER].product_blob.raw
+    assert after.entries[TOMATO] is tomato_entry  # Untouched products keep their entries
+    metrics = cache.metrics()
+    assert (metrics["reloads"], metrics["stock_updates"]) == (1, 1)
+
+
+def test_other_processes_stock_writes_are_picked_up_without_a_reload(backend):
+    path, _, cache, _ = backend
+    cache.snapshot()
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE products SET stock = 3 WHERE id = ?", (TOMATO,))
+    conn.commit()
+    assert cache.get_product(TOMATO)["stock"] == 3
+    assert cache.metrics()["reloads"] == 1
+
+    conn.execute("UPDATE products SET name = 'Tomato' WHERE id = ?", (TOMATO,))
+    conn.commit()
+    conn.close()
+    assert cache.get_product(TOMATO)["name"] == "Tomato"
+    assert cache.metrics()["reloads"] == 2
@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Circuit breaker states, fail-fast tool results and hedged reads."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from customer_service.tools import async_tools
+from customer_service.tools.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+)
+
+CART_ERROR = {"items": [], "subtotal": 0.0, "error": "Failed to connect to cart service."}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_a_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("GET cart", min_calls=4, failure_rate_threshold=0.5, open_secs=10, clock=clock)
+    for failed in (False, True, False, True):
+        breaker.before_call()
+        breaker.record(0.01, failed=failed)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one probe at a time
+    breaker.record(0.01, failed=True)
+    assert breaker.state == OPEN
+
+    clock.now += 10
+    breaker.before_call()
+    breaker.record(0.01, failed=False)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["opened"] == 2
+
+
+def test_slow_calls_open_the_breaker_and_old_calls_leave_the_window():
+    clock = FakeClock()
+    breaker = CircuitBreaker("GET cart", window_secs=30, min_calls=3, slow_call_secs=2, slow_call_rate_threshold=0.6, clock=clock)
+    breaker.record(5.0, failed=False)
+    clock.now += 31  # Out of the window
+    breaker.record(5.0, failed=False)
+    breaker.record(0.1, failed=False)
+    assert breaker.state == CLOSED
+    breaker.record(5.0, failed=False)
+    assert breaker.state == OPEN
+
+
+def test_tools_fail_fast_with_their_usual_error_once_open(monkeypatch):
+    backend_calls = []
+
+    async def failing_backend(request):
+        backend_calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(503, json={"error": "Service unavailable"})
+
+    breakers = CircuitBreakerRegistry(min_calls=2, open_secs=60)
+    transport = async_tools.CircuitBreakerTransport(httpx.MockTransport(failing_backend), breakers)
+    monkeypatch.setattr(async_tools, "create_async_backend_client", lambda: httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(async_tools, "_client", None)
+
+    async def scenario():
+        for _ in range(2):
+            result = await async_tools.access_cart_information("customer_1")
+            assert result["error"] == "Failed to retrieve cart: 503"
+        started = time.perf_counter()
+        result = await async_tools.access_cart_information("customer_1")
+        return result, time.perf_counter() - started
+
+    result, seconds = asyncio.run(scenario())
+    assert result == CART_ERROR
+    assert seconds < 0.05
+    assert len(backend_calls) == 2
+    assert breakers.snapshot()["GET cart"]["state"] == OPEN
+
+
+def test_slow_read_is_hedged():
+    attempts = []
+
+    async def backend(request):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            await asyncio.sleep(1.0)  # The first attempt hits a stalled backend worker
+        return httpx.Response(200, json={"available": True, "quantity": 3, "store": "pickup"})
+
+    breakers = CircuitBreakerRegistry()
+    transport = async_tools.CircuitBreakerTransport(httpx.MockTransport(backend), breakers, hedge=True, hedge_delay_secs=0.05)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            started = time.perf_counter()
+            response = await client.get("http://backend/api/products/availability/SKU_1/pickup")
+            return response.json(), time.perf_counter() - started
+
+    payload, seconds = asyncio.run(scenario())
+    assert payload["available"] is True
+    assert seconds < 0.5
+    assert len(attempts) == 2
+    stats = breakers.snapshot()["GET product_availability"]
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
@@ -0,0 +1,67 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Malformed /api/products cursors are rejected with 400, not a server error."""
+
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+from customer_service.tools.backend_transport import PROJECT_ROOT
+
+
+def cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    if PROJECT_ROOT not in sys.path:
+        monkeypatch.syspath_prepend(PROJECT_ROOT)
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "benchmarks"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("IMAGE_MODEL_WARMUP", "0")
+    monkeypatch.setenv("PRODUCT_SEARCH_BACKEND", "local")
+    from bench_utils import create_benchmark_database
+
+    create_benchmark_database("ecommerce.db")
+    import app as backend_app
+
+    return backend_app.app.test_client()
+
+
+@pytest.mark.parametrize("sort, key", [
+    ("id", [1, 2]),
+    ("id", [None, None]),
+    ("id", ["SKU_A", 7]),
+    ("name", [["a"], "SKU_A"]),
+    ("price", ["a", "b"]),
+    ("price", [True, "SKU_A"]),
+    ("price", [{"a": 1}, "SKU_A"]),
+    ("price", [1.5, None]),
+])
+def test_cursor_with_wrong_key_types_is_a_bad_request(client, sort, key):
+    response = client.get(f"/api/products?limit=2&sort={sort}&after={cursor([sort, key])}")
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Invalid 'after' cursor."
+
+
+def test_next_cursor_still_pages_through(client):
+    for sort in ("id", "name", "price"):
+        first = client.get(f"/api/products?limit=2&sort={sort}").get_json()
+        second = client.get(f"/api/products?limit=2&sort={sort}&after={first['next_cursor']}")
+        assert second.status_code == 200
+        assert second.get_json()["items"][0]["id"] not in {item["id"] for item in first["items"]}
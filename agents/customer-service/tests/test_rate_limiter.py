@@ -0,0 +1,91 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""LLM rate limiting waits on the event loop, per user and on shared quotas."""
+
+import asyncio
+import time
+
+import pytest
+
+from customer_service.shared_libraries.rate_limiter import LlmRateLimiter
+
+MODEL = "gemini-2.0-flash"
+
+
+def test_user_over_quota_waits_without_delaying_other_users():
+    # 2 requests per 0.4s per user: the third request from "alice" waits 0.2s
+    limiter = LlmRateLimiter(user_quota=2, period_secs=0.4)
+
+    async def timed(user_id):
+        started = time.perf_counter()
+        await limiter.acquire(user_id, MODEL)
+        return time.perf_counter() - started
+
+    async def scenario():
+        await timed("alice")
+        await timed("alice")
+        alice = asyncio.ensure_future(timed("alice"))
+        await asyncio.sleep(0)
+        ticks = 0
+        while not alice.done():  # The event loop keeps running while alice waits
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return await alice, await timed("bob"), ticks
+
+    alice_wait, bob_wait, ticks = asyncio.run(scenario())
+    assert 0.15 < alice_wait < 0.4
+    assert bob_wait < 0.01
+    assert ticks >= 10
+    stats = limiter.stats()
+    assert (stats["requests"], stats["delayed"], stats["waiting"]) == (4, 1, 0)
+    assert stats["max_wait_ms"] >= 150
+
+
+def test_shared_quotas_serve_waiting_requests_in_order():
+    limiter = LlmRateLimiter(global_quota=10, model_quotas={MODEL: 1}, user_quota=None, period_secs=0.5)
+
+    async def scenario():
+        order = []
+
+        async def request(user_id):
+            await limiter.acquire(user_id, MODEL)
+            order.append(user_id)
+
+        await asyncio.gather(*(request(user_id) for user_id in ("a", "b", "c")))
+        other_model_wait = await limiter.acquire("d", "other-model")
+        return order, other_model_wait
+
+    started = time.perf_counter()
+    order, other_model_wait = asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert 0.9 < time.perf_counter() - started < 1.5  # One request per 0.5s on the model quota
+    assert other_model_wait < 0.01
+
+
+def test_cancelled_request_gives_its_tokens_back():
+    limiter = LlmRateLimiter(global_quota=1, user_quota=None, period_secs=60)
+
+    async def scenario():
+        await limiter.acquire("a", MODEL)
+        waiting = asyncio.ensure_future(limiter.acquire("b", MODEL))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["waiting"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    stats = limiter.stats()
+    assert stats["cancelled"] == 1
+    assert stats["tokens"]["global"] == pytest.approx(0.0, abs=0.01)  # Back from -1 to the first request's debt
@@ -0,0 +1,130 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Concurrent identical reads share one fetch, in threads and on an event loop."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from customer_service.tools.async_tools import CoalescingAsyncClient
+from customer_service.tools.singleflight import AsyncSingleFlight, SingleFlight
+
+CALLERS = 20
+
+
+def test_threads_share_one_call_and_its_error():
+    flight = SingleFlight()
+    executions = []
+    barrier = threading.Barrier(CALLERS)
+
+    def fetch():
+        executions.append(1)
+        time.sleep(0.2)
+        return {"available": True}
+
+    def caller(_):
+        barrier.wait()
+        return flight.do("SKU_1", fetch)
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        results = list(pool.map(caller, range(CALLERS)))
+    assert results == [{"available": True}] * CALLERS
+    assert len(executions) == 1
+    assert flight.stats()["coalesced"] == CALLERS - 1
+
+    def failing_fetch():
+        time.sleep(0.1)
+        raise ValueError("backend down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flight.do, "SKU_2", failing_fetch) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight.stats()["in_flight"] == 0  # Nothing kept once the call is over
+    assert flight.do("SKU_2", lambda: "retried") == "retried"
+
+
+def test_coroutines_share_one_call_even_if_a_waiter_is_cancelled():
+    async def run():
+        flight = AsyncSingleFlight()
+        executions = []
+
+        async def fetch():
+            executions.append(1)
+            await asyncio.sleep(0.1)
+            return "result"
+
+        first = asyncio.ensure_future(flight.do("SKU_1", fetch))
+        others = [asyncio.ensure_future(flight.do("SKU_1", fetch)) for _ in range(CALLERS - 1)]
+        await asyncio.sleep(0.01)
+        first.cancel()  # The caller that started the fetch goes away
+        assert await asyncio.gather(*others) == ["result"] * (CALLERS - 1)
+        assert len(executions) == 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_client_coalesces_identical_catalog_gets_only():
+    requests_seen = []
+
+    async def handler(request):
+        requests_seen.append((request.method, str(request.url)))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"ok": True})
+
+    async def run():
+        async with CoalescingAsyncClient(transport=httpx.MockTransport(handler)) as client:
+            url = "http://backend/api/products/availability/SKU_1/pickup"
+            responses = await asyncio.gather(*(client.get(url) for _ in range(CALLERS)))
+            assert all(r.json() == {"ok": True} for r in responses)
+            await asyncio.gather(client.get(url.replace("SKU_1", "SKU_2")), *(client.post(url) for _ in range(2)))
+            # A session's cart read must see its own writes, so it never joins another read
+            await asyncio.gather(*(client.get("http://backend/api/cart/123") for _ in range(2)))
+
+    asyncio.run(run())
+    assert len(requests_seen) == 1 + 1 + 2 + 2
+
+
+def test_client_read_after_a_write_does_not_join_an_earlier_read():
+    stock = {"quantity": 5}
+    gets = []
+
+    async def handler(request):
+        if request.method == "POST":
+            stock["quantity"] -= 1
+            return httpx.Response(201, json={"status": "success"})
+        gets.append(stock["quantity"])
+        snapshot = dict(stock)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=snapshot)
+
+    async def run():
+        async with CoalescingAsyncClient(transport=httpx.MockTransport(handler)) as client:
+            url = "http://backend/api/products/availability/SKU_1/pickup"
+            earlier_read = asyncio.ensure_future(client.get(url))
+            await asyncio.sleep(0.05)  # In flight, with the stock before the order
+            await client.post("http://backend/api/checkout/place_order", json={})
+            after_order = await client.get(url)
+            return (await earlier_read).json(), after_order.json()
+
+    earlier, after_order = asyncio.run(run())
+    assert earlier == {"quantity": 5}
+    assert after_order == {"quantity": 4}
+    assert gets == [5, 4]
@@ -0,0 +1,100 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-session tool result cache: hits, TTL expiry and invalidation by mutating tools."""
+
+from customer_service.shared_libraries.tool_cache import ToolResultCache
+
+CART_ARGS = {"customer_id": "123"}
+CART = {"items": [{"product_id": "SKU_1", "quantity": 1}], "subtotal": 5.0}
+AVAILABILITY_ARGS = {"product_id": "SKU_1", "store_id": "pickup"}
+AVAILABILITY = {"available": True, "quantity": 3, "store": "pickup"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def call(cache, session_id, call_id, tool_name, args, run):
+    """Runs one tool call the way before_tool/after_tool do; returns (response, ran)."""
+    response = cache.lookup(session_id, call_id, tool_name, args)
+    ran = response is None
+    if ran:
+        response = run()
+    cache.record(session_id, call_id, tool_name, args, response)
+    return response, ran
+
+
+def test_hits_within_ttl_and_session():
+    clock = FakeClock()
+    cache = ToolResultCache(clock=clock)
+
+    assert call(cache, "s1", "c1", "check_product_availability", AVAILABILITY_ARGS, lambda: AVAILABILITY) == (AVAILABILITY, True)
+    assert call(cache, "s1", "c2", "check_product_availability", AVAILABILITY_ARGS, lambda: AVAILABILITY) == (AVAILABILITY, False)
+    # Other sessions and other arguments are separate entries
+    assert call(cache, "s2", "c3", "check_product_availability", AVAILABILITY_ARGS, lambda: AVAILABILITY)[1] is True
+    assert call(cache, "s1", "c4", "check_product_availability", {"product_id": "SKU_2", "store_id": "pickup"}, lambda: AVAILABILITY)[1] is True
+
+    clock.now += cache.ttl_secs["check_product_availability"] + 1
+    assert call(cache, "s1", "c5", "check_product_availability", AVAILABILITY_ARGS, lambda: AVAILABILITY)[1] is True
+    assert cache.stats()["check_product_availability"] == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+
+
+def test_errors_and_unlisted_tools_are_not_cached():
+    cache = ToolResultCache()
+    error = {"available": False, "quantity": 0, "error": "Failed to connect to availability service."}
+    call(cache, "s1", "c1", "check_product_availability", AVAILABILITY_ARGS, lambda: error)
+    assert call(cache, "s1", "c2", "check_product_availability", AVAILABILITY_ARGS, lambda: error)[1] is True
+    call(cache, "s1", "c3", "send_care_instructions", {}, lambda: {"status": "success"})
+    assert call(cache, "s1", "c4", "send_care_instructions", {}, lambda: {"status": "success"})[1] is True
+
+
+def test_mutating_tools_invalidate_and_the_cart_is_never_cached():
+    cache = ToolResultCache()
+    call(cache, "s1", "c1", "check_product_availability", AVAILABILITY_ARGS, lambda: {"available": True, "quantity": 3})
+    updated_cart = {"items": [], "subtotal": 0.0, "version": 7}
+    call(cache, "s1", "c2", "modify_cart", {**CART_ARGS, "items_to_add": [], "items_to_remove": [{"product_id": "SKU_1", "quantity": 1}]},
+         lambda: {"status": "success", "items_added": False, "items_removed": True, "cart": updated_cart})
+    assert call(cache, "s1", "c3", "check_product_availability", AVAILABILITY_ARGS, lambda: {"available": True, "quantity": 3})[1] is True
+
+    # The storefront edits the cart behind the agent's back: every read goes to the backend
+    call(cache, "s1", "c4", "access_cart_information", CART_ARGS, lambda: CART)
+    assert call(cache, "s1", "c5", "access_cart_information", CART_ARGS, lambda: CART)[1] is True
+
+
+def test_read_overlapping_a_mutation_is_not_stored():
+    cache = ToolResultCache()
+    assert cache.lookup("s1", "read", "check_product_availability", AVAILABILITY_ARGS) is None
+    assert cache.lookup("s1", "write", "modify_cart", CART_ARGS) is None
+    cache.record("s1", "read", "check_product_availability", AVAILABILITY_ARGS, {"available": True, "quantity": 3})  # read from before the edit
+    cache.record("s1", "write", "modify_cart", CART_ARGS, {"status": "error"})
+    assert cache.lookup("s1", "again", "check_product_availability", AVAILABILITY_ARGS) is None
+
+
+def test_calls_that_raise_or_fail_leave_no_bookkeeping_behind():
+    cache = ToolResultCache(max_entries_per_session=4)
+    call(cache, "s1", "c1", "check_product_availability", AVAILABILITY_ARGS, lambda: {"available": True, "quantity": 3})
+    assert cache.lookup("s1", "hit", "check_product_availability", AVAILABILITY_ARGS) is not None
+    assert cache.lookup("s1", "raised", "search_products", {"query": "rake"}) is None
+    cache.forget("s1", "hit")  # What on_tool_error does when the call raises
+    cache.forget("s1", "raised")
+    call(cache, "s1", "error", "search_products", {"query": "hoe"}, lambda: {"results": [], "error": "Failed to connect."})
+    session = cache._sessions["s1"]
+    assert not session.pending and not session.served
+    for i in range(10):  # Calls that never reach record() at all stay bounded
+        cache.lookup("s1", f"lost{i}", "search_products", {"query": f"q{i}"})
+    assert len(session.pending) == 4
@@ -52,28 +52,50 @@ import sqlite3
 import logging
 import json # Added for JSON deserialization
 import time # Added for time.time()
-from flask import Flask, jsonify, request, g, render_template
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, jsonify, request, g, render_template, Response
 from werkzeug.exceptions import HTTPException # Added for specific error handling
-from google.cloud import retail_v2
-from google.api_core.exceptions import GoogleAPICallError
-from google.api_core.client_options import ClientOptions # Added for regional endpoint
-from google.auth import default as default_auth_credentials # Added for ADC logging
 import importlib.util # Required for the workaround
+from db_pool import SQLiteConnectionPool
+from db_schema import apply_migrations, read_cart_version
+from catalog_cache import CatalogCache, JsonBlob, dump_json_bytes, json_array_blob
+from backend_services import BackendServices
+from http_cache import make_etag, conditional_response, blob_response, PRODUCT_CACHE_CONTROL, CART_CACHE_CONTROL
+from pagination import SORT_KEYS, PaginationError, parse_limit, parse_fields, project, keyset_page
+from product_search import (
+    search_products_fts,
+    create_search_backend,
+    RetailSearchBackend,
+)
 
 # --- Workaround for importing from a directory with a hyphen ---
-# Define the path to the module we want to import
-module_name = "image_identifier"
-# Note: We use 'customer-service' (hyphen) here to match the actual directory name
-module_path = os.path.join(project_root, "agents", "customer-service", "customer_service", "tools", f"{module_name}.py")
-
-# Create a "module spec" from the file path
-spec = importlib.util.spec_from_file_location(module_name, module_path)
-# Create a module object from the spec
-image_identifier_module = importlib.util.module_from_spec(spec)
-# "Execute" the module to load its contents
-spec.loader.exec_module(image_identifier_module)
+def load_agent_tool_module(module_name):
+    """Loads customer_service/tools/<module_name>.py by file path and registers it in sys.modules."""
+    # Note: We use 'customer-service' (hyphen) here to match the actual directory name
+    module_path = os.path.join(project_root, "agents", "customer-service", "customer_service", "tools", f"{module_name}.py")
+
+    # Create a "module spec" from the file path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    # Create a module object from the spec
+    module = importlib.util.module_from_spec(spec)
+    # Registered before executing so tool modules can import each other by top-level name
+    sys.modules[module_name] = module
+    # "Execute" the module to load its contents
+    spec.loader.exec_module(module)
+    return module
+
+image_preprocessing_module = load_agent_tool_module("image_preprocessing") # Used by image_identifier
+image_identifier_module = load_agent_tool_module("image_identifier")
+visual_matcher_module = load_agent_tool_module("visual_matcher")
+singleflight_module = load_agent_tool_module("singleflight")
 # Now we can access the function from the loaded module object
 identify_item_in_image = image_identifier_module.identify_item_in_image
+get_image_cache_metrics = image_identifier_module.get_image_cache_metrics
+
+# Create the Vertex AI model client in the background so the first upload doesn't pay for it
+if os.environ.get("IMAGE_MODEL_WARMUP", "1").lower() not in ("0", "false", "no"):
+    threading.Thread(target=image_identifier_module.warm_up, name="image-model-warmup", daemon=True).start()
 # --- End of workaround ---
 
 app = Flask(__name__, template_folder='cymbal_home_garden_backend/templates', static_folder='cymbal_home_garden_backend/static')
@@ -81,6 +103,34 @@ app = Flask(__name__, template_folder='cymbal_home_garden_backend/templates', st
 # For now, focusing on API. Frontend files will be structured to be served from Flask's default static/template folders.
 
 DATABASE = 'ecommerce.db'
+# Pooled, WAL-mode connections (see db_pool.py). Set SQLITE_POOL_ENABLED=0 to fall back
+# to opening a fresh connection per request.
+USE_DB_POOL = os.environ.get("SQLITE_POOL_ENABLED", "1").lower() not in ("0", "false", "no")
+db_pool = SQLiteConnectionPool(DATABASE, initializer=apply_migrations)
+
+# Decoded, in-memory product catalog (see catalog_cache.py). Call
+# catalog_cache.invalidate() after any write to product data, or
+# catalog_cache.update_stock() after a write that only changed stock.
+catalog_cache = CatalogCache(db_pool.connection)
+
+# Identical availability reads arriving concurrently (e.g. many sessions asking
+# about a promoted SKU) share one SQLite query (see tools/singleflight.py).
+# The key includes the catalog version, which every stock change moves (orders
+# placed here at once, other processes' writes on the next recheck), so a read
+# arriving after a stock write never joins one started before it.
+# Catalog reads are already coalesced: a stale catalog is reloaded once under
+# the cache lock. Set READ_COALESCING_ENABLED=0 to turn this off.
+USE_READ_COALESCING = os.environ.get("READ_COALESCING_ENABLED", "1").lower() not in ("0", "false", "no")
+availability_reads = singleflight_module.SingleFlight()
+
+# Local perceptual-hash index over the catalog's reference images (see
+# tools/visual_matcher.py). Photos of our own products are matched here first,
+# without a Gemini call. Built lazily on the first upload.
+STATIC_ROOT = os.path.join(project_root, 'cymbal_home_garden_backend')
+visual_matcher = visual_matcher_module.CatalogVisualMatcher(
+    lambda: visual_matcher_module.catalog_images_from_products(catalog_cache.list_products(), STATIC_ROOT),
+    index_path=os.environ.get("VISUAL_INDEX_PATH", "visual_index.npz") or None,
+)
 
 # --- Configuration for Google Cloud Retail API ---
 # User needs to fill these in based on their GCP setup
@@ -89,6 +139,18 @@ RETAIL_API_LOCATION = os.environ.get("RETAIL_API_LOCATION", "global")          #
 RETAIL_CATALOG_ID = os.environ.get("RETAIL_CATALOG_ID", "default_catalog")   # Get from environment
 # This is the ID of the "Search" Serving Config you create in the Retail Console
 RETAIL_SERVING_CONFIG_ID = os.environ.get("RETAIL_SERVING_CONFIG_ID", "default_search") # Get from environment
+RETAIL_SEARCH_PAGE_SIZE = 10 # Or configurable
+
+# Backend for /api/retail/search-products, chosen by PRODUCT_SEARCH_BACKEND
+# ("auto" | "retail" | "local"); see product_search.py.
+search_backend = create_search_backend(
+    catalog_cache,
+    RetailSearchBackend(GCP_PROJECT_ID, RETAIL_API_LOCATION, RETAIL_CATALOG_ID, RETAIL_SERVING_CONFIG_ID,
+                        product_lookup=catalog_cache.get_products), # Names come from the live catalog
+)
+
+# Cart/catalog/order/search logic shared with the agent's in-process transport (see backend_services.py)
+backend_services = BackendServices(db_pool.connection, catalog_cache, search_backend, search_page_size=RETAIL_SEARCH_PAGE_SIZE)
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.DEBUG)
@@ -98,15 +160,21 @@ logger = logging.getLogger(__name__)
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row # Access columns by name
+        if USE_DB_POOL:
+            db = g._database = db_pool.acquire()
+        else:
+            db = g._database = sqlite3.connect(DATABASE)
+            db.row_factory = sqlite3.Row # Access columns by name
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
     db = getattr(g, '_database', None)
     if db is not None:
-        db.close()
+        if USE_DB_POOL:
+            db_pool.release(db) # Returned to the pool, not closed
+        else:
+            db.close()
 
 # --- Error Handlers ---
 @app.errorhandler(404)
@@ -143,120 +211,205 @@ def internal_error(error):
 
 # --- API Endpoints ---
 
+# === Metrics Endpoints ===
+@app.route('/api/metrics/db-pool', methods=['GET'])
+def db_pool_metrics():
+    """Returns SQLite connection pool counters."""
+    return jsonify({"enabled": USE_DB_POOL, **db_pool.metrics()})
+
+@app.route('/api/metrics/catalog-cache', methods=['GET'])
+def catalog_cache_metrics():
+    """Returns product catalog cache counters."""
+    return jsonify(catalog_cache.metrics())
+
+@app.route('/api/metrics/read-coalescing', methods=['GET'])
+def read_coalescing_metrics():
+    """Availability reads run vs. joined to an in-flight identical read."""
+    return jsonify({"enabled": USE_READ_COALESCING, "availability": availability_reads.stats()})
+
+@app.route('/api/metrics/search-cache', methods=['GET'])
+def search_cache_metrics():
+    """Search backend counters (result-cache hits/misses when the Retail backend is in use)."""
+    return jsonify(search_backend.metrics())
+
+@app.route('/api/metrics/image-cache', methods=['GET'])
+def image_cache_metrics():
+    """Image identification result cache counters (memory and disk tiers)."""
+    return jsonify(get_image_cache_metrics())
+
+@app.route('/api/metrics/visual-match', methods=['GET'])
+def visual_match_metrics():
+    """Catalog visual pre-matcher counters (lookups, confident matches)."""
+    return jsonify(visual_matcher.metrics())
+
 # === Product Endpoints (SQLite-backed) ===
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Lists all products or filters by name/category."""
+    """
+    Lists all products or filters by name/category.
+    With `q`, switches to ranked full-text search: results are ordered by bm25
+    relevance, words match as prefixes, and each product carries `search_score`
+    and a highlighted `search_snippet`. Optional: `limit` (default 50, max 200),
+    `match=any` to match any word instead of all words.
+
+    Without `q`, optional paging and projection:
+      fields=id,name,price,image_url  return only these fields
+      limit=N (max 500), after=<cursor>, sort=id|name|price (default id)
+    When `limit` or `after` is given the response is an envelope
+    {'items': [...], 'next_cursor': ..., 'total_count': ..., 'limit': ...};
+    otherwise it is the plain product list, as before.
+
+    Responses carry an ETag derived from the catalog version and the query;
+    a matching If-None-Match gets a 304 without any filtering or serialization.
+    """
     logger.info(f"Received GET request for /api/products. Query params: {request.args}")
+    etag = make_etag('products', catalog_cache.version, request.full_path)
+    if set(request.args) <= {'category'}:
+        # Plain listing (the storefront grid): one prebuilt, optionally gzipped body per catalog version
+        blob = catalog_cache.snapshot().list_blob(request.args.get('category'))
+        return blob_response(blob, etag=etag, cache_control=PRODUCT_CACHE_CONTROL)
+    return conditional_response(etag, PRODUCT_CACHE_CONTROL, _build_products_response)
+
+def _json_bytes_response(body):
+    """Response for JSON that was assembled from pre-serialized blobs."""
+    return app.response_class(body + b"\n", mimetype='application/json')
+
+def _service_response(result):
+    """Turns a backend_services (payload, status_code) result into a Flask response."""
+    payload, status_code = result
+    if isinstance(payload, JsonBlob):
+        return _json_bytes_response(payload.raw), status_code
+    return jsonify(payload), status_code
+
+def _product_list_bytes(snapshot, products):
+    """JSON array of list-shape products, joined from their pre-serialized blobs."""
+    return json_array_blob(snapshot.entries[p['id']].product_blob for p in products).raw
+
+def _build_products_response():
     query_params = request.args
     name_filter = query_params.get('name')
     category_filter = query_params.get('category')
     plant_type_filter = query_params.get('plant_type') # New filter
+    search_text = query_params.get('q')
 
-    db = get_db()
-    cursor = db.cursor()
-    
-    # Select all columns from the products table
-    query = "SELECT * FROM products" # Changed from specific columns to *
-    filters = []
-    params = []
-
-    if name_filter:
-        filters.append("name LIKE ?")
-        params.append(f"%{name_filter}%")
-    if category_filter:
-        filters.append("category = ?")
-        params.append(category_filter)
-    if plant_type_filter: # New filter condition
-        filters.append("plant_type LIKE ?") # Using LIKE for flexibility, e.g. "Perennial" vs "Perennial Shrub"
-        params.append(f"%{plant_type_filter}%")
-    
-    if filters:
-        query += " WHERE " + " AND ".join(filters)
-        
-    cursor.execute(query, params)
-    products_rows = cursor.fetchall()
-    products = []
-    for row in products_rows:
-        product_dict = dict(row)
-        # Deserialize JSON strings back into lists for relevant fields
-        for field in ['flower_color', 'flowering_season', 'pollinator_types', 
-                      'landscape_use', 'companion_plants_ids', 'recommended_soil_ids', 
-                      'recommended_fertilizer_ids', 'harvest_time']:
-            if product_dict.get(field) and isinstance(product_dict[field], str):
-                try:
-                    product_dict[field] = json.loads(product_dict[field])
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode JSON for field {field} in product {product_dict['id']}")
-                    product_dict[field] = [] # Default to empty list on error
-            elif product_dict.get(field) is None:
-                 product_dict[field] = [] # Default to empty list if field is None (for consistency in API response)
-        products.append(product_dict)
-
-    logger.info(f"Returning {len(products)} products from /api/products.")
-    return jsonify(products)
+    if search_text is not None:
+        return search_products_ranked(search_text, name_filter, category_filter, plant_type_filter)
+
+    paginate = 'limit' in query_params or 'after' in query_params
+    sort = query_params.get('sort', 'id')
+    if sort not in SORT_KEYS:
+        return jsonify({"error": "Bad Request", "message": f"'sort' must be one of: {', '.join(SORT_KEYS)}."}), 400
+
+    snapshot = catalog_cache.snapshot()
+    try:
+        fields = parse_fields(query_params.get('fields'), snapshot.field_names)
+        limit = parse_limit(query_params.get('limit')) if paginate else None
+    except PaginationError as e:
+        return jsonify({"error": "Bad Request", "message": str(e)}), 400
+
+    # Served from the decoded in-memory catalog; the category map and the
+    # sorted views used for paging are prebuilt per catalog version.
+    if paginate or 'sort' in query_params:
+        products, keys = snapshot.sorted_view(sort, SORT_KEYS[sort], category=category_filter)
+    elif category_filter is not None:
+        products, keys = snapshot.by_category.get(category_filter, []), None
+    else:
+        products, keys = snapshot.products, None
+
+    # Case-insensitive substring match, same semantics as SQLite's LIKE '%...%'
+    if name_filter or plant_type_filter:
+        name_needle = name_filter.lower() if name_filter else None
+        plant_type_needle = plant_type_filter.lower() if plant_type_filter else None # e.g. "Perennial" matches "Perennial Shrub"
+        matched = [
+            i for i, p in enumerate(products)
+            if (name_needle is None or name_needle in (p.get('name') or '').lower())
+            and (plant_type_needle is None or plant_type_needle in (p.get('plant_type') or '').lower())
+        ]
+        products = [products[i] for i in matched]
+        if keys is not None:
+            keys = [keys[i] for i in matched]
+
+    if not paginate:
+        logger.info(f"Returning {len(products)} products from /api/products.")
+        if fields is None:
+            return _json_bytes_response(_product_list_bytes(snapshot, products))
+        return jsonify(project(products, fields))
+
+    try:
+        page, next_cursor = keyset_page(products, keys, sort, limit, after=query_params.get('after'))
+    except PaginationError as e:
+        return jsonify({"error": "Bad Request", "message": str(e)}), 400
+
+    logger.info(f"Returning page of {len(page)}/{len(products)} products from /api/products (sort={sort}).")
+    envelope = {"next_cursor": next_cursor, "total_count": len(products), "limit": limit}
+    if fields is None:
+        # {"items": [...]} spliced in front of the other (sorted) envelope keys
+        return _json_bytes_response(b'{"items":' + _product_list_bytes(snapshot, page) + b',' + dump_json_bytes(envelope)[1:])
+    return jsonify({"items": project(page, fields), **envelope})
+
+def search_products_ranked(search_text, name_filter, category_filter, plant_type_filter):
+    """Ranked FTS5 search mode of /api/products."""
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Bad Request", "message": "'limit' must be an integer."}), 400
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    match_all = request.args.get('match', 'all') != 'any'
+
+    try:
+        hits = search_products_fts(
+            get_db(), search_text, limit=limit, category=category_filter,
+            name=name_filter, plant_type=plant_type_filter, match_all=match_all,
+        )
+    except sqlite3.OperationalError as e:
+        logger.error(f"Full-text search failed for q='{search_text}': {e}")
+        return jsonify({"error": "Full-text search index is not available."}), 503
+
+    results = []
+    for product_id, score, snippet in hits:
+        product = catalog_cache.get_product(product_id)
+        if product is None: # Index briefly ahead of the cache; skip rather than serve a partial row
+            continue
+        results.append({**product, 'search_score': round(score, 4), 'search_snippet': snippet})
+
+    logger.info(f"Returning {len(results)} ranked results for q='{search_text}' from /api/products.")
+    return jsonify(results)
+
+@app.route('/api/products/batch', methods=['GET', 'POST'])
+def get_products_batch():
+    """
+    Gets details for several products in one request.
+    GET  /api/products/batch?ids=SKU_A,SKU_B
+    POST /api/products/batch with JSON {"ids": ["SKU_A", "SKU_B"]}
+    Output: {'products': [<same shape as /api/products/<id>>, ...] (in request order),
+             'errors': [{'product_id': ..., 'error': ..., 'status_code': 404}, ...]}
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('ids'), list):
+            return jsonify({"error": "Invalid JSON payload. 'ids' must be a list of product IDs."}), 400
+        requested_ids = data['ids']
+    else:
+        requested_ids = [i for i in request.args.get('ids', '').split(',') if i]
+    logger.info(f"Received {request.method} request for /api/products/batch with {len(requested_ids)} ids.")
+    return _service_response(backend_services.products_batch(requested_ids))
 
 @app.route('/api/products/<string:product_id>', methods=['GET'])
 def get_product_detail(product_id):
     """Gets specific product details, including a nested 'attributes' object."""
     logger.info(f"Received GET request for /api/products/{product_id}.")
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product_row = cursor.fetchone()
+    entry = catalog_cache.get_entry(product_id)
 
-    if not product_row:
+    if not entry:
         logger.warning(f"Product {product_id} not found for GET /api/products/{product_id}.")
         return jsonify({"error": "Product not found"}), 404
 
-    product_data = dict(product_row)
-    attributes = {}
-    
-    # Define which columns from the DB should be nested under "attributes"
-    attribute_fields = [
-        'botanical_name', 'plant_type', 'mature_height_cm', 'mature_width_cm',
-        'light_requirement', 'water_needs', 'watering_frequency_notes',
-        'soil_preference', 'soil_ph_preference', 'hardiness_zone', 'flower_color',
-        'flowering_season', 'fragrance', 'fruit_bearing', 'care_level', 'pet_safe',
-        'attracts_pollinators', 'pollinator_types', 'deer_resistant', 'drought_tolerant',
-        'landscape_use', 'indoor_outdoor', 'companion_plants_ids',
-        'recommended_soil_ids', 'recommended_fertilizer_ids', 'harvest_time'
-    ]
-
-    # Populate the attributes dictionary, deserializing JSON strings where needed
-    for field in attribute_fields:
-        if field in product_data and product_data[field] is not None:
-            value = product_data[field]
-            # Fields that are stored as JSON strings in the DB
-            json_fields = [
-                'flower_color', 'flowering_season', 'pollinator_types', 'landscape_use',
-                'companion_plants_ids', 'recommended_soil_ids', 'recommended_fertilizer_ids',
-                'harvest_time'
-            ]
-            if field in json_fields and isinstance(value, str):
-                try:
-                    attributes[field] = json.loads(value)
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode JSON for field {field} in product {product_data['id']}")
-                    attributes[field] = [] # Default to empty list on error
-            else:
-                attributes[field] = value
-
-    # Construct the final response with top-level keys and the nested attributes
-    product_response = {
-        'id': product_data.get('id'),
-        'name': product_data.get('name'),
-        'description': product_data.get('description'),
-        'price': product_data.get('price'),
-        'category': product_data.get('category'),
-        'stock': product_data.get('stock'),
-        'image_url': product_data.get('image_url'),
-        'product_url': f"/products/{product_data.get('id')}",
-        'attributes': attributes # Add the nested attributes object
-    }
-
     logger.info(f"Returning structured details for product {product_id}.")
-    return jsonify(product_response)
+    # Pre-serialized (and pre-gzipped) bytes; the ETag is a content hash of them.
+    return blob_response(entry.detail_blob, etag=entry.etag, cache_control=PRODUCT_CACHE_CONTROL)
 
 @app.route('/api/products/availability/<string:product_id>/<string:store_id>', methods=['GET'])
 def check_product_availability_endpoint(product_id, store_id):
@@ -267,24 +420,12 @@ def check_product_availability_endpoint(product_id, store_id):
     Output matches ADK tool: {'available': bool, 'quantity': int, 'store': str}
     """
     logger.info(f"Received GET request for /api/products/availability/{product_id}/{store_id}.")
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
-    row = cursor.fetchone()
-    
-    if row:
-        stock_quantity = row['stock']
-        # For MVP, store_id is acknowledged but fixed response for 'store' field
-        # In a real scenario, store_id would query different inventories or locations
-        return jsonify({
-            "available": stock_quantity > 0,
-            "quantity": stock_quantity,
-            "store": f"Cymbal Home Warehouse (Queried for {store_id})" # Or simply "Cymbal Home Warehouse"
-        })
-    else:
-        logger.warning(f"Product {product_id} not found for availability check at store {store_id}.")
-        # Return the specific 404 error format observed in the logs
-        return jsonify({"error": "Product not found for availability check"}), 404
+    def read():
+        return backend_services.product_availability(get_db(), product_id, store_id)
+    if USE_READ_COALESCING:
+        key = (product_id, store_id, catalog_cache.version)
+        return _service_response(availability_reads.do(key, read))
+    return _service_response(read())
 
 # === Shopping Cart Endpoints (SQLite-backed) ===
 @app.route('/api/cart/<string:customer_id>', methods=['GET'])
@@ -295,34 +436,14 @@ def get_cart(customer_id):
     """
     logger.info(f"Received GET request for /api/cart/{customer_id}.")
     db = get_db()
-    cursor = db.cursor()
-    
-    # Join cart_items with products to get product name and price
-    cursor.execute('''
-        SELECT ci.product_id, p.name, ci.quantity, p.price 
-        FROM cart_items ci
-        JOIN products p ON ci.product_id = p.id
-        WHERE ci.customer_id = ?
-    ''', (customer_id,))
-    
-    items = []
-    subtotal = 0.0
-    for row in cursor.fetchall():
-        item_total = row['quantity'] * row['price']
-        items.append({
-            "product_id": row['product_id'],
-            "name": row['name'],
-            "quantity": row['quantity'],
-            "price_per_unit": row['price'], # Added for clarity on frontend
-            "item_total": round(item_total, 2) # Added for clarity on frontend
-        })
-        subtotal += item_total
-        
-    logger.info(f"Returning cart for customer {customer_id} with {len(items)} item types, subtotal: {subtotal:.2f}.")
-    return jsonify({
-        "items": items,
-        "subtotal": round(subtotal, 2)
-    })
+    # Cart version (bumped by triggers on cart_items) plus the catalog version,
+    # since names and prices come from the products table.
+    cart_version = read_cart_version(db, customer_id)
+    if cart_version is None: # Version tracking not set up; always build the response
+        return _service_response(backend_services.cart_contents(db, customer_id))
+    etag = make_etag('cart', customer_id, cart_version, catalog_cache.version)
+    return conditional_response(etag, CART_CACHE_CONTROL,
+                                lambda: _service_response(backend_services.cart_contents(db, customer_id)))
 
 @app.route('/api/cart/modify/<string:customer_id>', methods=['POST'])
 def modify_cart_endpoint(customer_id):
@@ -331,89 +452,13 @@ def modify_cart_endpoint(customer_id):
     Expects JSON: {'items_to_add': [{'product_id': ..., 'quantity': ...}], 
                    'items_to_remove': [{'product_id': ..., 'quantity': ...}]}
     Output matches ADK tool: {'status': ..., 'message': ..., 'items_added': bool, 'items_removed': bool}
+    plus the cart after the edit ('cart': {'items', 'subtotal', 'version'}) and display
+    details of the changed lines ('added_items' / 'removed_items': [{'product_id', 'name',
+    'image_url', 'quantity'}]), so no follow-up GET /api/cart is needed.
     """
     data = request.get_json()
     logger.info(f"Received POST request for /api/cart/modify/{customer_id}. Payload: {data}")
-    if not data:
-        logger.error(f"Invalid JSON payload for /api/cart/modify/{customer_id}.")
-        return jsonify({"error": "Invalid JSON payload"}), 400
-
-    items_to_add = data.get('items_to_add', [])
-    items_to_remove = data.get('items_to_remove', [])
-    
-    db = get_db()
-    cursor = db.cursor()
-    
-    items_added_flag = False
-    items_removed_flag = False
-
-    # Process items to add/update
-    if items_to_add:
-        for item_add in items_to_add:
-            product_id = item_add.get('product_id')
-            quantity_to_add = item_add.get('quantity', 0)
-
-            if not product_id or not isinstance(quantity_to_add, int) or quantity_to_add <= 0:
-                logger.warning(f"Invalid item to add: {item_add} for customer {customer_id}")
-                continue
-
-            # Check product stock
-            cursor.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
-            product_stock_row = cursor.fetchone()
-            if not product_stock_row or product_stock_row['stock'] < quantity_to_add:
-                logger.warning(f"Not enough stock for {product_id} or product does not exist.")
-                # Potentially return a specific error or just skip adding
-                continue
-
-            cursor.execute("SELECT id, quantity FROM cart_items WHERE customer_id = ? AND product_id = ?", (customer_id, product_id))
-            cart_item = cursor.fetchone()
-            
-            if cart_item: # Update quantity if item already in cart
-                new_quantity = cart_item['quantity'] + quantity_to_add
-                # Ensure new quantity doesn't exceed stock (though initial add check should cover this)
-                if new_quantity <= product_stock_row['stock']:
-                    cursor.execute("UPDATE cart_items SET quantity = ? WHERE id = ?", (new_quantity, cart_item['id']))
-                    items_added_flag = True
-                else:
-                    logger.warning(f"Cannot add {quantity_to_add} of {product_id}, exceeds stock for existing cart item.")
-            else: # Add new item to cart
-                cursor.execute("INSERT INTO cart_items (customer_id, product_id, quantity) VALUES (?, ?, ?)",
-                               (customer_id, product_id, quantity_to_add))
-                items_added_flag = True
-    
-    # Process items to remove/decrease quantity
-    if items_to_remove:
-        for item_rem in items_to_remove:
-            product_id = item_rem.get('product_id')
-            quantity_to_remove = item_rem.get('quantity', 0)
-
-            if not product_id or not isinstance(quantity_to_remove, int) or quantity_to_remove <= 0:
-                logger.warning(f"Invalid item to remove: {item_rem} for customer {customer_id}")
-                continue
-
-            cursor.execute("SELECT id, quantity FROM cart_items WHERE customer_id = ? AND product_id = ?", (customer_id, product_id))
-            cart_item = cursor.fetchone()
-
-            if cart_item:
-                if quantity_to_remove >= cart_item['quantity']: # Remove item completely
-                    cursor.execute("DELETE FROM cart_items WHERE id = ?", (cart_item['id'],))
-                else: # Decrease quantity
-                    new_quantity = cart_item['quantity'] - quantity_to_remove
-                    cursor.execute("UPDATE cart_items SET quantity = ? WHERE id = ?", (new_quantity, cart_item['id']))
-                items_removed_flag = True
-    
-    db.commit()
-    
-    message = "Cart updated."
-    if not items_added_flag and not items_removed_flag:
-        message = "No changes made to the cart (items might be out of stock or invalid)."
-    logger.info(f"Cart modification for customer {customer_id} completed. Message: {message}, Added: {items_added_flag}, Removed: {items_removed_flag}")
-    return jsonify({
-        "status": "success", 
-        "message": message,
-        "items_added": items_added_flag,
-        "items_removed": items_removed_flag
-    })
+    return _service_response(backend_services.modify_cart(get_db(), customer_id, data))
 
 @app.route('/api/cart/<string:customer_id>/item', methods=['POST'])
 def add_or_update_cart_item(customer_id):
@@ -463,7 +508,9 @@ def add_or_update_cart_item(customer_id):
             # Item does not exist, add new with the given quantity
             if requested_quantity_increase > current_stock:
                 return jsonify({"error": f"Not enough stock for {product_id}. Available: {current_stock}, Requested: {requested_quantity_increase}"}), 400
-            cursor.execute("INSERT INTO cart_items (customer_id, product_id, quantity) VALUES (?, ?, ?)",
+            # UPSERT: a concurrent add of the same product merges into one line
+            cursor.execute("INSERT INTO cart_items (customer_id, product_id, quantity) VALUES (?, ?, ?) "
+                           "ON CONFLICT (customer_id, product_id) DO UPDATE SET quantity = cart_items.quantity + excluded.quantity",
                            (customer_id, product_id, requested_quantity_increase))
             message = f"Product {product_id} added to cart with quantity {requested_quantity_increase}."
     elif quantity <= 0: # Quantity is 0 or negative, remove item or reduce (though DELETE endpoint is better for full removal)
@@ -518,8 +565,11 @@ def clear_customer_cart(customer_id):
 @app.route('/api/checkout/place_order', methods=['POST'])
 def place_order():
     """
-    Simulates placing an order.
+    Places an order: reserves stock for every line, records the order and clears the cart.
     Expects JSON: { "customer_id": "...", "items": [...], "shipping_details": {...}, "total_amount": ... }
+    Optional idempotency key via the 'Idempotency-Key' header (or "idempotency_key" in the body):
+    repeating a request with the same key returns the original order (200) instead of a new one (201).
+    409 with 'unavailable_items' if any line is out of stock; nothing is reserved in that case.
     """
     data = request.get_json(silent=True) # Use silent=True to prevent it from raising its own 400 error for malformed JSON
     if data is None: # Check if data is None (malformed JSON or wrong content type)
@@ -528,34 +578,10 @@ def place_order():
             return jsonify({"error": "Bad Request", "message": "Invalid JSON payload provided."}), 400
         return jsonify({"error": "Bad Request", "message": "Invalid JSON payload or missing Content-Type: application/json."}), 400
 
-    customer_id = data.get('customer_id')
-    items = data.get('items')
-    shipping_details = data.get('shipping_details')
-    total_amount = data.get('total_amount')
-
-    if not all([customer_id, items, shipping_details, total_amount is not None]):
-        return jsonify({"error": "Missing required fields for order (customer_id, items, shipping_details, total_amount)"}), 400
-
-    logger.info(f"Simulating order placement for customer_id: {customer_id}")
-    logger.info(f"Order Items: {json.dumps(items, indent=2)}")
-    logger.info(f"Shipping Details: {json.dumps(shipping_details, indent=2)}")
-    logger.info(f"Total Amount: {total_amount}")
-
-    # Simulate clearing the cart for this customer after order placement
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("DELETE FROM cart_items WHERE customer_id = ?", (customer_id,))
-    db.commit()
-    logger.info(f"Cart cleared for customer {customer_id} after simulated order placement.")
-
-    # In a real app, you'd save the order to a new 'orders' table,
-    # interact with payment gateways, trigger shipping processes, etc.
-    
-    return jsonify({
-        "status": "success",
-        "message": "Order placed successfully (Simulated). Thank you for your purchase!",
-        "order_id": f"SIM_{time.time()}" # Generate a pseudo-unique simulated order ID
-    }), 201 # 201 Created is often used for successful resource creation
+    # Client-supplied key so that retries (e.g. by the agent) never place the order twice
+    idempotency_key = request.headers.get('Idempotency-Key')
+    # Reserves stock, records the order and clears the cart in one transaction (see orders.py)
+    return _service_response(backend_services.place_order(get_db(), data, idempotency_key=idempotency_key))
 
 # === Phase 4: Conceptual Order Submission Endpoint ===
 @app.route('/api/orders/place_order', methods=['POST'])
@@ -598,6 +624,37 @@ def conceptual_place_order():
 
 
 # === Image Identification Endpoint ===
+def _identify_image(image_bytes, original_filename):
+    """
+    Identifies one uploaded image and returns (response payload, status code).
+    A confident match against a catalog reference image answers with the SKU
+    directly; otherwise the image goes to the model (through the result cache).
+    """
+    logger.info(f"Processing image '{original_filename}' for identification.")
+
+    visual_match = visual_matcher.match(image_bytes)
+    if visual_match:
+        logger.info(f"Image '{original_filename}' matched catalog product {visual_match.product_id} "
+                    f"(distance {visual_match.distance:.3f}); skipping model call.")
+        return {
+            "identified_item": visual_match.name,
+            "product_id": visual_match.product_id,
+            "match_source": "catalog_image",
+            "match_distance": round(visual_match.distance, 4),
+        }, 200
+
+    identified_item_name = identify_item_in_image(image_bytes, original_filename)
+
+    if identified_item_name.startswith("Error:"):
+        logger.error(f"Image identification failed: {identified_item_name}")
+        # Return a more generic error to the client for API key issues
+        if "API Key not configured" in identified_item_name:
+            return {"error": "Image identification service error."}, 500
+        return {"error": identified_item_name}, 500 # Or 422 if it's a processing error like bad MIME
+
+    logger.info(f"Identified item: '{identified_item_name}' from image '{original_filename}'.")
+    return {"identified_item": identified_item_name}, 200
+
 @app.route('/api/identify-image', methods=['POST'])
 def identify_image_endpoint():
     """
@@ -617,21 +674,8 @@ def identify_image_endpoint():
     if file:
         try:
             image_bytes = file.read()
-            original_filename = file.filename
-            logger.info(f"Processing image '{original_filename}' for identification.")
-            
-            identified_item_name = identify_item_in_image(image_bytes, original_filename)
-            
-            if identified_item_name.startswith("Error:"):
-                logger.error(f"Image identification failed: {identified_item_name}")
-                # Return a more generic error to the client for API key issues
-                if "API Key not configured" in identified_item_name:
-                     return jsonify({"error": "Image identification service error."}), 500
-                return jsonify({"error": identified_item_name}), 500 # Or 422 if it's a processing error like bad MIME
-
-            logger.info(f"Identified item: '{identified_item_name}' from image '{original_filename}'.")
-            return jsonify({"identified_item": identified_item_name}), 200
-            
+            payload, status_code = _identify_image(image_bytes, file.filename)
+            return jsonify(payload), status_code
         except Exception as e:
             logger.error(f"Unexpected error during image identification: {e}", exc_info=True)
             return jsonify({"error": "An unexpected error occurred during image processing."}), 500
@@ -639,127 +683,137 @@ def identify_image_endpoint():
     return jsonify({"error": "Image processing failed for an unknown reason."}), 500
 
 
-# === Vertex AI Search for commerce API Endpoint ===
-@app.route('/api/retail/search-products', methods=['POST'])
-def retail_search_products():
-    """
-    Queries Google Cloud Retail API for product recommendations.
-    Expects JSON: {"query": "search_term", "visitor_id": "id"}
-    Output matches ADK tool: {'recommendations': [{'product_id': ..., 'name': ..., 'description': ...}, ...]}
-    """
+# Multi-image identification: images are identified concurrently on a bounded
+# pool shared by all batch requests, and results stream back as NDJSON.
+#
+# The Vertex AI SDK offers no per-call timeout, so an image that times out is
+# only abandoned: its thread keeps waiting for the model call to return. To keep
+# such stragglers from starving later batches, at most IMAGE_BATCH_WORKERS images
+# are identified at once (a semaphore slot each), and a timed-out image hands its
+# slot back immediately. The pool has IMAGE_BATCH_STRAGGLER_THREADS extra threads
+# to carry abandoned calls until they finish; only more stragglers than that
+# reduce the batch throughput.
+IMAGE_BATCH_MAX_FILES = int(os.environ.get("IMAGE_BATCH_MAX_FILES", "20"))
+IMAGE_BATCH_WORKERS = int(os.environ.get("IMAGE_BATCH_WORKERS", "4"))
+IMAGE_BATCH_STRAGGLER_THREADS = int(os.environ.get("IMAGE_BATCH_STRAGGLER_THREADS", str(IMAGE_BATCH_WORKERS)))
+IMAGE_BATCH_TIMEOUT_SECS = float(os.environ.get("IMAGE_BATCH_TIMEOUT_SECS", "30"))
+image_batch_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_BATCH_WORKERS + IMAGE_BATCH_STRAGGLER_THREADS, thread_name_prefix="image-batch"
+)
+image_batch_slots = threading.Semaphore(IMAGE_BATCH_WORKERS)
+image_batch_slots_lock = threading.Lock()
+
+
+def _release_batch_slot(index, released):
+    """Hands an image's slot back exactly once: when it finishes or when it times out, whichever is first."""
+    with image_batch_slots_lock:
+        if index in released:
+            return
+        released.add(index)
+    image_batch_slots.release()
+
+
+def _identify_batch_item(index, filename, image_bytes, started_at, released):
+    image_batch_slots.acquire()
+    started_at[index] = time.monotonic() # The per-image timeout counts from here, not from queueing
     try:
-        credentials, project_id_adc = default_auth_credentials() # project_id_adc to avoid conflict with GCP_PROJECT_ID
-        logger.info(f"ADC using credentials: {credentials}")
-        if hasattr(credentials, 'service_account_email'):
-            logger.info(f"ADC Service Account Email: {credentials.service_account_email}")
-        else:
-            logger.info(f"ADC is likely using user credentials (gcloud auth application-default login). Active project for ADC: {project_id_adc}")
+        return _identify_image(image_bytes, filename)
     except Exception as e:
-        logger.error(f"Error getting ADC: {e}")
+        logger.error(f"Unexpected error identifying batch image '{filename}': {e}", exc_info=True)
+        return {"error": "An unexpected error occurred during image processing."}, 500
+    finally:
+        _release_batch_slot(index, released)
 
-    # Simplified check: if project ID is still the placeholder, assume not configured.
-    # This allows using "default_catalog" and "default_search" if they are actual live IDs.
-    if GCP_PROJECT_ID == "your-gcp-project-id":
-        logger.error("Retail API not configured. GCP_PROJECT_ID is still set to placeholder 'your-gcp-project-id' in app.py.")
-        return jsonify({
-            "error": "Retail API not configured on the server (Project ID not set).",
-            "recommendations": []
-        }), 503 # Service Unavailable
 
-    data = request.get_json()
-    if not data or 'query' not in data or 'visitor_id' not in data:
-        return jsonify({"error": "Invalid JSON payload. 'query' and 'visitor_id' are required."}), 400
+def _ndjson_line(obj):
+    return dump_json_bytes(obj) + b"\n"
 
-    search_query = data['query']
-    visitor_id = data['visitor_id']
-    
-    # Construct the placement string for the Retail API
-    placement = (
-        f"projects/{GCP_PROJECT_ID}/locations/{RETAIL_API_LOCATION}/" 
-        f"catalogs/{RETAIL_CATALOG_ID}/servingConfigs/{RETAIL_SERVING_CONFIG_ID}"
-    )
-
-    #client_options = ClientOptions(api_endpoint=f"{RETAIL_API_LOCATION}-retail.googleapis.com")
-    search_client = retail_v2.SearchServiceClient()
-    
-    # Construct the full path for the default branch
-    # default_branch_name = search_client.branch_path(
-    #     GCP_PROJECT_ID, RETAIL_API_LOCATION, RETAIL_CATALOG_ID, "0"  # "0" is the default branch ID
-    # )
-
-    search_request = retail_v2.SearchRequest(
-        placement=placement,
-        # branch=default_branch_name, # Explicitly set the branch - REMOVING TO TEST
-        query=search_query,
-        visitor_id=visitor_id,
-        page_size=10 # Or configurable
-    )
-    
-    recommendations = []
-    try:
-        logger.info(f"Sending search request to Retail API: {search_request}")
-        search_response = search_client.search(request=search_request)
-        logger.info(f"Received search response from Retail API: {search_response}")
-        logger.info(f"Received search response from Retail API. Results count: {len(search_response.results)}")
-        
-        for result in search_response.results:
-            product = result.product
-            product_id_from_api = result.id # product.id is the fully qualified name
-            
-            # Find the product name from SAMPLE_PRODUCTS using product_id_from_api
-            product_name_from_sample = "Unknown Product" # Default if not found
-            # The following import and list comprehension should ideally be outside the loop or optimized
-            # For simplicity in this diff, it's here. Consider moving SAMPLE_PRODUCTS to a more accessible place if not already.
-            from sample_data_importer import SAMPLE_PRODUCTS
-            found_product_sample = next((p for p in SAMPLE_PRODUCTS if p["id"] == product_id_from_api), None)
-            if found_product_sample:
-                product_name_from_sample = found_product_sample["name"]
-
-            recommendations.append({
-                "product_id": product_id_from_api, # Use the ID directly from the result
-                "name": product_name_from_sample, # Use the name looked up from sample data
-                "description": product.description if hasattr(product, 'description') and product.description else "No description available.",
-            })
-            
-    except GoogleAPICallError as e:
-        logger.error(f"Retail API call failed: {e}")
-        return jsonify({"error": "Failed to query Retail API.", "details": str(e)}), 500
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during Retail API search: {e}")
-        return jsonify({"error": "An unexpected error occurred during search."}), 500
 
-    return jsonify({"recommendations": recommendations})
+@app.route('/api/identify-image/batch', methods=['POST'])
+def identify_image_batch_endpoint():
+    """
+    Identifies several uploaded images concurrently.
+    Expects multipart/form-data with one or more files under the key 'images'
+    (or 'image'). Responds with application/x-ndjson: one line per image, in
+    completion order, as soon as it is identified:
+      {"index": 0, "filename": "...", "status": "ok"|"error"|"timeout", "elapsed_ms": ..., ...}
+    ("ok" lines carry the /api/identify-image fields, the others an "error"),
+    followed by a final {"done": true, "count": N, "elapsed_ms": ...} line.
+    """
+    files = [f for f in request.files.getlist('images') + request.files.getlist('image') if f.filename]
+    if not files:
+        return jsonify({"error": "No image files provided in the 'images' field."}), 400
+    if len(files) > IMAGE_BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many images; at most {IMAGE_BATCH_MAX_FILES} per request."}), 400
+
+    # Read every upload now: the request (and its file streams) is gone once streaming starts.
+    uploads = [(f.filename, f.read()) for f in files]
+    logger.info(f"Batch identification of {len(uploads)} images.")
+    batch_start = time.monotonic()
+    started_at = {}
+    released = set() # Indexes whose slot was handed back
+    futures = {
+        image_batch_executor.submit(_identify_batch_item, index, filename, image_bytes, started_at, released): (index, filename)
+        for index, (filename, image_bytes) in enumerate(uploads)
+    }
+
+    def generate():
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED) # Short wait so timeouts are reported promptly
+                for future in done:
+                    index, filename = futures[future]
+                    payload, status_code = future.result()
+                    line = {"index": index, "filename": filename, "status": "ok" if status_code == 200 else "error"}
+                    line.update(payload)
+                    line["elapsed_ms"] = round((time.monotonic() - started_at[index]) * 1000, 1)
+                    yield _ndjson_line(line)
+                now = time.monotonic()
+                for future in list(pending):
+                    index, filename = futures[future]
+                    if index in started_at and now - started_at[index] > IMAGE_BATCH_TIMEOUT_SECS:
+                        # The model call can't be interrupted: free its slot for the next image
+                        # and discard its late result.
+                        pending.discard(future)
+                        _release_batch_slot(index, released)
+                        logger.warning(f"Batch image '{filename}' timed out after {IMAGE_BATCH_TIMEOUT_SECS}s.")
+                        yield _ndjson_line({
+                            "index": index, "filename": filename, "status": "timeout",
+                            "error": f"Identification timed out after {IMAGE_BATCH_TIMEOUT_SECS:g} seconds.",
+                            "elapsed_ms": round((now - started_at[index]) * 1000, 1),
+                        })
+            yield _ndjson_line({"done": True, "count": len(futures),
+                                "elapsed_ms": round((time.monotonic() - batch_start) * 1000, 1)})
+        finally:
+            for future in pending: # Client went away: don't spend the pool on images nobody will read
+                future.cancel()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-store'})
+
+
+# === Product Search Endpoint (Vertex AI Search for commerce or local index) ===
+@app.route('/api/retail/search-products', methods=['POST'])
+def retail_search_products():
+    """
+    Searches products through the configured search backend (Google Cloud Retail API
+    or the local BM25 index, see PRODUCT_SEARCH_BACKEND).
+    Expects JSON: {"query": "search_term", "visitor_id": "id"}
+    Output matches ADK tool: {'recommendations': [{'product_id': ..., 'name': ..., 'description': ...}, ...]}
+    """
+    # The body is only parsed once a backend is configured (503 otherwise, whatever the payload)
+    data = request.get_json() if search_backend.is_configured() else None
+    return _service_response(backend_services.search_products(data))
 
 # === Product Detail Page Route ===
 @app.route('/products/<string:product_id>')
 def product_detail_page(product_id):
     """Serves the product detail page for a given product ID."""
     logger.info(f"Received GET request for product detail page /products/{product_id}.")
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product_row = cursor.fetchone()
-
-    if product_row:
-        product_data = dict(product_row)
-        # Deserialize JSON strings back into lists for relevant fields
-        for field in ['flower_color', 'flowering_season', 'pollinator_types', 
-                      'landscape_use', 'companion_plants_ids', 'recommended_soil_ids', 
-                      'recommended_fertilizer_ids', 'harvest_time', 'attributes']: # Added 'attributes'
-            if product_data.get(field) and isinstance(product_data[field], str):
-                try:
-                    product_data[field] = json.loads(product_data[field])
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode JSON for field {field} in product {product_data['id']}")
-                    # Decide on default: empty list or keep as is, or None
-                    product_data[field] = product_data[field] if isinstance(product_data[field], dict) else [] 
-            elif product_data.get(field) is None and field != 'attributes': # attributes can be None
-                 product_data[field] = []
-        
-        # Ensure attributes is a dict if it's None or empty list after potential deserialization
-        if not isinstance(product_data.get('attributes'), dict):
-            product_data['attributes'] = {}
+    entry = catalog_cache.get_entry(product_id)
 
+    if entry:
+        product_data = entry.page
         logger.info(f"Rendering product_detail.html for product {product_id}.")
         return render_template('product_detail.html', product=product_data)
     else:
@@ -797,4 +851,8 @@ if __name__ == '__main__':
     # ├── app.py
     # ... (other backend files)
     
+    # HTTP/1.1 so the agent tools' pooled session can keep connections alive
+    # (the development server defaults to HTTP/1.0 and closes every connection).
+    from werkzeug.serving import WSGIRequestHandler
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     app.run(debug=True, host='127.0.0.1', port=5000)
@@ -0,0 +1,367 @@
+# cymbal_home_garden_backend/backend_services.py
+"""
+Data-access services behind the endpoints that the agent tools call: cart,
+cart modification, availability, product batch/detail, search and checkout.
+
+Every service returns `(payload, status_code)`, where the payload is a
+JSON-serializable object or a pre-serialized `JsonBlob`. The Flask routes in
+app.py wrap these results in HTTP responses. The agent's in-process transport
+(customer_service/tools/backend_transport.py) calls the same services directly
+when the agent runs next to the database. Both paths therefore always return
+the same results.
+
+Request parsing (malformed JSON, headers) and HTTP caching (ETags) are left to
+the callers.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+
+from catalog_cache import CatalogCache, JsonBlob, dump_json_bytes, json_array_blob
+from db_schema import read_cart_version
+from orders import (
+    place_order as place_order_transaction,
+    InvalidOrderError,
+    InsufficientStockError,
+    IdempotencyKeyReusedError,
+)
+from product_search import SearchBackendError, SearchBackendNotConfigured
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_IDS = 100
+SEARCH_PAGE_SIZE = 10
+
+# Set-based cart mutations used by modify_cart (run with executemany).
+# Relies on the unique (customer_id, product_id) index created by db_schema.py.
+CART_ADD_UPSERT_SQL = '''
+    INSERT INTO cart_items (customer_id, product_id, quantity)
+    SELECT ?, p.id, ? FROM products p WHERE p.id = ? AND p.stock >= ?
+    ON CONFLICT (customer_id, product_id) DO UPDATE
+        SET quantity = cart_items.quantity + excluded.quantity
+        WHERE cart_items.quantity + excluded.quantity <= (SELECT stock FROM products WHERE id = excluded.product_id)
+'''
+CART_REMOVE_LINE_SQL = "DELETE FROM cart_items WHERE customer_id = ? AND product_id = ? AND quantity <= ?"
+CART_DECREASE_LINE_SQL = "UPDATE cart_items SET quantity = quantity - ? WHERE customer_id = ? AND product_id = ? AND quantity > ?"
+
+
+class BackendServices:
+    """The services, bound to one catalog cache and search backend."""
+
+    def __init__(self, connection_factory, catalog_cache, search_backend, search_page_size=SEARCH_PAGE_SIZE):
+        """
+        Args:
+            connection_factory: Zero-arg callable returning a context manager that
+                yields a SQLite connection (e.g. `SQLiteConnectionPool.connection`).
+                Used by callers that don't already hold a connection.
+            catalog_cache: The process's CatalogCache.
+            search_backend: The process's SearchBackend (see product_search.py).
+            search_page_size: Results returned by search_products.
+        """
+        self.connection = connection_factory
+        self.catalog_cache = catalog_cache
+        self.search_backend = search_backend
+        self.search_page_size = search_page_size
+
+    # --- Products ---
+    def products_batch(self, requested_ids):
+        """
+        Details for several products, in request order:
+        {'products': [<same shape as /api/products/<id>>, ...],
+         'errors': [{'product_id': ..., 'error': ..., 'status_code': 404}, ...]}
+        """
+        if not requested_ids:
+            return {"error": "At least one product ID is required in 'ids'."}, 400
+        if len(requested_ids) > BATCH_MAX_IDS:
+            return {"error": f"Too many product IDs; at most {BATCH_MAX_IDS} per request."}, 400
+
+        # Served from the catalog cache (itself loaded by a single query).
+        snapshot = self.catalog_cache.snapshot()
+        products = []
+        errors = []
+        seen = set()
+        for product_id in requested_ids:
+            if not isinstance(product_id, str):
+                errors.append({"product_id": product_id, "error": "Product ID must be a string", "status_code": 400})
+                continue
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            entry = snapshot.entries.get(product_id)
+            if entry is None:
+                errors.append({"product_id": product_id, "error": "Product not found", "status_code": 404})
+            else:
+                products.append(entry.detail_blob)
+
+        logger.info(f"Returning {len(products)} products and {len(errors)} errors for a batch of {len(requested_ids)} ids.")
+        return JsonBlob(
+            b'{"errors":' + dump_json_bytes(errors) + b',"products":' + json_array_blob(products).raw + b'}'
+        ), 200
+
+    def product_detail(self, product_id):
+        """The /api/products/<id> response (pre-serialized), or a 404."""
+        entry = self.catalog_cache.get_entry(product_id)
+        if not entry:
+            logger.warning(f"Product {product_id} not found.")
+            return {"error": "Product not found"}, 404
+        return entry.detail_blob, 200
+
+    def product_availability(self, conn, product_id, store_id):
+        """
+        Product stock from SQLite: {'available': bool, 'quantity': int, 'store': str}.
+        `store_id` is echoed back but otherwise ignored (single inventory source).
+        """
+        row = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()
+        if not row:
+            logger.warning(f"Product {product_id} not found for availability check at store {store_id}.")
+            return {"error": "Product not found for availability check"}, 404
+        stock_quantity = row['stock']
+        return {
+            "available": stock_quantity > 0,
+            "quantity": stock_quantity,
+            "store": f"Cymbal Home Warehouse (Queried for {store_id})"
+        }, 200
+
+    def search_products(self, data):
+        """Search through the configured backend: {'recommendations': [...]}."""
+        if not self.search_backend.is_configured():
+            logger.error(f"Search backend '{self.search_backend.name}' not configured. GCP_PROJECT_ID is still set to a placeholder.")
+            return {
+                "error": "Retail API not configured on the server (Project ID not set).",
+                "recommendations": []
+            }, 503
+
+        if not data or 'query' not in data or 'visitor_id' not in data:
+            return {"error": "Invalid JSON payload. 'query' and 'visitor_id' are required."}, 400
+
+        try:
+            recommendations = self.search_backend.search(data['query'], data['visitor_id'], page_size=self.search_page_size)
+        except SearchBackendNotConfigured as e:
+            return {"error": e.message, "recommendations": []}, 503
+        except SearchBackendError as e:
+            error_body = {"error": e.message}
+            if e.details:
+                error_body["details"] = e.details
+            return error_body, 500
+        return {"recommendations": recommendations}, 200
+
+    # --- Cart ---
+    def cart_contents(self, conn, customer_id):
+        """{'items': [{'product_id', 'name', 'quantity', 'price_per_unit', 'item_total'}, ...], 'subtotal': ...}"""
+        items, subtotal = self._cart_lines(conn, customer_id)
+        logger.info(f"Returning cart for customer {customer_id} with {len(items)} item types, subtotal: {subtotal:.2f}.")
+        return {"items": items, "subtotal": subtotal}, 200
+
+    def _cart_lines(self, conn, customer_id):
+        """The cart lines (with product name and price) and their rounded subtotal."""
+        # Join cart_items with products to get product name and price
+        rows = conn.execute('''
+            SELECT ci.product_id, p.name, ci.quantity, p.price
+            FROM cart_items ci
+            JOIN products p ON ci.product_id = p.id
+            WHERE ci.customer_id = ?
+        ''', (customer_id,)).fetchall()
+
+        items = []
+        subtotal = 0.0
+        for row in rows:
+            item_total = row['quantity'] * row['price']
+            items.append({
+                "product_id": row['product_id'],
+                "name": row['name'],
+                "quantity": row['quantity'],
+                "price_per_unit": row['price'],
+                "item_total": round(item_total, 2)
+            })
+            subtotal += item_total
+        return items, round(subtotal, 2)
+
+    def _line_changes(self, before, after):
+        """
+        Display details for the lines whose quantity changed, given the cart's
+        {product_id: quantity} before and after an edit:
+        ([{'product_id', 'name', 'image_url', 'quantity'}, ...] added,  same for removed),
+        where 'quantity' is the amount added or removed.
+        """
+        deltas = {
+            product_id: after.get(product_id, 0) - before.get(product_id, 0)
+            for product_id in sorted(before.keys() | after.keys())
+        }
+        changed = [product_id for product_id, delta in deltas.items() if delta]
+        products = self.catalog_cache.get_products(changed)
+        added, removed = [], []
+        for product_id in changed:
+            product = products.get(product_id, {})
+            details = {
+                "product_id": product_id,
+                "name": product.get("name"),
+                "image_url": product.get("image_url"),
+                "quantity": abs(deltas[product_id]),
+            }
+            (added if deltas[product_id] > 0 else removed).append(details)
+        return added, removed
+
+    def modify_cart(self, conn, customer_id, data):
+        """
+        Adds and/or removes cart items in one write transaction.
+        `data`: {'items_to_add': [{'product_id', 'quantity'}], 'items_to_remove': [{'product_id', 'quantity'}]}
+        Returns {'status', 'message', 'items_added': bool, 'items_removed': bool,
+                 'cart': {'items', 'subtotal', 'version'},   # the cart after the edit, as GET /api/cart plus its version
+                 'added_items': [...], 'removed_items': [...]}  # see _line_changes
+        so callers can update their cart view without another request.
+        """
+        if not data:
+            logger.error(f"Invalid JSON payload for cart modification of customer {customer_id}.")
+            return {"error": "Invalid JSON payload"}, 400
+
+        items_to_add = data.get('items_to_add', [])
+        items_to_remove = data.get('items_to_remove', [])
+
+        # Validate up front; invalid entries are skipped, as before.
+        add_rows = []
+        for item_add in items_to_add or []:
+            product_id = item_add.get('product_id')
+            quantity_to_add = item_add.get('quantity', 0)
+            if not product_id or not isinstance(quantity_to_add, int) or quantity_to_add <= 0:
+                logger.warning(f"Invalid item to add: {item_add} for customer {customer_id}")
+                continue
+            add_rows.append((customer_id, quantity_to_add, product_id, quantity_to_add))
+
+        remove_quantities = {} # product_id -> total quantity to remove (repeats are summed)
+        for item_rem in items_to_remove or []:
+            product_id = item_rem.get('product_id')
+            quantity_to_remove = item_rem.get('quantity', 0)
+            if not product_id or not isinstance(quantity_to_remove, int) or quantity_to_remove <= 0:
+                logger.warning(f"Invalid item to remove: {item_rem} for customer {customer_id}")
+                continue
+            remove_quantities[product_id] = remove_quantities.get(product_id, 0) + quantity_to_remove
+        remove_rows = [(customer_id, product_id, quantity) for product_id, quantity in remove_quantities.items()]
+
+        items_added_flag = False
+        items_removed_flag = False
+
+        # One write transaction for the whole edit. BEGIN IMMEDIATE takes the write
+        # lock up front, so the stock checks below cannot race another writer, and
+        # the cart read back at the end is exactly the state this edit produced.
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            quantities_sql = "SELECT product_id, quantity FROM cart_items WHERE customer_id = ?"
+            before = dict(conn.execute(quantities_sql, (customer_id,)).fetchall())
+            if add_rows:
+                # Adds only if the product exists with enough stock; an existing line is
+                # only increased if the new total still fits the stock.
+                cursor = conn.executemany(CART_ADD_UPSERT_SQL, add_rows)
+                items_added_flag = cursor.rowcount > 0
+                if cursor.rowcount < len(add_rows):
+                    logger.warning(f"Some items were not added for customer {customer_id} (not enough stock or product does not exist).")
+            if remove_rows:
+                # Lines removed in full first, then the remaining lines are decreased.
+                deleted = conn.executemany(CART_REMOVE_LINE_SQL, remove_rows).rowcount
+                decreased = conn.executemany(
+                    CART_DECREASE_LINE_SQL,
+                    [(quantity, customer_id, product_id, quantity) for customer_id, product_id, quantity in remove_rows],
+                ).rowcount
+                items_removed_flag = (deleted + decreased) > 0
+            after = dict(conn.execute(quantities_sql, (customer_id,)).fetchall())
+            cart_items, cart_subtotal = self._cart_lines(conn, customer_id)
+            cart_version = read_cart_version(conn, customer_id)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Cart modification for customer {customer_id} failed and was rolled back: {e}")
+            return {"error": "Cart update failed. Please try again."}, 500
+
+        message = "Cart updated."
+        if not items_added_flag and not items_removed_flag:
+            message = "No changes made to the cart (items might be out of stock or invalid)."
+        logger.info(f"Cart modification for customer {customer_id} completed. Message: {message}, Added: {items_added_flag}, Removed: {items_removed_flag}")
+        added_items, removed_items = self._line_changes(before, after)
+        return {
+            "status": "success",
+            "message": message,
+            "items_added": items_added_flag,
+            "items_removed": items_removed_flag,
+            "cart": {"items": cart_items, "subtotal": cart_subtotal, "version": cart_version},
+            "added_items": added_items,
+            "removed_items": removed_items,
+        }, 200
+
+    # --- Checkout ---
+    def place_order(self, conn, data, idempotency_key=None):
+        """
+        Reserves stock, records the order and clears the cart (see orders.py).
+        201 for a new order, 200 for a replayed idempotency key, 409 with
+        'unavailable_items' if any line is out of stock.
+        """
+        customer_id = data.get('customer_id')
+        items = data.get('items')
+        shipping_details = data.get('shipping_details')
+        total_amount = data.get('total_amount')
+
+        if not all([customer_id, items, shipping_details, total_amount is not None]):
+            return {"error": "Missing required fields for order (customer_id, items, shipping_details, total_amount)"}, 400
+
+        idempotency_key = idempotency_key or data.get('idempotency_key')
+
+        logger.info(f"Placing order for customer_id: {customer_id} (idempotency key: {idempotency_key})")
+        logger.info(f"Order Items: {json.dumps(items, indent=2)}")
+        logger.info(f"Shipping Details: {json.dumps(shipping_details, indent=2)}")
+        logger.info(f"Total Amount: {total_amount}")
+
+        try:
+            order_response, created = place_order_transaction(
+                conn, customer_id, items, shipping_details,
+                client_total_amount=total_amount, idempotency_key=idempotency_key,
+            )
+        except InsufficientStockError as e:
+            logger.warning(f"Order for customer {customer_id} rejected: {e.message} {e.details}")
+            return {"status": "error", "error": "Insufficient stock", "message": e.message, "unavailable_items": e.details}, 409
+        except IdempotencyKeyReusedError as e:
+            return {"status": "error", "error": "Unprocessable Entity", "message": e.message}, 422
+        except InvalidOrderError as e:
+            return {"status": "error", "error": "Bad Request", "message": e.message}, 400
+        except sqlite3.Error as e:
+            logger.error(f"Order placement for customer {customer_id} failed: {e}")
+            return {"status": "error", "error": "Internal Server Error", "message": "Order could not be placed. Please try again."}, 500
+
+        if created:
+            # Only stock changed: refresh those products instead of reloading the catalog
+            self.catalog_cache.update_stock(conn, [item.get('product_id') for item in items if isinstance(item, dict)])
+            logger.info(f"Cart cleared for customer {customer_id} after order {order_response['order_id']}.")
+        return order_response, 201 if created else 200
+
+
+def encode_payload(payload):
+    """Response body bytes for a service payload, identical to what the Flask routes send."""
+    if isinstance(payload, JsonBlob):
+        return payload.body
+    return dump_json_bytes(payload) + b"\n"
+
+
+def create_backend_services(database):
+    """
+    Builds standalone services over `database` (own connection pool, catalog
+    cache and search backend), for processes other than the Flask app, such as
+    the agent in in-process mode. Search is configured from the same
+    environment variables as app.py.
+    """
+    from db_pool import SQLiteConnectionPool
+    from db_schema import apply_migrations
+    from product_search import RetailSearchBackend, create_search_backend
+
+    db_pool = SQLiteConnectionPool(database, initializer=apply_migrations)
+    catalog_cache = CatalogCache(db_pool.connection)
+    search_backend = create_search_backend(
+        catalog_cache,
+        RetailSearchBackend(
+            os.environ.get("GCP_PROJECT_ID", "your-project-id"),
+            os.environ.get("RETAIL_API_LOCATION", "global"),
+            os.environ.get("RETAIL_CATALOG_ID", "default_catalog"),
+            os.environ.get("RETAIL_SERVING_CONFIG_ID", "default_search"),
+            product_lookup=catalog_cache.get_products,
+        ),
+    )
+    logger.info(f"backend_services: created in-process services over {database}.")
+    return BackendServices(db_pool.connection, catalog_cache, search_backend)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_cart_concurrency.py
+"""
+Hammers a single cart with concurrent `/api/cart/modify/<id>` requests and
+checks that the cart ends up consistent: one line per product, quantities
+equal to the sum of the accepted adds minus removes, and never above stock.
+
+Usage:
+    python benchmarks/bench_cart_concurrency.py [--requests 2000] [--threads 16]
+"""
+
+import argparse
+import os
+import sys
+import sqlite3
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+CUSTOMER_ID = "bench_shared_cart"
+PRODUCT_IDS = [p["id"] for p in bench_utils.SAMPLE_PRODUCTS[:6]]
+
+
+def build_payload(rng):
+    """A typical agent edit: add one or two products, sometimes remove one."""
+    payload = {"items_to_add": [
+        {"product_id": pid, "quantity": rng.randint(1, 3)} for pid in rng.sample(PRODUCT_IDS, rng.randint(1, 2))
+    ]}
+    if rng.random() < 0.3:
+        payload["items_to_remove"] = [{"product_id": rng.choice(PRODUCT_IDS), "quantity": 1}]
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_cart_concurrency_")
+    db_path = os.path.join(workdir, "ecommerce.db")
+    bench_utils.create_benchmark_database(db_path)
+    backend_app = bench_utils.import_app_quietly()
+    backend_app.app.test_client().get("/api/products") # Open the pool and apply migrations
+
+    per_thread = max(1, args.requests // args.threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = backend_app.app.test_client()
+        latencies = []
+        statuses = Counter()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            response = client.post(f"/api/cart/modify/{CUSTOMER_ID}", json=build_payload(rng))
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+        return latencies, statuses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for thread_latencies, _ in results for l in thread_latencies)
+    statuses = sum((thread_statuses for _, thread_statuses in results), Counter())
+    total = per_thread * args.threads
+    print(f"{total} cart edits from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms")
+    print(f"status codes: {dict(statuses)}")
+
+    # Consistency checks against the database itself
+    conn = sqlite3.connect(db_path)
+    lines = conn.execute(
+        "SELECT ci.product_id, COUNT(*), SUM(ci.quantity), p.stock FROM cart_items ci "
+        "JOIN products p ON p.id = ci.product_id WHERE ci.customer_id = ? GROUP BY ci.product_id",
+        (CUSTOMER_ID,),
+    ).fetchall()
+    conn.close()
+    duplicates = [row[0] for row in lines if row[1] > 1]
+    over_stock = [row[0] for row in lines if row[2] > row[3]]
+    for product_id, _, quantity, stock in lines:
+        print(f"  {product_id:<36} quantity {quantity:>5} / stock {stock}")
+    print(f"duplicate lines: {duplicates or 'none'}; lines over stock: {over_stock or 'none'}")
+    print("\nPool metrics:", backend_app.db_pool.metrics())
+    if duplicates or over_stock or set(statuses) - {200}:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_checkout_oversell.py
+"""
+Stress test for checkout: many threads try to buy the same low-stock product
+at once, and a share of the requests are retries of an earlier request with
+the same Idempotency-Key. It verifies that:
+  * stock never goes negative and is only reduced by the quantity of
+    the orders that were actually created,
+  * retries return the original order instead of creating a new one.
+
+Usage:
+    python benchmarks/bench_checkout_oversell.py [--stock 25] [--buyers 200] [--threads 32]
+"""
+
+import argparse
+import os
+import sys
+import sqlite3
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+PRODUCT_ID = "SKU_PLANT_MONSTERA_D_001"
+SHIPPING = {"type": "home_delivery", "address": "1 Bench Street"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stock", type=int, default=25)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--retry-ratio", type=float, default=0.3, help="share of buyers that resend their request")
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_checkout_oversell_")
+    db_path = os.path.join(workdir, "ecommerce.db")
+    bench_utils.create_benchmark_database(db_path)
+    backend_app = bench_utils.import_app_quietly()
+    backend_app.app.test_client().get("/api/products") # Open the pool and apply migrations
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE products SET stock = ? WHERE id = ?", (args.stock, PRODUCT_ID))
+    conn.commit()
+    conn.close()
+
+    def buyer(index):
+        rng = random.Random(index)
+        client = backend_app.app.test_client()
+        customer_id = f"bench_buyer_{index}"
+        quantity = rng.randint(1, 2)
+        payload = {
+            "customer_id": customer_id,
+            "items": [{"product_id": PRODUCT_ID, "quantity": quantity}],
+            "shipping_details": SHIPPING,
+            "total_amount": 0,
+        }
+        headers = {"Idempotency-Key": f"bench-{index}"}
+        attempts = 2 if rng.random() < args.retry_ratio else 1
+        results = []
+        for _ in range(attempts):
+            response = client.post("/api/checkout/place_order", json=payload, headers=headers)
+            body = response.get_json()
+            results.append((response.status_code, body.get("order_id"), quantity))
+        return results
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        per_buyer = list(pool.map(buyer, range(args.buyers)))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(status for results in per_buyer for status, _, _ in results)
+    created_orders = {order_id: quantity for results in per_buyer for status, order_id, quantity in results if status == 201}
+    inconsistent_retries = [
+        results for results in per_buyer
+        if len(results) == 2 and results[0][0] == 201 and (results[1][0] != 200 or results[1][1] != results[0][1])
+    ]
+
+    conn = sqlite3.connect(db_path)
+    final_stock = conn.execute("SELECT stock FROM products WHERE id = ?", (PRODUCT_ID,)).fetchone()[0]
+    db_orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    db_quantity = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = ?", (PRODUCT_ID,)).fetchone()[0]
+    conn.close()
+
+    sold = sum(created_orders.values())
+    print(f"{sum(statuses.values())} checkout requests from {args.buyers} buyers / {args.threads} threads in {elapsed:.2f}s")
+    print(f"status codes: {dict(statuses)}")
+    print(f"initial stock {args.stock}, sold {sold} in {len(created_orders)} orders, final stock {final_stock}")
+    print(f"orders table: {db_orders} orders, {db_quantity} units")
+
+    failures = []
+    if final_stock < 0:
+        failures.append("stock went negative")
+    if args.stock - final_stock != sold or db_quantity != sold or db_orders != len(created_orders):
+        failures.append("stock movement does not match the orders created")
+    if inconsistent_retries:
+        failures.append(f"{len(inconsistent_retries)} retries did not replay the original order")
+    if set(statuses) - {200, 201, 409}:
+        failures.append("unexpected status codes")
+    print("RESULT:", "OK - no overselling, retries were idempotent" if not failures else "FAILED - " + "; ".join(failures))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
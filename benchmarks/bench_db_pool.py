@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_db_pool.py
+"""
+Compares requests/sec of the pooled WAL-mode SQLite connections against the
+old connect-per-request behaviour on `/api/products` and `/api/cart/<id>`.
+
+Usage:
+    python benchmarks/bench_db_pool.py [--requests 2000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+CUSTOMER_ID = "bench_customer"
+
+
+def run_sequential(backend_app, url, iterations):
+    client = backend_app.app.test_client()
+    _, per_call_ms = bench_utils.time_calls(lambda: client.get(url), iterations)
+    return 1000.0 / per_call_ms
+
+
+def run_concurrent(backend_app, url, iterations, threads):
+    per_thread = max(1, iterations // threads)
+
+    def worker(_):
+        client = backend_app.app.test_client()
+        for _ in range(per_thread):
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_db_pool_")
+    bench_utils.create_benchmark_database(os.path.join(workdir, "ecommerce.db"))
+    backend_app = bench_utils.import_app_quietly()
+
+    # Seed a cart so /api/cart/<id> runs its join.
+    client = backend_app.app.test_client()
+    for product in bench_utils.SAMPLE_PRODUCTS[:5]:
+        client.post(f"/api/cart/{CUSTOMER_ID}/item", json={"product_id": product["id"], "quantity": 1})
+
+    urls = ["/api/products", f"/api/cart/{CUSTOMER_ID}"]
+    print(f"{'endpoint':<28}{'mode':<22}{'sequential req/s':>18}{'concurrent req/s':>20}")
+    for url in urls:
+        for use_pool in (False, True):
+            backend_app.USE_DB_POOL = use_pool
+            mode = "pooled (WAL)" if use_pool else "connect-per-request"
+            sequential = run_sequential(backend_app, url, args.requests)
+            concurrent = run_concurrent(backend_app, url, args.requests, args.threads)
+            print(f"{url:<28}{mode:<22}{sequential:>18.1f}{concurrent:>20.1f}")
+
+    print("\nPool metrics:", backend_app.db_pool.metrics())
+
+
+if __name__ == "__main__":
+    main()
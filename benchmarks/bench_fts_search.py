@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_fts_search.py
+"""
+Measures product search latency on a large synthetic catalog: the old
+`name LIKE '%term%'` full-table scan versus the ranked FTS5 query used by
+`/api/products?q=...`.
+
+Usage:
+    python benchmarks/bench_fts_search.py [--products 100000] [--repeat 20]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+from db_schema import apply_migrations  # noqa: E402
+from product_search import search_products_fts  # noqa: E402
+
+SEARCH_TERMS = ["lavender", "golden", "orch", "variegated ivy", "tomato"]
+
+
+def like_scan(conn, term):
+    # What /api/products?name=...&plant_type=... used to run
+    pattern = f"%{term}%"
+    return conn.execute(
+        "SELECT * FROM products WHERE name LIKE ? OR plant_type LIKE ?", (pattern, pattern)
+    ).fetchall()
+
+
+def fts_ranked(conn, term, limit):
+    return search_products_fts(conn, term, limit=limit)
+
+
+def measure(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_fts_")
+    db_path = os.path.join(workdir, "ecommerce.db")
+    print(f"Building catalog with {args.products} synthetic products...")
+    bench_utils.create_benchmark_database(db_path, synthetic_products=args.products)
+
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    apply_migrations(conn)
+    print(f"FTS5 index built in {time.perf_counter() - start:.2f}s\n")
+
+    print(f"{'term':<18}{'LIKE scan ms':>14}{'rows':>8}{'FTS5 top-%d ms' % args.limit:>16}{'rows':>8}{'speedup':>10}")
+    for term in SEARCH_TERMS:
+        like_ms, like_rows = measure(lambda: like_scan(conn, term), args.repeat)
+        fts_ms, fts_rows = measure(lambda: fts_ranked(conn, term, args.limit), args.repeat)
+        print(f"{term:<18}{like_ms:>14.2f}{like_rows:>8}{fts_ms:>16.2f}{fts_rows:>8}{like_ms / fts_ms:>9.1f}x")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
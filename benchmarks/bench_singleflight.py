@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_singleflight.py
+"""
+Load test for request coalescing: many agent sessions ask about the same
+promoted SKU at the same moment. Each round, every session calls
+check_product_availability and get_product_recommendations for it at once.
+That is modelled with threads released by a barrier for the sync tools, and
+with asyncio.gather for the async tools.
+
+It runs each scenario twice against a local Flask instance on a real port:
+  * without coalescing (plain session/client, READ_COALESCING_ENABLED off),
+  * with the single-flight session/client on the tool side and coalesced
+    availability reads in Flask.
+It reports the HTTP requests that reached the backend, the availability
+queries that ran on SQLite, and the backend request rate.
+
+Usage:
+    python benchmarks/bench_singleflight.py [--sessions 200] [--rounds 10]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+sys.path.insert(0, os.path.join(bench_utils.PROJECT_ROOT, "agents", "customer-service"))
+
+PROMOTED_SKU = "SKU_PLANT_LAVENDER_001"
+CUSTOMER_ID = "bench_customer"
+
+
+def count_backend_traffic(backend_app):
+    """Counts requests reaching Flask and availability queries run on SQLite."""
+    counts = Counter()
+    lock = threading.Lock()
+
+    @backend_app.app.before_request
+    def count_request():
+        with lock:
+            counts["http_requests"] += 1
+
+    services = backend_app.backend_services
+    product_availability = services.product_availability
+
+    def counted_product_availability(*args, **kwargs):
+        with lock:
+            counts["availability_queries"] += 1
+        return product_availability(*args, **kwargs)
+
+    services.product_availability = counted_product_availability
+    return counts
+
+
+def run_sync(tools, sessions, rounds):
+    """Each session is a thread; a barrier releases all sessions' calls together every round."""
+    barrier = threading.Barrier(sessions)
+
+    def session(_):
+        for _ in range(rounds):
+            barrier.wait()
+            tools.check_product_availability(PROMOTED_SKU, "pickup")
+            tools.get_product_recommendations([PROMOTED_SKU], CUSTOMER_ID)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_async(async_tools, sessions, rounds):
+    async def one_session():
+        await async_tools.check_product_availability(PROMOTED_SKU, "pickup")
+        await async_tools.get_product_recommendations([PROMOTED_SKU], CUSTOMER_ID)
+
+    async def main():
+        for _ in range(rounds):
+            await asyncio.gather(*(one_session() for _ in range(sessions)))
+        await async_tools.get_async_backend_client().aclose()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200, help="concurrent sessions asking about the SKU")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_singleflight_")
+    bench_utils.create_benchmark_database(os.path.join(workdir, "ecommerce.db"))
+    backend_app = bench_utils.import_app_quietly()
+    counts = count_backend_traffic(backend_app)
+    base_url = bench_utils.serve_app_in_thread(backend_app.app)
+
+    import httpx
+    from customer_service.tools import async_tools, backend_client, tools
+    tools.BACKEND_API_BASE_URL = async_tools.BACKEND_API_BASE_URL = f"{base_url}/api"
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+
+    tool_calls = args.sessions * args.rounds * 2
+    print(f"{args.sessions} sessions x {args.rounds} rounds x 2 tool calls = {tool_calls} tool calls per run, backend at {base_url}")
+    print(f"{'tools':<6} {'coalescing':<11} {'HTTP reqs':>10} {'SQLite reads':>13} {'wall s':>8} {'backend req/s':>14}")
+    for tools_kind in ("sync", "async"):
+        for coalesce in (False, True):
+            backend_app.USE_READ_COALESCING = coalesce
+            if tools_kind == "sync":
+                session = backend_client.create_backend_session(pool_maxsize=args.sessions, coalesce_gets=coalesce)
+                tools.get_backend_session = lambda: session
+                run = lambda: run_sync(tools, args.sessions, args.rounds)  # noqa: E731
+            else:
+                client_class = async_tools.CoalescingAsyncClient if coalesce else httpx.AsyncClient
+                holder = {}
+
+                def get_client(client_class=client_class, holder=holder):
+                    if "client" not in holder:  # Created on the benchmark's event loop
+                        holder["client"] = client_class(limits=limits)
+                    return holder["client"]
+
+                async_tools.get_async_backend_client = get_client
+                run = lambda: run_async(async_tools, args.sessions, args.rounds)  # noqa: E731
+
+            tools.check_product_availability(PROMOTED_SKU, "pickup")  # Warm-up (catalog cache load)
+            counts.clear()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            http_requests, availability_queries = counts["http_requests"], counts["availability_queries"]
+            print(f"{tools_kind:<6} {'on' if coalesce else 'off':<11} {http_requests:>10} {availability_queries:>13} "
+                  f"{elapsed:8.2f} {http_requests / elapsed:14.0f}")
+
+
+if __name__ == "__main__":
+    main()
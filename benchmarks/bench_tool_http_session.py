@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# cymbal_home_garden_backend/benchmarks/bench_tool_http_session.py
+"""
+Per-call latency of the agent's backend tools with bare `requests.get/post`
+(a new TCP connection per call) and with the shared keep-alive session from
+customer_service/tools/backend_client.py. The tool functions are called
+unchanged against a local Flask instance listening on a real port.
+
+Usage:
+    python benchmarks/bench_tool_http_session.py [--calls 300] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_utils  # noqa: E402
+
+sys.path.insert(0, os.path.join(bench_utils.PROJECT_ROOT, "agents", "customer-service"))
+
+CUSTOMER_ID = "bench_customer"
+PRODUCT_IDS = ["SKU_PLANT_LAVENDER_001", "SKU_PLANT_TOMATO_CELEBRITY_001", "SKU_TOOL_TROWEL_ERGO_001"]
+
+
+def tool_calls(tools):
+    return [
+        ("access_cart_information", lambda: tools.access_cart_information(CUSTOMER_ID)),
+        ("check_product_availability", lambda: tools.check_product_availability(PRODUCT_IDS[0], "store_1")),
+        ("get_product_recommendations", lambda: tools.get_product_recommendations(PRODUCT_IDS, CUSTOMER_ID)),
+    ]
+
+
+def measure(fn, calls, threads):
+    """Returns per-call latencies in ms, with `threads` callers running concurrently."""
+    per_thread = max(1, calls // threads)
+
+    def worker(_):
+        latencies = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return [ms for latencies in pool.map(worker, range(threads)) for ms in latencies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="calls per tool and mode")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = bench_utils.enter_temp_workdir("bench_tool_http_session_")
+    bench_utils.create_benchmark_database(os.path.join(workdir, "ecommerce.db"))
+    backend_app = bench_utils.import_app_quietly()
+    base_url = bench_utils.serve_app_in_thread(backend_app.app)
+
+    from customer_service.tools import backend_client, tools
+    tools.BACKEND_API_BASE_URL = f"{base_url}/api"
+    pooled = backend_client.get_backend_session
+    modes = [
+        ("new connection per call", lambda: requests), # requests.get/post: what the tools did before
+        ("shared keep-alive session", pooled),
+    ]
+
+    print(f"{args.calls} calls per tool, {args.threads} concurrent callers, backend at {base_url}")
+    print(f"{'tool':<30} {'mode':<27} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, fn in tool_calls(tools):
+        for mode, session_factory in modes:
+            tools.get_backend_session = session_factory
+            fn() # Warm-up (catalog cache load, first connection)
+            latencies = sorted(measure(fn, args.calls, args.threads))
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{name:<30} {mode:<27} {statistics.mean(latencies):8.2f} {statistics.median(latencies):8.2f} {p95:8.2f}")
+    tools.get_backend_session = pooled
+
+
+if __name__ == "__main__":
+    main()
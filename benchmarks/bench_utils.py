@@ -0,0 +1,130 @@
+# cymbal_home_garden_backend/benchmarks/bench_utils.py
+"""
+Shared helpers for the backend benchmark scripts.
+
+Each benchmark runs against a throwaway copy of the catalog in a temporary
+directory so that it never touches the real `ecommerce.db`.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sample_data_importer import SAMPLE_PRODUCTS  # noqa: E402
+
+
+def product_columns():
+    """Union of all product keys used by the sample catalog, in first-seen order."""
+    columns = []
+    for product in SAMPLE_PRODUCTS:
+        for key in product:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def create_benchmark_database(path, synthetic_products=0):
+    """
+    Creates a products/cart_items database at `path` filled with the sample
+    catalog plus `synthetic_products` generated rows.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    columns = product_columns()
+    conn = sqlite3.connect(path)
+    column_defs = ", ".join(f"{c} TEXT PRIMARY KEY" if c == "id" else c for c in columns)
+    conn.execute(f"CREATE TABLE products ({column_defs})")
+    conn.execute(
+        "CREATE TABLE cart_items (id INTEGER PRIMARY KEY AUTOINCREMENT, customer_id TEXT NOT NULL, "
+        "product_id TEXT NOT NULL, quantity INTEGER NOT NULL, FOREIGN KEY(product_id) REFERENCES products(id))"
+    )
+    for product in SAMPLE_PRODUCTS:
+        keys = list(product.keys())
+        conn.execute(
+            f"INSERT INTO products ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))}) ON CONFLICT(id) DO NOTHING",
+            [product[k] for k in keys],
+        )
+    if synthetic_products:
+        conn.executemany(
+            "INSERT INTO products (id, name, category, description, price, stock, botanical_name, plant_type, landscape_use) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            synthetic_product_rows(synthetic_products),
+        )
+    conn.commit()
+    conn.close()
+
+
+_WORDS = ["lavender", "tomato", "fern", "rose", "basil", "mint", "sage", "pepper", "maple", "oak",
+          "hosta", "tulip", "daisy", "aster", "cactus", "ivy", "lily", "orchid", "peony", "thyme"]
+_ADJECTIVES = ["dwarf", "giant", "purple", "golden", "climbing", "variegated", "fragrant", "hardy", "compact", "wild"]
+_TYPES = ["Perennial", "Annual", "Shrub", "Houseplant", "Vegetable (Annual)", "Herb", "Succulent", "Tree"]
+_USES = ['["Border", "Container"]', '["Hedge"]', '["Rock Garden", "Mass Planting"]', '["Herb Garden"]']
+
+
+def synthetic_product_rows(count):
+    """Deterministic synthetic catalog rows for large-catalog benchmarks."""
+    rows = []
+    for i in range(count):
+        word = _WORDS[i % len(_WORDS)]
+        adjective = _ADJECTIVES[(i // len(_WORDS)) % len(_ADJECTIVES)]
+        rows.append((
+            f"SKU_SYN_{i:06d}",
+            f"{adjective.title()} {word.title()} #{i}",
+            "Plants",
+            f"A {adjective} {word} cultivar, item {i}, suitable for most gardens.",
+            round(2 + (i % 50) * 0.5, 2),
+            100 + i % 50,
+            f"Genus{word} species{i % 97}",
+            _TYPES[i % len(_TYPES)],
+            _USES[i % len(_USES)],
+        ))
+    return rows
+
+
+def enter_temp_workdir(prefix):
+    """chdir into a fresh temporary directory and return its path."""
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    return workdir
+
+
+def import_app_quietly():
+    """Imports the Flask app with its debug prints and request logging silenced."""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend_app
+    logging.disable(logging.WARNING)
+    return backend_app
+
+
+def time_calls(fn, iterations):
+    """Runs fn() `iterations` times and returns (total_seconds, per_call_ms)."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed / iterations * 1000
+
+
+def serve_app_in_thread(flask_app):
+    """
+    Serves the app on a real local TCP port (threaded werkzeug server speaking
+    HTTP/1.1, like app.py's __main__) and returns its base URL.
+    """
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveRequestHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True, request_handler=KeepAliveRequestHandler)
+    threading.Thread(target=server.serve_forever, name="bench-http-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,403 @@
+# cymbal_home_garden_backend/catalog_cache.py
+"""
+Process-wide cache of the product catalog.
+
+The whole `products` table is loaded with a single query, every JSON-encoded
+list column is decoded once, and the results are kept as ready-to-serve dicts
+keyed by product id together with prebuilt secondary maps (by category). Hot
+catalog reads are then plain dict lookups with no SQLite or JSON work.
+
+Each product's list and detail representations are also kept as JSON bytes,
+serialized on first use and then reused until the catalog changes, so the hot
+endpoints write out prebuilt bytes instead of re-running `jsonify`.
+
+Freshness is driven by version counters:
+  * `invalidate()` bumps a local version; the app calls it after any write it
+    makes to product data, so its own changes are visible immediately.
+  * `catalog_meta.catalog_version` (maintained by triggers, see db_schema.py)
+    moves on every product change from any process, e.g. the importer. It is
+    polled at most once every `recheck_interval` seconds.
+
+Stock is handled separately, since every order changes it. `update_stock()`
+re-reads the stock of the given products and replaces only their entries; the
+app calls it after an order. Stock changes made by other processes move
+`catalog_meta.stock_version`, and the poll then re-reads the stock column
+alone. Neither path reloads the catalog or re-serializes unchanged products.
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+import logging
+
+from db_schema import read_catalog_version, read_stock_version
+
+logger = logging.getLogger(__name__)
+
+# Product columns stored as JSON-encoded lists in SQLite
+JSON_LIST_FIELDS = [
+    'flower_color', 'flowering_season', 'pollinator_types', 'landscape_use',
+    'companion_plants_ids', 'recommended_soil_ids', 'recommended_fertilizer_ids',
+    'harvest_time',
+]
+
+# Columns nested under "attributes" in the product detail response
+ATTRIBUTE_FIELDS = [
+    'botanical_name', 'plant_type', 'mature_height_cm', 'mature_width_cm',
+    'light_requirement', 'water_needs', 'watering_frequency_notes',
+    'soil_preference', 'soil_ph_preference', 'hardiness_zone', 'flower_color',
+    'flowering_season', 'fragrance', 'fruit_bearing', 'care_level', 'pet_safe',
+    'attracts_pollinators', 'pollinator_types', 'deer_resistant', 'drought_tolerant',
+    'landscape_use', 'indoor_outdoor', 'companion_plants_ids',
+    'recommended_soil_ids', 'recommended_fertilizer_ids', 'harvest_time'
+]
+
+# Gzip level for pre-compressed response bodies
+JSON_BLOB_GZIP_LEVEL = 6
+
+DEFAULT_RECHECK_INTERVAL_SECS = float(os.environ.get("CATALOG_CACHE_RECHECK_SECS", "2.0"))
+
+
+def _decode_json_list(value, field, product_id):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        logger.warning(f"Could not decode JSON for field {field} in product {product_id}")
+        return [] # Default to empty list on error
+
+
+def decode_product_row(row):
+    """
+    Converts a raw `products` row into the list-endpoint shape: JSON list fields are
+    decoded, and missing ones default to [] for a consistent API response.
+    """
+    product = dict(row)
+    for field in JSON_LIST_FIELDS:
+        value = product.get(field)
+        if value and isinstance(value, str):
+            product[field] = _decode_json_list(value, field, product.get('id'))
+        elif value is None:
+            product[field] = []
+    return product
+
+
+def build_product_detail(raw_product):
+    """Builds the `/api/products/<id>` response shape, with a nested 'attributes' object."""
+    attributes = {}
+    for field in ATTRIBUTE_FIELDS:
+        value = raw_product.get(field)
+        if value is None:
+            continue
+        if field in JSON_LIST_FIELDS and isinstance(value, str):
+            attributes[field] = _decode_json_list(value, field, raw_product.get('id'))
+        else:
+            attributes[field] = value
+
+    return {
+        'id': raw_product.get('id'),
+        'name': raw_product.get('name'),
+        'description': raw_product.get('description'),
+        'price': raw_product.get('price'),
+        'category': raw_product.get('category'),
+        'stock': raw_product.get('stock'),
+        'image_url': raw_product.get('image_url'),
+        'product_url': f"/products/{raw_product.get('id')}",
+        'attributes': attributes,
+    }
+
+
+def build_product_page_context(product):
+    """Template context for the product detail page (list shape plus an 'attributes' dict)."""
+    page_product = dict(product)
+    attributes = page_product.get('attributes')
+    if isinstance(attributes, str):
+        try:
+            attributes = json.loads(attributes)
+        except json.JSONDecodeError:
+            logger.warning(f"Could not decode JSON for field attributes in product {page_product.get('id')}")
+            attributes = None
+    page_product['attributes'] = attributes if isinstance(attributes, dict) else {}
+    return page_product
+
+
+def dump_json_bytes(obj):
+    """Serializes like Flask's jsonify (sorted keys, compact), without the trailing newline."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=True).encode('ascii')
+
+
+class JsonBlob:
+    """A pre-serialized JSON document, with a gzip copy built on first request."""
+
+    __slots__ = ('raw', '_gzipped')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._gzipped = None
+
+    @classmethod
+    def from_object(cls, obj):
+        return cls(dump_json_bytes(obj))
+
+    @property
+    def body(self):
+        """Response body, byte-for-byte what jsonify would produce."""
+        return self.raw + b"\n"
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None: # Benign race: concurrent builders produce identical bytes
+            self._gzipped = gzip.compress(self.body, compresslevel=JSON_BLOB_GZIP_LEVEL, mtime=0)
+        return self._gzipped
+
+
+def json_array_blob(blobs):
+    """Builds a JSON array blob by joining already-serialized elements."""
+    return JsonBlob(b"[" + b",".join(blob.raw for blob in blobs) + b"]")
+
+
+class CatalogEntry:
+    """All precomputed representations of a single product."""
+
+    __slots__ = ('product', 'detail', 'page', '_product_blob', '_detail_blob', '_etag')
+
+    def __init__(self, raw_product):
+        self.product = decode_product_row(raw_product)
+        self.detail = build_product_detail(raw_product)
+        self.page = build_product_page_context(self.product)
+        self._product_blob = None
+        self._detail_blob = None
+        self._etag = None
+
+    # Serialized on first use; an entry is never mutated, so the bytes stay valid
+    # until a catalog load or stock update replaces the entry.
+    @property
+    def product_blob(self):
+        """The list-endpoint shape as a JsonBlob."""
+        if self._product_blob is None:
+            self._product_blob = JsonBlob.from_object(self.product)
+        return self._product_blob
+
+    @property
+    def detail_blob(self):
+        """The /api/products/<id> response as a JsonBlob."""
+        if self._detail_blob is None:
+            self._detail_blob = JsonBlob.from_object(self.detail)
+        return self._detail_blob
+
+    @property
+    def etag(self):
+        """Content hash of the detail response; only changes when this product does."""
+        if self._etag is None:
+            self._etag = hashlib.sha1(self.detail_blob.raw).hexdigest()[:32]
+        return self._etag
+
+    def with_stock(self, stock):
+        """A copy of this entry with a new stock level; nothing else is re-decoded."""
+        entry = CatalogEntry.__new__(CatalogEntry)
+        entry.product = {**self.product, 'stock': stock}
+        entry.detail = {**self.detail, 'stock': stock}
+        entry.page = {**self.page, 'stock': stock}
+        entry._product_blob = entry._detail_blob = entry._etag = None
+        return entry
+
+
+class CatalogSnapshot:
+    """An immutable view of the catalog at one version."""
+
+    def __init__(self, entries, version, content_version=None):
+        self.version = version
+        # Changes with every load but not with stock updates (e.g. for search indexes)
+        self.content_version = content_version or version
+        self.entries = entries                       # id -> CatalogEntry (insertion = table order)
+        self.products = [e.product for e in entries.values()]
+        self.by_category = {}
+        for entry in entries.values():
+            self.by_category.setdefault(entry.product.get('category'), []).append(entry.product)
+        self.field_names = frozenset(self.products[0]) if self.products else frozenset()
+        self._sorted_views = {}
+        self._sorted_views_lock = threading.Lock()
+        self._list_blobs = {}
+
+    def list_blob(self, category=None):
+        """The unfiltered /api/products response (optionally for one category) as a JsonBlob."""
+        blob = self._list_blobs.get(category)
+        if blob is None:
+            products = self.products if category is None else self.by_category.get(category, [])
+            blob = self._list_blobs[category] = json_array_blob(self.entries[p['id']].product_blob for p in products)
+        return blob
+
+    def sorted_view(self, sort_name, key_func, category=None):
+        """
+        Returns (products, keys) for the catalog (or one category) sorted by
+        `key_func`, computed once per snapshot and reused by every page request.
+        """
+        cache_key = (sort_name, category)
+        view = self._sorted_views.get(cache_key)
+        if view is None:
+            with self._sorted_views_lock:
+                view = self._sorted_views.get(cache_key)
+                if view is None:
+                    source = self.products if category is None else self.by_category.get(category, [])
+                    products = sorted(source, key=key_func)
+                    view = (products, [key_func(p) for p in products])
+                    self._sorted_views[cache_key] = view
+        return view
+
+
+class CatalogCache:
+    """Lazily loaded, version-invalidated cache of decoded products."""
+
+    def __init__(self, connection_factory, recheck_interval=DEFAULT_RECHECK_INTERVAL_SECS):
+        """
+        Args:
+            connection_factory: Zero-arg callable returning a context manager that
+                yields a SQLite connection (e.g. `SQLiteConnectionPool.connection`).
+            recheck_interval: Seconds between polls of the persisted catalog version.
+        """
+        self._connection_factory = connection_factory
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._local_version = 0
+        self._loaded_local_version = -1
+        self._db_version = None
+        self._db_stock_version = None
+        self._last_db_check = 0.0
+        self._hits = 0
+        self._reloads = 0
+        self._stock_updates = 0
+
+    # --- Invalidation ---
+    def invalidate(self):
+        """Marks the cache stale; the next read reloads the catalog."""
+        with self._lock:
+            self._local_version += 1
+
+    @property
+    def version(self):
+        """A token that changes whenever the served catalog changes."""
+        snapshot = self.snapshot()
+        return snapshot.version
+
+    def update_stock(self, conn, product_ids):
+        """
+        Re-reads the stock of `product_ids` through `conn` and replaces just those
+        entries in the current snapshot. Call it after a write that only changed stock.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            return
+        placeholders = ', '.join('?' * len(product_ids))
+        # Read under the lock, so concurrent updates are applied in the order they read
+        with self._lock:
+            rows = conn.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})", product_ids).fetchall()
+            self._apply_stock({row[0]: row[1] for row in rows})
+
+    # --- Loading ---
+    def _is_fresh(self, now):
+        if self._snapshot is None or self._loaded_local_version != self._local_version:
+            return False
+        if now - self._last_db_check < self.recheck_interval:
+            return True
+        with self._connection_factory() as conn:
+            db_version = read_catalog_version(conn)
+            if db_version != self._db_version:
+                return False
+            stock_version = read_stock_version(conn)
+            if stock_version != self._db_stock_version:
+                # Stock changed elsewhere: re-read that column only
+                rows = conn.execute("SELECT id, stock FROM products").fetchall()
+                self._db_stock_version = stock_version
+                self._apply_stock({row[0]: row[1] for row in rows})
+        self._last_db_check = now
+        return True
+
+    # Called with the lock held
+    def _apply_stock(self, stock_by_id):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return # Nothing loaded yet; the first load reads current stock
+        changed = {
+            product_id: stock for product_id, stock in stock_by_id.items()
+            if product_id in snapshot.entries and snapshot.entries[product_id].product.get('stock') != stock
+        }
+        if not changed:
+            return
+        entries = dict(snapshot.entries)
+        for product_id, stock in changed.items():
+            entries[product_id] = entries[product_id].with_stock(stock)
+        self._stock_updates += 1
+        self._snapshot = CatalogSnapshot(entries, f"{snapshot.content_version}.{self._stock_updates}",
+                                         content_version=snapshot.content_version)
+        logger.info(f"catalog_cache: updated stock of {len(changed)} products (version {self._snapshot.version}).")
+
+    def _load(self):
+        load_start = time.perf_counter()
+        with self._connection_factory() as conn:
+            db_version = read_catalog_version(conn)
+            db_stock_version = read_stock_version(conn)
+            rows = conn.execute("SELECT * FROM products ORDER BY rowid").fetchall()
+        entries = {}
+        for row in rows:
+            raw_product = dict(row)
+            entries[raw_product['id']] = CatalogEntry(raw_product)
+
+        self._db_version = db_version
+        self._db_stock_version = db_stock_version
+        self._loaded_local_version = self._local_version
+        self._last_db_check = time.monotonic()
+        self._reloads += 1
+        version = f"{db_version}.{self._local_version}.{self._reloads}"
+        self._snapshot = CatalogSnapshot(entries, version)
+        logger.info(f"catalog_cache: loaded {len(entries)} products (version {version}) "
+                    f"in {(time.perf_counter() - load_start) * 1000:.1f} ms.")
+
+    def snapshot(self):
+        """Returns the current CatalogSnapshot, reloading it first if stale."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._is_fresh(now):
+                self._load()
+            else:
+                self._hits += 1
+            return self._snapshot
+
+    # --- Reads ---
+    def get_entry(self, product_id):
+        return self.snapshot().entries.get(product_id)
+
+    def get_product(self, product_id):
+        entry = self.get_entry(product_id)
+        return entry.product if entry else None
+
+    def get_products(self, product_ids):
+        """Bulk lookup against a single snapshot: returns {id: product} for the ids that exist."""
+        entries = self.snapshot().entries
+        found = {}
+        for product_id in product_ids:
+            entry = entries.get(product_id)
+            if entry is not None:
+                found[product_id] = entry.product
+        return found
+
+    def list_products(self, category=None):
+        snapshot = self.snapshot()
+        if category is not None:
+            return snapshot.by_category.get(category, [])
+        return snapshot.products
+
+    def metrics(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "loaded": snapshot is not None,
+                "version": snapshot.version if snapshot else None,
+                "products": len(snapshot.entries) if snapshot else 0,
+                "categories": len(snapshot.by_category) if snapshot else 0,
+                "hits": self._hits,
+                "reloads": self._reloads,
+                "stock_updates": self._stock_updates,
+            }
@@ -633,6 +633,9 @@ document.addEventListener("DOMContentLoaded", () => {
         if (parsedData.payload && parsedData.payload.added_item) {
           messageToParent.added_item_details = parsedData.payload.added_item;
         }
+        if (parsedData.payload && parsedData.payload.cart) {
+          messageToParent.cart = parsedData.payload.cart;
+        }
         window.parent.postMessage(messageToParent, CONFIG.WIDGET_ORIGIN);
         currentAgentMessageElement = null;
         return;
@@ -262,17 +262,7 @@ document.addEventListener("DOMContentLoaded", () => {
     try {
       const data = await fetchAPI(`/api/cart/${DEFAULT_CUSTOMER_ID}`);
       console.log("[Cart] Cart data received:", data);
-      currentCartItemsData = data.items || [];
-      currentCartItemIds = currentCartItemsData.map((item) => item.product_id);
-      renderCartItems(currentCartItemsData); // Will now render to sidebar
-      calculateSubtotal(currentCartItemsData); // Will now update sidebar subtotal
-      updateCartCount(currentCartItemsData); // Will now update sidebar count
-      displayRecommendedProducts();
-      const subtotal = currentCartItemsData.reduce(
-        (sum, item) => sum + (item.price_per_unit || 0) * item.quantity,
-        0
-      );
-      return { items: currentCartItemsData, subtotal: subtotal }; // Return the necessary data
+      return applyCartData(data); // Return the necessary data
     } catch (error) {
       console.error("[Cart] Error fetching cart:", error);
       if (cartSidebarItemsContainer)
@@ -282,6 +272,22 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  // Updates the sidebar from cart data ({items: [...]}) as returned by GET /api/cart
+  // or included in a cart modification response.
+  function applyCartData(data) {
+    currentCartItemsData = data.items || [];
+    currentCartItemIds = currentCartItemsData.map((item) => item.product_id);
+    renderCartItems(currentCartItemsData); // Will now render to sidebar
+    calculateSubtotal(currentCartItemsData); // Will now update sidebar subtotal
+    updateCartCount(currentCartItemsData); // Will now update sidebar count
+    displayRecommendedProducts();
+    const subtotal = currentCartItemsData.reduce(
+      (sum, item) => sum + (item.price_per_unit || 0) * item.quantity,
+      0
+    );
+    return { items: currentCartItemsData, subtotal: subtotal };
+  }
+
   // New animation function
   function animateItemToCart(sourceElementRect, targetElementRect, imageUrl) {
     console.log(
@@ -669,7 +675,11 @@ document.addEventListener("DOMContentLoaded", () => {
         "[Main Page DEBUG] Received REFRESH_CART_DISPLAY from widget. Data:",
         event.data
       );
-      fetchCart(); // This will update the sidebar cart display
+      if (event.data.cart) {
+        applyCartData(event.data.cart); // The agent's cart update already carries the new cart
+      } else {
+        fetchCart(); // This will update the sidebar cart display
+      }
 
       if (
         event.data.added_item_details &&
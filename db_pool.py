@@ -0,0 +1,225 @@
+# cymbal_home_garden_backend/db_pool.py
+"""
+Pooled SQLite connections for the Flask backend.
+
+Connections are opened once, tuned with WAL journal mode and a set of pragmas,
+and then handed out to request handlers and returned on teardown instead of
+being closed. Each connection keeps its own prepared-statement cache
+(`cached_statements`), so the hot catalog/cart queries are only compiled once
+per connection.
+
+Werkzeug's threaded server starts a fresh thread for every request, so a
+thread-local connection would be re-opened on every hit. Connections are
+therefore checked out per request from a bounded pool and may be used by a
+different thread on the next request (`check_same_thread=False`); a connection
+is only ever used by one thread at a time.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Tunables (overridable from the environment)
+DEFAULT_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+DEFAULT_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DEFAULT_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))  # 64 MiB
+DEFAULT_CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", "16384"))     # 16 MiB page cache
+DEFAULT_STATEMENT_CACHE_SIZE = int(os.environ.get("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+DEFAULT_CHECKOUT_TIMEOUT_SECS = float(os.environ.get("SQLITE_POOL_CHECKOUT_TIMEOUT_SECS", "10"))
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class SQLiteConnectionPool:
+    """A bounded pool of long-lived, WAL-mode SQLite connections."""
+
+    def __init__(self, database, pool_size=DEFAULT_POOL_SIZE,
+                 busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS,
+                 mmap_size=DEFAULT_MMAP_SIZE,
+                 cache_size_kib=DEFAULT_CACHE_SIZE_KIB,
+                 statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT_SECS,
+                 initializer=None):
+        """
+        Args:
+            database: Path to the SQLite database file.
+            pool_size: Maximum number of connections kept open.
+            busy_timeout_ms: How long a writer waits on a lock before failing.
+            mmap_size: Bytes of the database file to memory-map for reads.
+            cache_size_kib: Page cache size per connection, in KiB.
+            statement_cache_size: Prepared statements cached per connection.
+            checkout_timeout: Seconds to wait for a free connection.
+            initializer: Optional callable(connection) run once, on the first
+                connection the pool opens (e.g. schema migrations).
+        """
+        self.database = database
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.statement_cache_size = statement_cache_size
+        self.checkout_timeout = checkout_timeout
+        self._initializer = initializer
+        self._initialized = False
+
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connection in use
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._reuses = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._discarded = 0
+
+    # --- Connection lifecycle ---
+    def _open_connection(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode; only an OS
+        # crash/power loss can roll back the last few commits.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        logger.debug(f"db_pool: opened new SQLite connection to {self.database}")
+
+        if self._initializer is not None and not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._initializer(conn)
+                    self._initialized = True
+        return conn
+
+    def acquire(self):
+        """Checks out a connection, opening a new one if the pool is not full."""
+        if self._closed:
+            raise RuntimeError("SQLiteConnectionPool is closed.")
+
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = None
+            reused = False
+
+        if conn is None:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open_connection()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                wait_start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+                except queue.Empty:
+                    raise PoolExhaustedError(
+                        f"No SQLite connection available after {self.checkout_timeout}s "
+                        f"(pool_size={self.pool_size})."
+                    )
+                waited = time.perf_counter() - wait_start
+                reused = True
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time_total += waited
+
+        with self._lock:
+            self._checkouts += 1
+            if reused:
+                self._reuses += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                logger.warning("db_pool: connection returned with an open transaction; rolling back.")
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.error(f"db_pool: discarding broken connection: {e}")
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._discarded += 1
+
+    @contextmanager
+    def connection(self):
+        """Context manager form of acquire()/release()."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Closes all idle connections; checked-out ones are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    # --- Metrics ---
+    def metrics(self):
+        """Returns a snapshot of pool counters."""
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "database": self.database,
+                "pool_size": self.pool_size,
+                "connections_open": self._opened,
+                "connections_idle": self._idle.qsize(),
+                "connections_in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": checkouts,
+                "reused_checkouts": self._reuses,
+                "reuse_ratio": round(self._reuses / checkouts, 4) if checkouts else 0.0,
+                "waits": self._waits,
+                "avg_wait_ms": round(self._wait_time_total / self._waits * 1000, 3) if self._waits else 0.0,
+                "discarded": self._discarded,
+                "statement_cache_size": self.statement_cache_size,
+            }
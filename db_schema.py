@@ -0,0 +1,255 @@
+# cymbal_home_garden_backend/db_schema.py
+"""
+Idempotent schema additions applied on top of the base products/cart_items
+tables created by the data importer. `apply_migrations` is run once per process
+by the connection pool, on the first connection it opens.
+"""
+
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog_version'
+STOCK_VERSION_KEY = 'stock_version'
+
+
+def _table_exists(conn, table_name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table_name,)
+    ).fetchone()
+    return row is not None
+
+
+def _create_catalog_version_tracking(conn):
+    """
+    Keeps two monotonically increasing versions in `catalog_meta`, whichever
+    process or tool changes the products table:
+      * `catalog_version` moves on every insert/delete of a product row and on
+        every update of any column other than `stock`;
+      * `stock_version` moves when a row's stock changes.
+    Stock changes on every order, so caches can then refresh just the stock
+    levels instead of reloading the whole catalog.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    for key in (CATALOG_VERSION_KEY, STOCK_VERSION_KEY):
+        conn.execute("INSERT INTO catalog_meta (key, value) VALUES (?, 0) ON CONFLICT(key) DO NOTHING", (key,))
+    bump = "UPDATE catalog_meta SET value = value + 1 WHERE key = '{key}';"
+    for event in ('INSERT', 'DELETE'):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS products_bump_version_after_{event.lower()}
+            AFTER {event} ON products
+            BEGIN {bump.format(key=CATALOG_VERSION_KEY)} END
+        """)
+    # Recreated on every run: it lists the table's current non-stock columns, and
+    # older databases have a version of it that fired on stock updates too.
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(products)").fetchall() if row[1] != 'stock']
+    conn.execute("DROP TRIGGER IF EXISTS products_bump_version_after_update")
+    conn.execute(f"""
+        CREATE TRIGGER products_bump_version_after_update
+        AFTER UPDATE OF {', '.join(columns)} ON products
+        BEGIN {bump.format(key=CATALOG_VERSION_KEY)} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_bump_stock_version_after_update
+        AFTER UPDATE OF stock ON products
+        WHEN old.stock IS NOT new.stock
+        BEGIN {bump.format(key=STOCK_VERSION_KEY)} END
+    """)
+
+
+# Columns indexed by the products_fts full-text index, in bm25 weight order
+FTS_COLUMNS = ['name', 'description', 'botanical_name', 'plant_type', 'landscape_use']
+
+
+def _create_products_fts(conn):
+    """
+    External-content FTS5 index over the searchable product columns, kept in sync
+    with `products` by triggers. The index is rebuilt when first created so that
+    existing rows (e.g. from the importer) are searchable straight away.
+    """
+    existed = _table_exists(conn, 'products_fts')
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f"new.{c}" for c in FTS_COLUMNS)
+    old_values = ', '.join(f"old.{c}" for c in FTS_COLUMNS)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            {columns},
+            content='products',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_after_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_after_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts(products_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+        END
+    """)
+    # Only text changes touch the index; stock/price updates do not.
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_after_update AFTER UPDATE OF {columns} ON products
+        BEGIN
+            INSERT INTO products_fts(products_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+            INSERT INTO products_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    """)
+    if not existed:
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        logger.info("db_schema: built products_fts full-text index.")
+
+
+def _create_cart_version_tracking(conn):
+    """
+    Per-customer cart version in `cart_versions`, bumped by triggers on every
+    change to that customer's cart_items rows. Used as the cart ETag validator,
+    so a conditional GET only needs a primary-key lookup instead of the cart join.
+    """
+    if not _table_exists(conn, 'cart_items'):
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cart_versions (
+            customer_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    bump = """
+        INSERT INTO cart_versions (customer_id, version) VALUES ({row}.customer_id, 1)
+        ON CONFLICT(customer_id) DO UPDATE SET version = version + 1;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cart_items_bump_version_after_insert AFTER INSERT ON cart_items
+        BEGIN {bump.format(row='new')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cart_items_bump_version_after_update AFTER UPDATE ON cart_items
+        BEGIN {bump.format(row='new')} {bump.format(row='old')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cart_items_bump_version_after_delete AFTER DELETE ON cart_items
+        BEGIN {bump.format(row='old')} END
+    """)
+
+
+def _create_cart_items_unique_index(conn):
+    """
+    One cart line per (customer_id, product_id), so carts can be modified with
+    UPSERTs and concurrent adds cannot create duplicate lines. Existing
+    duplicates are merged first into the oldest line, with quantities summed.
+    """
+    if not _table_exists(conn, 'cart_items'):
+        return
+    conn.execute("""
+        UPDATE cart_items
+        SET quantity = (
+            SELECT SUM(dup.quantity) FROM cart_items dup
+            WHERE dup.customer_id = cart_items.customer_id AND dup.product_id = cart_items.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_items GROUP BY customer_id, product_id HAVING COUNT(*) > 1
+        )
+    """)
+    merged = conn.execute("""
+        DELETE FROM cart_items
+        WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY customer_id, product_id)
+    """).rowcount
+    if merged:
+        logger.info(f"db_schema: merged {merged} duplicate cart_items rows.")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_items_customer_product ON cart_items (customer_id, product_id)"
+    )
+
+
+def _create_orders(conn):
+    """
+    Orders placed through /api/checkout/place_order. `idempotency_key` is unique
+    so a retried checkout returns the original order instead of creating (and
+    reserving stock for) a second one.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id TEXT NOT NULL UNIQUE,
+            customer_id TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            request_hash TEXT,
+            status TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            client_total_amount REAL,
+            shipping_details TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL REFERENCES orders(id),
+            product_id TEXT NOT NULL,
+            name TEXT,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+
+
+MIGRATIONS = [
+    _create_catalog_version_tracking,
+    _create_products_fts,
+    _create_cart_version_tracking,
+    _create_cart_items_unique_index,
+    _create_orders,
+]
+
+
+def apply_migrations(conn):
+    """Applies all schema additions. Safe to call repeatedly."""
+    if not _table_exists(conn, 'products'):
+        logger.warning("db_schema: 'products' table not found; run sample_data_importer.py first. Skipping migrations.")
+        return
+    for migration in MIGRATIONS:
+        try:
+            migration(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"db_schema: migration {migration.__name__} failed: {e}")
+    logger.info("db_schema: migrations applied.")
+
+
+def _read_catalog_meta(conn, key):
+    try:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def read_catalog_version(conn):
+    """Returns the persisted catalog version, or None if tracking is not set up."""
+    return _read_catalog_meta(conn, CATALOG_VERSION_KEY)
+
+
+def read_stock_version(conn):
+    """Returns the persisted stock version, or None if tracking is not set up."""
+    return _read_catalog_meta(conn, STOCK_VERSION_KEY)
+
+
+def read_cart_version(conn, customer_id):
+    """Returns the customer's cart version (0 if their cart was never changed), or None if tracking is not set up."""
+    try:
+        row = conn.execute("SELECT version FROM cart_versions WHERE customer_id = ?", (customer_id,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else 0
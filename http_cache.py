@@ -0,0 +1,79 @@
+# cymbal_home_garden_backend/http_cache.py
+"""
+ETag / conditional GET helpers.
+
+Handlers compute a cheap validator (a catalog or cart version, or a precomputed
+content hash) *before* doing any real work. If the client's `If-None-Match`
+already holds that ETag, a bodyless 304 is returned and the query, decoding and
+JSON serialization are all skipped.
+"""
+
+import os
+import hashlib
+
+from flask import current_app, request, make_response
+
+# Catalog data changes rarely, but stock does move with orders, so by default
+# browsers must revalidate (a cheap 304) before reusing a cached copy.
+PRODUCT_CACHE_MAX_AGE_SECS = int(os.environ.get("PRODUCT_CACHE_MAX_AGE_SECS", "0"))
+PRODUCT_CACHE_CONTROL = (
+    f"public, max-age={PRODUCT_CACHE_MAX_AGE_SECS}" if PRODUCT_CACHE_MAX_AGE_SECS > 0 else "public, no-cache"
+)
+# Carts are per customer: never stored by shared caches, always revalidated.
+CART_CACHE_CONTROL = "private, no-cache"
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = int(os.environ.get("JSON_GZIP_MIN_BYTES", "1024"))
+
+
+def make_etag(*parts):
+    """Builds a short, strong ETag value from the given version parts."""
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return digest[:32]
+
+
+def conditional_response(etag, cache_control, build_response):
+    """
+    Returns 304 if the request's If-None-Match matches `etag`, otherwise calls
+    `build_response()` (anything a Flask view may return). Successful responses
+    carry the ETag and Cache-Control headers; error responses are left untouched.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build_response())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def _client_accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+
+def blob_response(blob, etag=None, cache_control=None):
+    """
+    Serves a pre-serialized JsonBlob (see catalog_cache.py) without running
+    jsonify, using its pre-gzipped body when the client accepts gzip. The gzip
+    variant gets its own ETag ("<etag>-gz"), as required for strong validators.
+    """
+    use_gzip = len(blob.raw) >= GZIP_MIN_BYTES and _client_accepts_gzip()
+    if etag is not None and use_gzip:
+        etag = f"{etag}-gz"
+
+    if etag is not None and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif use_gzip:
+        response = current_app.response_class(blob.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(blob.body, mimetype='application/json')
+
+    if len(blob.raw) >= GZIP_MIN_BYTES:
+        response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(etag)
+    if cache_control is not None:
+        response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,173 @@
+# cymbal_home_garden_backend/orders.py
+"""
+Checkout: turns a cart into an order in one SQLite write transaction.
+
+Within a single BEGIN IMMEDIATE transaction, `place_order` will:
+  1. return the existing order if the idempotency key was already used,
+  2. reserve stock for every line with a guarded decrement
+     (`UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?`),
+  3. record the order and its lines at the current catalog prices,
+  4. clear the customer's cart.
+If any line cannot be reserved, everything is rolled back, so stock can never
+go negative however many checkouts run at once.
+"""
+
+import json
+import uuid
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESERVE_STOCK_SQL = "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?"
+
+
+class OrderError(Exception):
+    """Base class for checkout failures that map to a client error."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class InvalidOrderError(OrderError):
+    """The order payload has no valid lines."""
+
+
+class InsufficientStockError(OrderError):
+    """One or more lines could not be reserved; `details` lists them."""
+
+
+class IdempotencyKeyReusedError(OrderError):
+    """The idempotency key was already used for a different order payload."""
+
+
+def normalize_order_lines(items):
+    """
+    Returns [(product_id, quantity), ...] from cart-style item dicts, summing
+    repeated products, in first-seen order. Raises InvalidOrderError if no line
+    is valid.
+    """
+    quantities = {}
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        product_id = item.get('product_id')
+        quantity = item.get('quantity')
+        if not product_id or not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            logger.warning(f"Skipping invalid order line: {item}")
+            continue
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        raise InvalidOrderError("Order must contain at least one item with a product_id and a positive integer quantity.")
+    return list(quantities.items())
+
+
+def order_request_hash(customer_id, lines, shipping_details):
+    """Fingerprint of an order request, used to detect reuse of an idempotency key."""
+    canonical = json.dumps([customer_id, sorted(lines), shipping_details], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _order_response(row, replayed):
+    return {
+        "status": "success",
+        "message": "Order placed successfully. Thank you for your purchase!",
+        "order_id": row['order_id'],
+        "total_amount": row['total_amount'],
+        "replayed": replayed,
+    }
+
+
+def _find_unavailable_lines(conn, lines):
+    placeholders = ', '.join('?' * len(lines))
+    stock = dict(conn.execute(
+        f"SELECT id, stock FROM products WHERE id IN ({placeholders})", [pid for pid, _ in lines]
+    ).fetchall())
+    return [
+        {"product_id": pid, "requested": quantity, "available": max(stock.get(pid) or 0, 0)}
+        for pid, quantity in lines
+        if pid not in stock or (stock[pid] or 0) < quantity
+    ]
+
+
+def place_order(conn, customer_id, items, shipping_details, client_total_amount=None, idempotency_key=None):
+    """
+    Places an order atomically.
+
+    Args:
+        conn: SQLite connection (sqlite3.Row row factory).
+        customer_id: The customer placing the order.
+        items: Cart-style lines: [{'product_id': ..., 'quantity': ...}, ...].
+        shipping_details: Dict stored with the order as JSON.
+        client_total_amount: Total the client displayed; stored for reference,
+            the authoritative total is computed from catalog prices.
+        idempotency_key: Optional client-supplied key; repeating a request with
+            the same key returns the original order.
+
+    Returns:
+        (response_dict, created) where `created` is False for a replayed request.
+
+    Raises:
+        InvalidOrderError, InsufficientStockError, IdempotencyKeyReusedError,
+        sqlite3.Error.
+    """
+    lines = normalize_order_lines(items)
+    request_hash = order_request_hash(customer_id, lines, shipping_details)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if idempotency_key:
+            existing = conn.execute(
+                "SELECT order_id, total_amount, request_hash FROM orders WHERE idempotency_key = ?",
+                (idempotency_key,),
+            ).fetchone()
+            if existing is not None:
+                conn.rollback()
+                if existing['request_hash'] != request_hash:
+                    raise IdempotencyKeyReusedError("Idempotency key was already used for a different order.")
+                logger.info(f"Replaying order {existing['order_id']} for idempotency key {idempotency_key}.")
+                return _order_response(existing, replayed=True), False
+
+        reserved = conn.executemany(RESERVE_STOCK_SQL, [(qty, pid, qty) for pid, qty in lines]).rowcount
+        if reserved != len(lines):
+            conn.rollback()
+            unavailable = _find_unavailable_lines(conn, lines)
+            raise InsufficientStockError("Some items are out of stock or not available in the requested quantity.",
+                                         details=unavailable)
+
+        placeholders = ', '.join('?' * len(lines))
+        catalog = {row['id']: row for row in conn.execute(
+            f"SELECT id, name, price FROM products WHERE id IN ({placeholders})", [pid for pid, _ in lines]
+        ).fetchall()}
+        order_lines = [
+            (pid, catalog[pid]['name'], qty, catalog[pid]['price'] or 0.0) for pid, qty in lines
+        ]
+        total_amount = round(sum(qty * price for _, _, qty, price in order_lines), 2)
+        if not isinstance(client_total_amount, (int, float)):
+            client_total_amount = None
+        elif abs(client_total_amount - total_amount) > 0.01:
+            logger.warning(f"Order total mismatch for customer {customer_id}: client {client_total_amount}, catalog {total_amount}.")
+
+        order_id = f"ORD_{uuid.uuid4().hex[:16].upper()}"
+        cursor = conn.execute(
+            "INSERT INTO orders (order_id, customer_id, idempotency_key, request_hash, status, total_amount, "
+            "client_total_amount, shipping_details) VALUES (?, ?, ?, ?, 'placed', ?, ?, ?)",
+            (order_id, customer_id, idempotency_key or None, request_hash, total_amount,
+             client_total_amount, json.dumps(shipping_details)),
+        )
+        order_row_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, name, quantity, unit_price) VALUES (?, ?, ?, ?, ?)",
+            [(order_row_id, *line) for line in order_lines],
+        )
+        conn.execute("DELETE FROM cart_items WHERE customer_id = ?", (customer_id,))
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+    logger.info(f"Order {order_id} placed for customer {customer_id}: {len(order_lines)} lines, total {total_amount:.2f}.")
+    return _order_response({"order_id": order_id, "total_amount": total_amount}, replayed=False), True
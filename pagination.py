@@ -0,0 +1,133 @@
+# cymbal_home_garden_backend/pagination.py
+"""
+Keyset (cursor) pagination and field projection for catalog list endpoints.
+
+Pages are cut from lists that are already sorted by a unique key tuple
+`(sort_value, id)`. A cursor is the key of the last item on a page, encoded as
+opaque URL-safe base64; the next page starts at the first item whose key is
+greater than the cursor, found by binary search. Unlike OFFSET paging this does
+not skip or repeat items when products are added or removed between requests.
+"""
+
+import json
+import math
+import base64
+import binascii
+from bisect import bisect_right
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+def _price_key(product):
+    price = product.get('price')
+    return (price if isinstance(price, (int, float)) else float('inf'), product.get('id') or '')
+
+
+def _name_key(product):
+    return ((product.get('name') or '').lower(), product.get('id') or '')
+
+
+def _id_key(product):
+    return (product.get('id') or '', product.get('id') or '')
+
+
+# Supported `sort` values -> key function producing a unique, comparable tuple
+SORT_KEYS = {
+    'id': _id_key,
+    'name': _name_key,
+    'price': _price_key,
+}
+
+
+class PaginationError(ValueError):
+    """Raised for an invalid limit, sort, cursor or field list."""
+
+
+def _valid_sort_value(sort, value):
+    """Whether a cursor's sort value has the type of the SORT_KEYS[sort] keys (None: price missing)."""
+    if sort == 'price':
+        if value is None:
+            return True
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    return isinstance(value, str)
+
+
+def encode_cursor(sort, key):
+    raw = json.dumps([sort, list(key)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Returns the key tuple stored in `cursor`; the cursor must belong to the same sort."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        key = tuple(key)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError("Invalid 'after' cursor.")
+    if cursor_sort != sort or len(key) != 2:
+        raise PaginationError(f"'after' cursor does not belong to sort '{sort}'.")
+    if not _valid_sort_value(sort, key[0]) or not isinstance(key[1], str):
+        raise PaginationError("Invalid 'after' cursor.") # Would not compare with the page keys
+    if key[0] is None and sort == 'price': # inf does not survive JSON
+        key = (float('inf'), key[1])
+    return key
+
+
+def parse_limit(value, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError("'limit' must be an integer.")
+    if limit < 1:
+        raise PaginationError("'limit' must be at least 1.")
+    return min(limit, maximum)
+
+
+def parse_fields(value, allowed_fields):
+    """Parses a comma-separated `fields` list; returns None when no projection is requested."""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed_fields]
+    if unknown:
+        raise PaginationError(f"Unknown field(s) in 'fields': {', '.join(unknown)}.")
+    return list(dict.fromkeys(fields)) # Deduplicate, keep order
+
+
+def project(products, fields):
+    """Returns `products` reduced to `fields` (or unchanged when fields is None)."""
+    if fields is None:
+        return products
+    return [{f: p.get(f) for f in fields} for p in products]
+
+
+def keyset_page(sorted_products, keys, sort, limit, after=None):
+    """
+    Cuts one page out of a presorted list.
+
+    Args:
+        sorted_products: Products sorted by SORT_KEYS[sort].
+        keys: The matching list of key tuples (same order, same length).
+        sort: The sort name the cursor is bound to.
+        limit: Page size.
+        after: Optional cursor string from a previous page's `next_cursor`.
+
+    Returns:
+        (page_items, next_cursor), next_cursor being None on the last page.
+    """
+    start = 0
+    if after:
+        start = bisect_right(keys, decode_cursor(after, sort))
+    end = start + limit
+    page = sorted_products[start:end]
+    next_cursor = None
+    if end < len(sorted_products) and page:
+        last_key = keys[end - 1]
+        if last_key[0] == float('inf'):
+            last_key = (None, last_key[1])
+        next_cursor = encode_cursor(sort, last_key)
+    return page, next_cursor
@@ -0,0 +1,544 @@
+# cymbal_home_garden_backend/product_search.py
+"""
+Product search helpers.
+
+Full-text search runs against the `products_fts` FTS5 index (see db_schema.py)
+instead of leading-wildcard `LIKE` scans, with bm25 ranking, prefix matching
+and highlighted snippets.
+
+`/api/retail/search-products` (the agent's `search_products` tool) goes through
+a pluggable SearchBackend selected by PRODUCT_SEARCH_BACKEND:
+  * "retail" - Google Cloud Retail (Vertex AI Search for commerce)
+  * "local"  - an in-process BM25 inverted index built from the products table
+  * "auto"   - (default) retail when GCP_PROJECT_ID is configured, else local
+Retail results are served through a TTL + LRU CachedSearchBackend.
+"""
+
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+import logging
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+
+from google.cloud import retail_v2
+from google.api_core.exceptions import GoogleAPICallError
+from google.auth import default as default_auth_credentials # Added for ADC logging
+
+logger = logging.getLogger(__name__)
+
+# bm25 column weights, in db_schema.FTS_COLUMNS order:
+# name, description, botanical_name, plant_type, landscape_use
+FTS_BM25_WEIGHTS = (10.0, 1.0, 5.0, 3.0, 2.0)
+SNIPPET_OPEN = '<mark>'
+SNIPPET_CLOSE = '</mark>'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_MAX_TOKENS = 12
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_fts_query(text, prefix=True, match_all=True):
+    """
+    Turns free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so user input can never inject FTS syntax) and, when
+    `prefix` is set, turned into a prefix query ("lav" matches "lavender").
+    Returns None if the text contains no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return None
+    terms = [f'"{token}"*' if prefix else f'"{token}"' for token in tokens]
+    return (' AND ' if match_all else ' OR ').join(terms)
+
+
+def search_products_fts(conn, text, limit=50, category=None, name=None, plant_type=None,
+                        prefix=True, match_all=True):
+    """
+    Ranked full-text product search.
+
+    Returns a list of (product_id, score, snippet) tuples, best match first. Lower
+    bm25 scores are better matches, as reported by SQLite.
+    """
+    match_expression = build_fts_query(text, prefix=prefix, match_all=match_all)
+    if match_expression is None:
+        return []
+
+    weights = ', '.join(str(w) for w in FTS_BM25_WEIGHTS)
+    query = f"""
+        SELECT p.id AS id,
+               bm25(products_fts, {weights}) AS score,
+               snippet(products_fts, -1, ?, ?, ?, ?) AS snippet
+        FROM products_fts
+        JOIN products p ON p.rowid = products_fts.rowid
+        WHERE products_fts MATCH ?
+    """
+    params = [SNIPPET_OPEN, SNIPPET_CLOSE, SNIPPET_ELLIPSIS, SNIPPET_MAX_TOKENS, match_expression]
+    if category:
+        query += " AND p.category = ?"
+        params.append(category)
+    if name:
+        query += " AND p.name LIKE ?"
+        params.append(f"%{name}%")
+    if plant_type:
+        query += " AND p.plant_type LIKE ?"
+        params.append(f"%{plant_type}%")
+    query += " ORDER BY score LIMIT ?"
+    params.append(limit)
+
+    rows = conn.execute(query, params).fetchall()
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+# --- Pluggable search backends for /api/retail/search-products ---
+
+class SearchBackendError(Exception):
+    """A search backend failed while answering a query."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class SearchBackendNotConfigured(SearchBackendError):
+    """The backend cannot serve requests with the current configuration."""
+
+
+class SearchBackend:
+    """Interface shared by all product search backends."""
+
+    name = "base"
+
+    def is_configured(self):
+        return True
+
+    def search(self, query, visitor_id, page_size=10):
+        """
+        Returns a list of recommendation dicts:
+        [{'product_id': ..., 'name': ..., 'description': ...}, ...]
+        """
+        raise NotImplementedError
+
+    def metrics(self):
+        return {"backend": self.name}
+
+
+# Words too common in shopper queries to carry any ranking signal
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have i in is it me my of on or our
+    some that the this to with you your want need looking find show get any
+""".split())
+
+
+def _fold(text):
+    """Lowercases and strips accents ("Échinacée" -> "echinacee")."""
+    normalized = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Splits text into normalized search terms: folded, stopwords removed, light plural stemming."""
+    if not text:
+        return []
+    terms = []
+    for token in _TOKEN_RE.findall(_fold(str(text))):
+        if token in STOPWORDS or token.isdigit() and len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith('ies'):
+            token = token[:-3] + 'y'                  # berries -> berry
+        elif len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]                        # pots -> pot
+        terms.append(token)
+    return terms
+
+
+class LocalSearchIndex:
+    """
+    In-memory inverted index with per-field BM25 scoring (BM25F-style: each
+    field has its own length normalization and a boost, scores are summed).
+    """
+
+    # Field -> boost. Name and botanical name dominate so that "lavender" ranks
+    # the lavender plant above products that merely mention lavender.
+    FIELD_BOOSTS = {
+        'name': 3.0,
+        'botanical_name': 2.5,
+        'plant_type': 1.5,
+        'category': 1.5,
+        'landscape_use': 1.0,
+        'description': 1.0,
+    }
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, products):
+        """
+        Args:
+            products: Iterable of decoded product dicts (the /api/products shape).
+        """
+        self.doc_ids = []
+        self.descriptions = []
+        self.names = []
+        self._postings = defaultdict(list)   # term -> [(doc_index, field, term_frequency)]
+        self._field_lengths = {field: [] for field in self.FIELD_BOOSTS}
+        self._doc_frequency = Counter()
+
+        for doc_index, product in enumerate(products):
+            self.doc_ids.append(product.get('id'))
+            self.names.append(product.get('name') or "Unknown Product")
+            self.descriptions.append(product.get('description'))
+            doc_terms = set()
+            for field in self.FIELD_BOOSTS:
+                value = product.get(field)
+                if isinstance(value, list):
+                    value = ' '.join(str(v) for v in value)
+                terms = tokenize(value)
+                self._field_lengths[field].append(len(terms))
+                for term, frequency in Counter(terms).items():
+                    self._postings[term].append((doc_index, field, frequency))
+                doc_terms.update(terms)
+            self._doc_frequency.update(doc_terms)
+
+        self.doc_count = len(self.doc_ids)
+        self._avg_field_length = {
+            field: (sum(lengths) / len(lengths) if lengths and sum(lengths) else 1.0)
+            for field, lengths in self._field_lengths.items()
+        }
+        self._sorted_terms = sorted(self._postings)
+
+    def _idf(self, term):
+        df = self._doc_frequency.get(term, 0)
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def _expand_prefix(self, term):
+        """Terms in the vocabulary starting with `term` (for the last, possibly partial, word)."""
+        start = bisect_left(self._sorted_terms, term)
+        expanded = []
+        for candidate in self._sorted_terms[start:]:
+            if not candidate.startswith(term):
+                break
+            expanded.append(candidate)
+        return expanded
+
+    def search(self, query, limit=10):
+        """Returns [(doc_index, score)] best first."""
+        query_terms = tokenize(query)
+        if not query_terms or not self.doc_count:
+            return []
+
+        # Exact terms, plus prefix expansion of the final word ("lav" -> "lavender")
+        weighted_terms = {term: 1.0 for term in query_terms}
+        last_term = query_terms[-1]
+        if len(last_term) >= 3:
+            for expansion in self._expand_prefix(last_term):
+                weighted_terms.setdefault(expansion, 0.7)
+
+        scores = defaultdict(float)
+        for term, term_weight in weighted_terms.items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_index, field, frequency in postings:
+                length_ratio = self._field_lengths[field][doc_index] / self._avg_field_length[field]
+                normalized_tf = frequency * (self.K1 + 1) / (
+                    frequency + self.K1 * (1 - self.B + self.B * length_ratio)
+                )
+                scores[doc_index] += term_weight * self.FIELD_BOOSTS[field] * idf * normalized_tf
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+class LocalSearchBackend(SearchBackend):
+    """Answers searches from a LocalSearchIndex rebuilt whenever the catalog changes."""
+
+    name = "local"
+
+    def __init__(self, catalog_cache):
+        self._catalog_cache = catalog_cache
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_version = None
+
+    def _current_index(self):
+        snapshot = self._catalog_cache.snapshot()
+        with self._lock:
+            # Stock updates do not change the indexed text, so they keep the index
+            if self._index is None or self._index_version != snapshot.content_version:
+                self._index = LocalSearchIndex(snapshot.products)
+                self._index_version = snapshot.content_version
+                logger.info(f"Local search index built over {self._index.doc_count} products "
+                            f"(catalog version {snapshot.content_version}).")
+            return self._index
+
+    def search(self, query, visitor_id, page_size=10):
+        index = self._current_index()
+        recommendations = []
+        for doc_index, _score in index.search(query, limit=page_size):
+            recommendations.append({
+                "product_id": index.doc_ids[doc_index],
+                "name": index.names[doc_index],
+                "description": index.descriptions[doc_index] or "No description available.",
+            })
+        logger.info(f"Local search for '{query}' returned {len(recommendations)} results.")
+        return recommendations
+
+
+# Values of GCP_PROJECT_ID shipped in templates/defaults, meaning "not configured"
+PLACEHOLDER_PROJECT_IDS = ("your-gcp-project-id", "your-project-id", "your-project-id-here")
+
+
+class RetailSearchBackend(SearchBackend):
+    """Google Cloud Retail API (Vertex AI Search for commerce)."""
+
+    name = "retail"
+
+    def __init__(self, project_id, location, catalog_id, serving_config_id, product_lookup=None):
+        """
+        Args:
+            project_id, location, catalog_id, serving_config_id: Retail placement.
+            product_lookup: Optional callable(product_ids) -> {id: product dict},
+                used to enrich a whole result page with names from the live
+                catalog in one pass (e.g. `CatalogCache.get_products`).
+        """
+        self.project_id = project_id
+        self.location = location
+        self.catalog_id = catalog_id
+        self.serving_config_id = serving_config_id
+        self._product_lookup = product_lookup
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def is_configured(self):
+        # Simplified check: if project ID is still the placeholder, assume not configured.
+        # This allows using "default_catalog" and "default_search" if they are actual live IDs.
+        return bool(self.project_id) and self.project_id not in PLACEHOLDER_PROJECT_IDS
+
+    def _get_client(self):
+        """
+        Returns the long-lived SearchServiceClient, creating it on first use. One
+        client (one gRPC channel, one auth handshake) is shared by all requests;
+        the client is thread-safe.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        credentials, project_id_adc = default_auth_credentials() # project_id_adc to avoid conflict with GCP_PROJECT_ID
+                        logger.info(f"ADC using credentials: {credentials}")
+                        if hasattr(credentials, 'service_account_email'):
+                            logger.info(f"ADC Service Account Email: {credentials.service_account_email}")
+                        else:
+                            logger.info(f"ADC is likely using user credentials (gcloud auth application-default login). Active project for ADC: {project_id_adc}")
+                    except Exception as e:
+                        logger.error(f"Error getting ADC: {e}")
+
+                    #client_options = ClientOptions(api_endpoint=f"{RETAIL_API_LOCATION}-retail.googleapis.com")
+                    self._client = retail_v2.SearchServiceClient()
+                    logger.info("Retail SearchServiceClient created.")
+        return self._client
+
+    def warm_up(self):
+        """Creates the client ahead of the first search (no-op when not configured)."""
+        if not self.is_configured():
+            return
+        try:
+            self._get_client()
+        except Exception as e: # Retried lazily on the first search
+            logger.error(f"Could not create Retail SearchServiceClient at startup: {e}")
+
+    def search(self, query, visitor_id, page_size=10):
+        # Construct the placement string for the Retail API
+        placement = (
+            f"projects/{self.project_id}/locations/{self.location}/"
+            f"catalogs/{self.catalog_id}/servingConfigs/{self.serving_config_id}"
+        )
+
+        search_request = retail_v2.SearchRequest(
+            placement=placement,
+            query=query,
+            visitor_id=visitor_id,
+            page_size=page_size
+        )
+
+        recommendations = []
+        try:
+            search_client = self._get_client()
+            logger.info(f"Sending search request to Retail API: {search_request}")
+            search_response = search_client.search(request=search_request)
+            logger.debug(f"Received search response from Retail API: {search_response}")
+            logger.info(f"Received search response from Retail API. Results count: {len(search_response.results)}")
+
+            results = list(search_response.results)
+            # One bulk lookup for the whole page (result.id is the catalog SKU;
+            # product.id is the fully qualified name).
+            known_products = self._product_lookup([r.id for r in results]) if self._product_lookup else {}
+
+            for result in results:
+                product = result.product
+                product_id_from_api = result.id # Use the ID directly from the result
+                catalog_product = known_products.get(product_id_from_api)
+
+                description = product.description if hasattr(product, 'description') and product.description else None
+                if not description and catalog_product:
+                    description = catalog_product.get('description')
+
+                recommendations.append({
+                    "product_id": product_id_from_api,
+                    "name": catalog_product.get('name') if catalog_product else "Unknown Product",
+                    "description": description or "No description available.",
+                })
+
+        except GoogleAPICallError as e:
+            logger.error(f"Retail API call failed: {e}")
+            raise SearchBackendError("Failed to query Retail API.", details=str(e))
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during Retail API search: {e}")
+            raise SearchBackendError("An unexpected error occurred during search.")
+
+        return recommendations
+
+
+DEFAULT_SEARCH_CACHE_TTL_SECS = float(os.environ.get("SEARCH_CACHE_TTL_SECS", "300"))
+DEFAULT_SEARCH_CACHE_STALE_SECS = float(os.environ.get("SEARCH_CACHE_STALE_SECS", "3600"))
+DEFAULT_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "512"))
+
+
+def normalize_query(query):
+    """Cache key form of a query: case-folded, accent-insensitive, single-spaced."""
+    return " ".join(_fold(query).split())
+
+
+class CachedSearchBackend(SearchBackend):
+    """
+    TTL + LRU result cache in front of another backend, keyed on the normalized
+    query and page size.
+
+    Within `ttl` seconds a cached result is served as is. For a further
+    `stale_ttl` seconds it is still served immediately, while a background
+    thread refreshes it (stale-while-revalidate), so popular queries never wait
+    on the wrapped backend. Older entries are fetched synchronously. Failures
+    are never cached; a failed refresh keeps the stale entry.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_SEARCH_CACHE_TTL_SECS,
+                 stale_ttl=DEFAULT_SEARCH_CACHE_STALE_SECS,
+                 max_entries=DEFAULT_SEARCH_CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.name = backend.name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (fetched_at, results), least recently used first
+        self._refreshing = set()
+        self._counters = Counter()
+
+    def is_configured(self):
+        return self.backend.is_configured()
+
+    def warm_up(self):
+        if hasattr(self.backend, 'warm_up'):
+            self.backend.warm_up()
+
+    def _store(self, key, results):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _refresh(self, key, query, visitor_id, page_size):
+        try:
+            self._store(key, self.backend.search(query, visitor_id, page_size=page_size))
+            with self._lock:
+                self._counters['refreshes'] += 1
+        except Exception as e:
+            with self._lock:
+                self._counters['refresh_errors'] += 1
+            logger.warning(f"Background refresh of search '{query}' failed; keeping stale results: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def search(self, query, visitor_id, page_size=10):
+        key = (normalize_query(query), page_size)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                age = now - cached[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return cached[1]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._counters['stale_hits'] += 1
+                    start_refresh = key not in self._refreshing
+                    if start_refresh:
+                        self._refreshing.add(key)
+                else:
+                    cached = None
+            if cached is None:
+                self._counters['misses'] += 1
+
+        if cached is not None:
+            if start_refresh:
+                threading.Thread(
+                    target=self._refresh, args=(key, query, visitor_id, page_size),
+                    name="search-cache-refresh", daemon=True,
+                ).start()
+            return cached[1]
+
+        results = self.backend.search(query, visitor_id, page_size=page_size)
+        self._store(key, results)
+        return results
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['stale_hits'] + self._counters['misses']
+            return {
+                **self.backend.metrics(),
+                "cache_entries": len(self._entries),
+                "cache_max_entries": self.max_entries,
+                "ttl_secs": self.ttl,
+                "stale_ttl_secs": self.stale_ttl,
+                "hits": self._counters['hits'],
+                "stale_hits": self._counters['stale_hits'],
+                "misses": self._counters['misses'],
+                "hit_ratio": round((lookups - self._counters['misses']) / lookups, 4) if lookups else 0.0,
+                "refreshes": self._counters['refreshes'],
+                "refresh_errors": self._counters['refresh_errors'],
+                "refreshes_in_flight": len(self._refreshing),
+                "evictions": self._counters['evictions'],
+            }
+
+
+def create_search_backend(catalog_cache, retail_backend, backend_name=None):
+    """
+    Picks the backend named by `backend_name` or the PRODUCT_SEARCH_BACKEND
+    environment variable ("auto", "retail" or "local"). The Retail backend is
+    wrapped in a CachedSearchBackend and its client is created up front.
+    """
+    backend_name = (backend_name or os.environ.get("PRODUCT_SEARCH_BACKEND", "auto")).lower()
+    if backend_name == "retail":
+        backend = retail_backend
+    elif backend_name == "local":
+        backend = LocalSearchBackend(catalog_cache)
+    else:
+        if backend_name != "auto":
+            logger.warning(f"Unknown PRODUCT_SEARCH_BACKEND '{backend_name}'. Falling back to 'auto'.")
+        backend = retail_backend if retail_backend.is_configured() else LocalSearchBackend(catalog_cache)
+    if backend is retail_backend:
+        backend = CachedSearchBackend(retail_backend)
+        backend.warm_up()
+    logger.info(f"Product search backend: {backend.name}")
+    return backend